@@ -3,62 +3,79 @@
 # R script : Apply filters
 # Auteur  : Léa ROGUE
 # Date    : 31-03-2025
-# Description : This script apply filters on raw objects and the user choose the filters.
+# Description : This script apply filters on raw objects and the user choose the filters (in dialog boxes or given as arguments by the
+# batch mode, see batch.py).
 # ----------------------------------------------------------------------------------------------------------------------------------------
 
 # Load packages
 import scanpy as sc
-import anndata as ad
-from matplotlib import pyplot as plt
+from qc_plots import plot_qc
 from datetime import datetime
 import os
-import tkinter as tk
-from tkinter import simpledialog, messagebox
+from log_files import append_log
+from storage import EXTENSIONS, extension, read_object, strip_extension, write_object
+from virtual_objects import EXTENSION, write_mask
+from instrumentation import instrumented, record
 
-def apply_filters(file, output_dir):
+@instrumented('filter')
+def apply_filters(file, output_dir, min_genes = None, min_cells = None, pct_mt = None, save = None, virtual = False, plots = None,
+                  storage = None):
     """
     Apply filters to AnnData object. User chooses filters on:
         - Minimum number of genes per cell
         - Minimum number of cells per gene
         - Maximum percentage of mitochondrial genes
+    The filters that are not given are asked in dialog boxes (tkinter is only imported in this case).
 
     Input:
         file (str): AnnData object file name
         output_dir (str): The output directory
+        min_genes (int): Minimum number of genes per cell
+        min_cells (int): Minimum number of cells per gene
+        pct_mt (float): Maximum percentage of mitochondrial genes
+        save (bool): Save the filtered object, asked in a dialog box if None
+        virtual (bool): Save the filtered object as masks of the original object (.mask.npz, see virtual_objects.py) instead of a copy
+        plots (PlotWorker): Background process drawing the violin plot (see qc_plots.py), drawn before returning if None
+        storage (dict): Format, compression and chunks of the filtered object (see storage.py), h5ad file written by adata.write if None
     
     Output:
         Violin plot with applied filters saved in Processing/output_dir/Plots/Plots_number-of-dataset_author/
-        If user wants to save the filtered data: AnnData object with _filtered_X suffix
+        If user wants to save the filtered data: AnnData object with _filtered_X suffix (_filtered_X.mask.npz with virtual)
         Generate a log file (filters_applied.tab) containing information on the filters applied
+        Timing and memory of the filters appended to Objects/stage_metrics.jsonl (see instrumentation.py)
+        Returns the file name of the filtered object (None if it is not saved)
     """
-    # Create folder
-    if not os.path.isdir(output_dir + '/Objects/Objects_filtered'):
-        os.mkdir(output_dir + '/Objects/Objects_filtered')    
+    interactive = min_genes is None or min_cells is None or pct_mt is None or save is None
+    if interactive:
+        from tkinter import simpledialog, messagebox
+
+    # Create folder (several processes can create it at the same time)
+    os.makedirs(output_dir + '/Objects/Objects_filtered', exist_ok = True)
     
-    # Ensure traceability by creating a log file if it doesn't exist
-    if not os.path.exists(output_dir + '/Objects/Objects_filtered/filters_applied.tab'):
-        with open(output_dir + '/Objects/Objects_filtered/filters_applied.tab', 'a') as f:
-            # Get the current date and time
-            date = datetime.now()
-            date_str = date.strftime('%Y-%m-%d %H:%M:%S')
-            # Write the header to the log file
-            f.write(date_str + '\n' + 'object' + '\t' + 'nb_cells_before' + '\t' + 'nb_genes_before' + '\t' + 'min_genes_per_cells' + 
-                    '\t' + 'min_cells_per_genes' + '\t' + 'max_pct_mt' + '\t' + 'nb_cells_after' + '\t' + 'nb_genes_after' + '\n')
+    # Ensure traceability by creating a log file if it doesn't exist, with the current date and time
+    date_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    header = (date_str + '\n' + 'object' + '\t' + 'nb_cells_before' + '\t' + 'nb_genes_before' + '\t' + 'min_genes_per_cells' + 
+              '\t' + 'min_cells_per_genes' + '\t' + 'max_pct_mt' + '\t' + 'nb_cells_after' + '\t' + 'nb_genes_after' + '\n')
+    append_log(output_dir + '/Objects/Objects_filtered/filters_applied.tab', header)
             
     # Extract the name of the dataset from the file name
-    name = file.replace('object_', '').replace('_ori.h5ad', '')
+    name = strip_extension(file).replace('object_', '', 1).removesuffix('_ori')
 
     # Read the AnnData object from the file
-    adata = ad.read_h5ad(output_dir + '/Objects/Objects_ori/' + file)
+    adata = read_object(output_dir + '/Objects/Objects_ori/' + file)
+    obs_names_ori, var_names_ori = adata.obs_names, adata.var_names
 
     # Print the name of the object and the number of cells and genes before applying filters
     nb_cells_before = adata.n_obs
     nb_genes_before = adata.n_vars
 
     # User inputs for the filter criteria
-    min_genes = simpledialog.askinteger('Input', f'For {name}, Enter a minimum number of genes per cell:')
-    min_cells = simpledialog.askinteger('Input', f'For {name}, Enter a minimum number of cells per gene:')
-    pct_mt = simpledialog.askinteger('Input', f'For {name}, Enter a maximum percentage of mitochondrial genes:')
+    if min_genes is None:
+        min_genes = simpledialog.askinteger('Input', f'For {name}, Enter a minimum number of genes per cell:')
+    if min_cells is None:
+        min_cells = simpledialog.askinteger('Input', f'For {name}, Enter a minimum number of cells per gene:')
+    if pct_mt is None:
+        pct_mt = simpledialog.askinteger('Input', f'For {name}, Enter a maximum percentage of mitochondrial genes:')
 
     # Apply the filters to the AnnData object
     sc.pp.filter_cells(adata, min_genes = min_genes)
@@ -68,6 +85,7 @@ def apply_filters(file, output_dir):
     # Number of cells and genes after applying filters
     nb_cells_after = adata.n_obs
     nb_genes_after = adata.n_vars
+    record(n_obs = nb_cells_after, n_vars = nb_genes_after, nnz = adata.X.nnz)
 
     # Display results before and after filters in a message box
     result_message = (
@@ -76,32 +94,39 @@ def apply_filters(file, output_dir):
         f'Number of genes before filters: {nb_genes_before}\n'
         f'Number of cells after filters: {nb_cells_after}\n'
         f'Number of genes after filters: {nb_genes_after}\n')
-    messagebox.showinfo('Filter Results', result_message)
+    if interactive:
+        messagebox.showinfo('Filter Results', result_message)
+    else:
+        print(result_message)
 
     # Generate and save a violin plot showing the filtered data
     plot_dir = os.path.join(output_dir, 'Plots', f'Plots_{name}')
-    if not os.path.exists(plot_dir):
-        os.makedirs(plot_dir)
-    with plt.rc_context(): 
-        sc.pl.violin(adata, ['n_genes_by_counts', 'total_counts', 'pct_counts_MT'], jitter = 0.4, size = 1.6, multi_panel = True, show = False)
-        plt.savefig(os.path.join(plot_dir, f'violin_plot_min_genes_{min_genes}_min_cells_{min_cells}.pdf'), bbox_inches = 'tight')
+    os.makedirs(plot_dir, exist_ok = True)
+    plot_qc(plots, os.path.join(plot_dir, f'violin_plot_min_genes_{min_genes}_min_cells_{min_cells}.pdf'), adata.obs)
 
     # Ask the user if they want to save the filtered AnnData object
-    save = messagebox.askyesno('Save Filtered Object', 'Do you want to save the new object with these filters?')
+    if save is None:
+        save = messagebox.askyesno('Save Filtered Object', 'Do you want to save the new object with these filters?')
+    name_file_output = None
     if save:
-        # Generate a unique filename for the filtered AnnData object
+        # Generate a unique filename for the filtered AnnData object (the numbers are shared by the copies and the masks)
         i = 1
-        name_file_output = file.replace('ori.h5ad', 'filtered_1.h5ad')
-        while os.path.exists(output_dir + '/Objects/Objects_filtered/' + name_file_output):
+        while any(os.path.exists(output_dir + f'/Objects/Objects_filtered/object_{name}_filtered_{i}{ext}') for ext in EXTENSIONS + (EXTENSION,)):
             i += 1
-            name_file_output = file.replace('ori.h5ad', f'filtered_{i}.h5ad')
+        name_file_output = f'object_{name}_filtered_{i}' + (EXTENSION if virtual else extension(storage))
         
-        # Save the filtered AnnData object
-        adata.write(output_dir + '/Objects/Objects_filtered/' + name_file_output)
+        # Save the filtered AnnData object, or only the cells and genes kept
+        if virtual:
+            write_mask(output_dir + '/Objects/Objects_filtered/' + name_file_output, file, obs_names_ori.isin(adata.obs_names),
+                       var_names_ori.isin(adata.var_names), adata.obs['n_genes'].to_numpy(), adata.var['n_cells'].to_numpy(),
+                       {'min_genes': min_genes, 'min_cells': min_cells, 'max_pct_mt': pct_mt})
+        else:
+            write_object(adata, output_dir + '/Objects/Objects_filtered/' + name_file_output, storage)
 
         # Append filter information to the log file
-        with open(output_dir + '/Objects/Objects_filtered/filters_applied.tab', 'a') as f:
-            f.write(name_file_output + '\t' + str(nb_cells_before) + '\t' + str(nb_genes_before) + 
-                    '\t' + str(min_genes) + '\t' + str(min_cells) + '\t' + str(pct_mt) + '\t' + str(adata.n_obs) + '\t' + str(adata.n_vars) + '\n')
+        append_log(output_dir + '/Objects/Objects_filtered/filters_applied.tab', header,
+                   name_file_output + '\t' + str(nb_cells_before) + '\t' + str(nb_genes_before) + '\t' + str(min_genes) + '\t' +
+                   str(min_cells) + '\t' + str(pct_mt) + '\t' + str(adata.n_obs) + '\t' + str(adata.n_vars) + '\n')
 
-    print('Done')
\ No newline at end of file
+    print('Done')
+    return name_file_output
\ No newline at end of file
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python script : Batch mode without graphical interface
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script runs the creation of the objects, the filters and the merges from a YAML or TOML configuration file (see
+# config_example.yaml), without tkinter, so the processing can run on a server or in a scheduler. It calls the same functions as
+# main.py and writes the same log files (filters_applied.tab, objects_merged.tab). The datasets are created and filtered in parallel
+# with the number of processes and the memory limit of the configuration (see parallel.py), the errors are reported at the end.
+#
+# Usage :
+#   python batch.py config_example.yaml
+#   python batch.py config_example.yaml --steps filter,merge
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import argparse
+import os
+import sys
+import traceback
+from create_anndata_object import create_anndata_object
+from apply_filters import apply_filters
+from merge import merge
+from parallel import estimate_memory, run_parallel
+from qc_plots import PlotWorker
+from storage import extension, get_storage
+
+STEPS = ('create', 'filter', 'merge')
+FILTERS = ('min_genes', 'min_cells', 'max_pct_mt')
+
+
+def read_config(path):
+    """
+    Read a YAML (.yaml, .yml) or TOML (.toml) configuration file
+
+    Output:
+        Dictionary of the configuration
+    """
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    import yaml
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def prepare_processing_dir(processing_dir):
+    """
+    Create the processing directory and its Objects and Plots subdirectories
+    """
+    for directory in [processing_dir, processing_dir + '/Objects', processing_dir + '/Plots']:
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+
+
+def dataset_filters(config, dataset):
+    """
+    Filters of a dataset: its own filters completed by the default filters of the configuration
+
+    Output:
+        Dictionary with the keys of FILTERS
+    """
+    filters = {**(config.get('filters') or {}), **(dataset.get('filters') or {})}
+    missing = [key for key in FILTERS if filters.get(key) is None]
+    if missing:
+        raise ValueError(f'Missing filters for {dataset["path"]}: {", ".join(missing)}')
+    return filters
+
+
+def run(config, steps = STEPS):
+    """
+    Run the steps of the configuration
+
+    Input:
+        config (dict): Configuration with the keys
+            processing_dir (str): Output processing directory
+            filters (dict): Default min_genes, min_cells and max_pct_mt
+            datasets (list of dict): 10X directories (path) with their own filters (filters, optional)
+            merge (list of list of str): Groups of objects to merge, as dataset names (filtered in this run) or file names of
+                Objects/Objects_filtered
+            workers (int): Number of processes for the creation and the filters of the datasets (1 by default)
+            max_memory_gb (float): Memory limit of the running datasets in GB, 80 % of the available memory if not given
+            virtual_filters (bool): Save the filtered objects as masks of the original objects (False by default)
+            plot_max_points (int): Maximum number of cells drawn as points in the QC plots (5000 by default)
+            plot_rasterized (bool): Points of the QC plots rasterized in the PDF files (True by default)
+            merge_on_disk (bool): Merge the objects by chunks of cells without loading them (False by default)
+            join (str): Genes of the merged objects, 'inner' (genes in all the objects, default) or 'outer'
+            storage (dict): Format (h5ad or zarr), compression, chunk_size and layout (csr or csc) of the objects (see storage.py),
+                h5ad files written by adata.write if not given
+        steps (tuple of str): Steps to run among 'create', 'filter' and 'merge'
+
+    Output:
+        Dictionary with the objects created (create), filtered (filter) and merged (merge) and the errors ((dataset, step) -> message)
+    """
+    for step in steps:
+        if step not in STEPS:
+            raise ValueError(f'Unknown step {step}, use {", ".join(STEPS)}')
+    processing_dir = config['processing_dir']
+    prepare_processing_dir(processing_dir)
+
+    # Check the filters of all the datasets before the first step
+    l_datasets = config.get('datasets') or []
+    l_filters = [dataset_filters(config, dataset) for dataset in l_datasets] if 'filter' in steps else []
+
+    workers = config.get('workers', 1)
+    max_memory = config['max_memory_gb'] * 1024 ** 3 if config.get('max_memory_gb') else None
+    storage = get_storage(config.get('storage'))
+
+    # QC plots drawn in a background process during the run
+    plots = PlotWorker(config.get('plot_max_points', 5000), config.get('plot_rasterized', True))
+
+    # Jobs of each dataset
+    d_create, d_filter, d_memory, d_objects = {}, {}, {}, {}
+    for i, dataset in enumerate(l_datasets):
+        path = dataset['path'].rstrip('/\\')
+        source = os.path.basename(path)
+        name = source.replace('_10X', '')
+        d_memory[name] = estimate_memory(path)
+        d_objects[name] = f'{processing_dir}/Objects/Objects_ori/object_{name}_ori{extension(storage)}'
+        d_create[name] = ((source, '10X', processing_dir, os.path.dirname(path)), {'plots': plots, 'storage': storage})
+        if 'filter' in steps:
+            filters = l_filters[i]
+            d_filter[name] = ((os.path.basename(d_objects[name]), processing_dir, filters['min_genes'], filters['min_cells'],
+                               filters['max_pct_mt']),
+                              {'save': True, 'virtual': config.get('virtual_filters', False), 'plots': plots,
+                               'storage': storage})
+
+    d_results = {'create': {}, 'filter': {}, 'merge': [], 'errors': {}}
+    if 'create' in steps:
+        d_results['create'], d_errors = run_parallel(create_anndata_object, d_create, workers, max_memory, d_memory)
+        d_results['errors'].update({(name, 'create'): error for name, error in d_errors.items()})
+        # Datasets without object are not filtered
+        d_filter = {name: job for name, job in d_filter.items() if name not in d_errors}
+    if 'filter' in steps:
+        # Memory of the filters estimated from the created objects
+        d_memory = {name: estimate_memory(d_objects[name]) for name in d_filter}
+        d_results['filter'], d_errors = run_parallel(apply_filters, d_filter, workers, max_memory, d_memory)
+        d_results['errors'].update({(name, 'filter'): error for name, error in d_errors.items()})
+
+    if 'merge' in steps:
+        for group in config.get('merge') or []:
+            # Groups with a dataset that failed are not merged
+            l_failed = [item for item in group if any(name == item for name, _ in d_results['errors'])]
+            if l_failed:
+                d_results['errors'][(' '.join(group), 'merge')] = f'Not merged, failed datasets: {" ".join(l_failed)}'
+                continue
+            l_obj = [d_results['filter'].get(item, item) for item in group]
+            try:
+                d_results['merge'].append(merge(l_obj, processing_dir, config.get('merge_on_disk', False), config.get('join', 'inner'),
+                                                storage = storage))
+            except Exception:
+                d_results['errors'][(' '.join(group), 'merge')] = traceback.format_exc()
+
+    # Wait for the plots at the end of the run
+    d_results['errors'].update({(path, 'plot'): error for path, error in plots.wait().items()})
+    return d_results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run the scRNAseq processing from a configuration file')
+    parser.add_argument('config', help = 'YAML or TOML configuration file')
+    parser.add_argument('--steps', default = ','.join(STEPS), help = 'Comma-separated steps among create, filter, merge')
+    args = parser.parse_args()
+
+    d_results = run(read_config(args.config), tuple(args.steps.split(',')))
+    for step in STEPS:
+        if d_results[step]:
+            print(f'{step}: {d_results[step]}')
+    for (name, step), error in d_results['errors'].items():
+        print(f'{step} failed for {name}:\n{error}')
+    if d_results['errors']:
+        sys.exit(1)
@@ -10,9 +10,14 @@
 import os
 import scanpy as sc
 import anndata as ad
-from matplotlib import pyplot as plt
+from qc_plots import plot_qc
+from mtx_loader import read_10x
+from qc_sweep import write_qc
+from storage import extension, write_object
+from instrumentation import instrumented, record
 
-def create_anndata_object(source, data_type, output_dir):
+@instrumented('create')
+def create_anndata_object(source, data_type, output_dir, input_dir = '../../data/scrnaseq_data', plots = None, storage = None):
     """
     Create AnnData object from 10X or Smart-seq2 data
 
@@ -33,31 +38,33 @@ def create_anndata_object(source, data_type, output_dir):
                     415 1 1
         data_type (str): The type of the data :'10X'
         output_dir (str): The output dir
+        input_dir (str): The directory containing the source directory
+        plots (PlotWorker): Background process drawing the violin plot (see qc_plots.py), drawn before returning if None
+        storage (dict): Format, compression and chunks of the object (see storage.py), h5ad file written by adata.write if None
     
     Output:
-        Anndata objects no filtered named object_number_of_dataset_samples.h5ad
+        Anndata objects no filtered named object_number_of_dataset_samples.h5ad, with the QC metrics in qc/object_number_of_dataset_samples.qc.npz
             file.h5ad contains n_obs * n_vars = 90 * 55141 ; obs = rows = cells, var = columns = genes
                                 obs: 'n_genes_by_counts', 'total_counts', 'total_counts_mt', 'pct_counts_MT', 'dataset'
                                 var: 'MT', 'n_cells_by_counts', 'mean_counts', 'pct_dropout_by_counts', 'total_counts'
+        Timing and memory of the creation appended to Objects/stage_metrics.jsonl (see instrumentation.py)
+        Returns the file name of the object
    """
     # For 10X
     if data_type == '10X':
         # Create file names and paths
         name = source.replace('_10X', '')
-        name_object = f'object_{name}_ori.h5ad'
-        input_path = f'../../data/scrnaseq_data/{source}'
+        name_object = f'object_{name}_ori{extension(storage)}'
+        input_path = f'{input_dir}/{source}'
 
     # Create a directory for plots if it doesn't exist
     plot_dir = output_dir + f'/Plots/Plots_{name}'
-    if not os.path.isdir(plot_dir):
-        os.mkdir(plot_dir)
-
-    if not os.path.isdir(output_dir + '/Objects/Objects_ori'):
-        os.mkdir(output_dir + '/Objects/Objects_ori')
+    os.makedirs(plot_dir, exist_ok = True)
+    os.makedirs(output_dir + '/Objects/Objects_ori', exist_ok = True)
 
     # Reading the data
     if data_type == '10X':
-        adata = sc.read_10x_mtx(input_path) # Read 10X data
+        adata = read_10x(input_path) # Read 10X data (same object as sc.read_10x_mtx, cached, see mtx_loader.py)
 
     # Ensure unique var and obs names
     adata.var_names_make_unique() # Make gene names unique
@@ -71,11 +78,12 @@ def create_anndata_object(source, data_type, output_dir):
     adata.obs['dataset'] = adata.n_obs * [name]
 
     # Generate and save a violin plot for quality control metrics
-    with plt.rc_context():
-        sc.pl.violin(adata, ['n_genes_by_counts', 'total_counts', 'pct_counts_MT'], jitter = 0.4, size = 1.6, multi_panel = True, show = False)
-        plt.savefig(f'{plot_dir}/violin_plot.pdf', bbox_inches = 'tight')
+    plot_qc(plots, f'{plot_dir}/violin_plot.pdf', adata.obs)
 
-    # Save the AnnData object to a file
-    adata.write(output_dir + f'/Objects/Objects_ori/{name_object}')
+    # Save the AnnData object to a file, with its QC metrics to preview the filters (see qc_sweep.py)
+    write_object(adata, output_dir + f'/Objects/Objects_ori/{name_object}', storage)
+    write_qc(adata, output_dir + f'/Objects/Objects_ori/{name_object}')
+    record(n_obs = adata.n_obs, n_vars = adata.n_vars, nnz = adata.X.nnz) # Size of the matrix in stage_metrics.jsonl (see instrumentation.py)
 
     print('Done')
+    return name_object
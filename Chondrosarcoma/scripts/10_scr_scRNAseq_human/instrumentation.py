@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Timing and memory of the stages of the processing
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module measures each stage of the processing (creation, filters, merge) decorated with @instrumented: wall time,
+# CPU time of the process (all its threads), peak resident memory during the stage, bytes read and written by the process, and the
+# number of cells, genes and values of the matrix recorded by the stage. One JSON line per stage is appended to
+# Objects/stage_metrics.jsonl of the processing folder, next to filters_applied.tab and objects_merged.tab. If the environment variable
+# PIPELINE_PROFILE is a directory, each stage is also profiled: with cProfile (<stage>_<pid>_<date>.prof, read with pstats or
+# snakeviz), or with py-spy attached to the process if PIPELINE_PROFILER=py-spy (flame graph .svg, py-spy must be installed).
+#
+# Usage :
+#   PIPELINE_PROFILE=../../results/profiles python batch.py config_example.yaml
+#   python instrumentation.py ../../results/sc_results/chondro_batch/Objects/stage_metrics.jsonl
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import cProfile
+import functools
+import inspect
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from log_files import append_log
+try:
+    import resource
+except ImportError:
+    resource = None
+
+LOG_FILE = 'stage_metrics.jsonl'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+PROFILER_ENV = 'PIPELINE_PROFILER'
+
+# Stages running in the current thread, record() adds its values to the last one
+_local = threading.local()
+
+def peak_rss():
+    """
+    Peak resident memory of the process in MB, since the last reset_peak_rss() on Linux (None where the resource module doesn't exist)
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for lig in f:
+                if lig.startswith('VmHWM:'):
+                    return int(lig.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of the process to its current memory (Linux only, the peak of the whole process is kept otherwise)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def io_counters():
+    """
+    Bytes read and written by the process (all the reads and writes, from the disk or the page cache), (None, None) outside Linux
+    """
+    try:
+        with open('/proc/self/io') as f:
+            d_io = dict(lig.split(': ') for lig in f.read().splitlines())
+        return int(d_io['rchar']), int(d_io['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def record(**fields):
+    """
+    Add values to the stage running in this thread (e.g. record(nnz = adata.X.nnz)), ignored outside a stage
+    """
+    l_stack = getattr(_local, 'stack', [])
+    if l_stack:
+        l_stack[-1].record.update(fields)
+
+class Stage:
+    """
+    Context manager measuring a stage and appending its record to a JSON lines log
+
+    Input:
+        name (str): Name of the stage (create, filter, merge)
+        log_path (str): JSON lines file, None to only keep the record in the attribute record
+        fields: Values added to the record
+    """
+    def __init__(self, name, log_path = None, **fields):
+        self.name = name
+        self.log_path = log_path
+        self.record = {'stage': name, **fields}
+        self.profiler = None
+
+    def __enter__(self):
+        if not hasattr(_local, 'stack'):
+            _local.stack = []
+        self.stack = _local.stack
+        # The peak of an outer stage would be lost if a nested stage reset it
+        if not self.stack:
+            reset_peak_rss()
+            self.start_profile()
+        self.stack.append(self)
+        self.record['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.read, self.written = io_counters()
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        read, written = io_counters()
+        peak = peak_rss()
+        self.stack.pop()
+        if not self.stack:
+            self.stop_profile()
+        self.record.update({'status': 'done' if exc_type is None else 'failed', 'wall_s': round(wall, 3), 'cpu_s': round(cpu, 3),
+                            'peak_rss_mb': round(peak, 1) if peak is not None else None,
+                            'bytes_read': read - self.read if read is not None else None,
+                            'bytes_written': written - self.written if written is not None else None, 'pid': os.getpid()})
+        if exc_type is not None:
+            self.record['error'] = f'{exc_type.__name__}: {exc}'
+        if self.log_path is not None:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok = True)
+            append_log(self.log_path, '', json.dumps(self.record) + '\n')
+        return False
+
+    def start_profile(self):
+        directory = os.environ.get(PROFILE_ENV)
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok = True)
+        path = os.path.join(directory, f'{self.name}_{os.getpid()}_{time.strftime("%Y%m%d-%H%M%S")}')
+        if os.environ.get(PROFILER_ENV, 'cprofile') == 'py-spy':
+            try:
+                self.profiler = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--output', path + '.svg'],
+                                                 stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+                self.record['profile'] = path + '.svg'
+            except OSError as e:
+                print(f'py-spy not started ({e}), {self.name} is not profiled')
+        else:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+                self.record['profile'] = path + '.prof'
+            except ValueError as e:
+                # Another profiler is already running (e.g. python -m cProfile)
+                print(f'cProfile not started ({e}), {self.name} is not profiled')
+                self.profiler = None
+
+    def stop_profile(self):
+        if self.profiler is None:
+            return
+        if isinstance(self.profiler, cProfile.Profile):
+            self.profiler.disable()
+            self.profiler.dump_stats(self.record['profile'])
+        else:
+            # py-spy writes the flame graph when it is interrupted
+            self.profiler.send_signal(signal.SIGINT)
+            try:
+                self.profiler.wait(timeout = 60)
+            except subprocess.TimeoutExpired:
+                self.profiler.kill()
+        self.profiler = None
+
+def instrumented(name):
+    """
+    Decorator measuring a function of the processing as a stage, the record is appended to Objects/stage_metrics.jsonl of its output_dir
+    argument, with the file name returned by the function (object) and the values given to record() by the function
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            output_dir = signature.bind(*args, **kwargs).arguments['output_dir']
+            with Stage(name, os.path.join(output_dir, 'Objects', LOG_FILE)) as stage:
+                result = func(*args, **kwargs)
+                stage.record['object'] = result
+            return result
+        return wrapper
+    return decorator
+
+def read_log(path):
+    """
+    Records of a JSON lines log of the stages
+    """
+    with open(path) as f:
+        return [json.loads(lig) for lig in f if lig.strip()]
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('Usage: python instrumentation.py <processing folder>/Objects/stage_metrics.jsonl')
+    print(f'{"date":<21}{"stage":<8}{"object":<40}{"status":<8}{"wall (s)":>9}{"cpu (s)":>9}{"peak (MB)":>11}{"read (MB)":>11}'
+          f'{"written (MB)":>14}{"nnz":>12}')
+    for d_record in read_log(sys.argv[1]):
+        l_values = [d_record.get(key) for key in ('wall_s', 'cpu_s', 'peak_rss_mb')]
+        l_values += [d_record[key] / 1024 ** 2 if d_record.get(key) is not None else None for key in ('bytes_read', 'bytes_written')]
+        wall, cpu, peak, read, written = [value if value is not None else float('nan') for value in l_values]
+        print(f'{d_record["date"]:<21}{d_record["stage"]:<8}{d_record.get("object") or "":<40}{d_record["status"]:<8}{wall:>9.2f}'
+              f'{cpu:>9.2f}{peak:>11.0f}{read:>11.1f}{written:>14.1f}{d_record.get("nnz", ""):>12}')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Log files shared by several processes
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module appends lines to the log files of the processing (filters_applied.tab, objects_merged.tab) under an
+# exclusive lock on the file, so the processes filtering several datasets at the same time never write the header twice or mix their
+# lines.
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def append_log(path, header, line = ''):
+    """
+    Append a line to a log file, the header is written first if the file is empty
+
+    Input:
+        path (str): Log file, created if it doesn't exist
+        header (str): Header written at the creation of the file (with its end of line)
+        line (str): Line to append (with its end of line), only the header is written if empty
+    """
+    with open(path, 'a') as f:
+        lock(f)
+        try:
+            f.seek(0, 2)
+            if f.tell() == 0:
+                f.write(header)
+            f.write(line)
+            f.flush()
+        finally:
+            unlock(f)
@@ -3,7 +3,8 @@
 # R script : Main script to call functions
 # Auteur  : Léa ROGUE
 # Date    : 31-03-2025
-# Description : This python script show graphical interface to choose options to process and integrate scRNAseq.
+# Description : This python script show graphical interface to choose options to process and integrate scRNAseq. It is a front end over
+# the same functions as the batch mode without graphical interface (batch.py with a configuration file).
 # ----------------------------------------------------------------------------------------------------------------------------------------
 
 # Load packages
@@ -15,6 +16,9 @@ import tkfilebrowser
 from create_anndata_object import *
 from apply_filters import *
 from merge import *
+from batch import prepare_processing_dir
+from parallel import estimate_memory, report_errors, run_parallel, start_method
+from qc_plots import PlotWorker
 
 # User chooses the processing directory
 root = tk.Tk()
@@ -24,10 +28,14 @@ processing_dir = tkfilebrowser.askopendirname(initialdir = '../../results/sc_res
 root.destroy()
 
 # Create the user-specified subdirectories for Objects and Plots
-if not os.path.isdir(processing_dir + '/Objects'):
-    os.mkdir(processing_dir + '/Objects')
-if not os.path.isdir(processing_dir + '/Plots'):
-    os.mkdir(processing_dir + '/Plots')
+prepare_processing_dir(processing_dir)
+
+# Processes are only started where they are forked, on Linux (with spawn, this script would be executed again by each process, and
+# forking after Tk was initialized is unsafe on macOS)
+can_fork = start_method() == 'fork'
+
+# QC plots drawn in a background process, the script waits for them at the end
+plots = PlotWorker() if can_fork else None
 
 # Create the graphical interface
 root = tk.Tk()
@@ -96,9 +104,18 @@ if 2 in selected_options:
     messagebox.showinfo('Information', 'Choose one or more 10X folder(s) to create an object')
     l_dir = list(tkfilebrowser.askopendirnames(initialdir = '../../data/scrnaseq_data/', title = 'Choose directories for 10X'))
 
-    # Create Anndata objects for each specified 10X directory
+    # Create Anndata objects for each specified 10X directory, in parallel (in sequence where processes can't be forked)
+    d_jobs = {}
+    d_memory = {}
     for dir in l_dir:
-        create_anndata_object(re.split(r'[/\\]', dir)[-1], '10X', processing_dir)
+        source = re.split(r'[/\\]', dir)[-1]
+        d_jobs[source] = ((source, '10X', processing_dir, os.path.dirname(dir)), {'plots': plots})
+        d_memory[source] = estimate_memory(dir)
+    workers = None if can_fork else 1
+    d_created, d_errors = run_parallel(create_anndata_object, d_jobs, workers, d_memory = d_memory)
+    report_errors(d_errors, 'Object creation')
+    if d_errors:
+        messagebox.showwarning('Warning', f'Object creation failed for {", ".join(d_errors)} (see the terminal)')
     messagebox.showinfo('Information', 'Object(s) creation finished')
     root.destroy()
 
@@ -111,7 +128,7 @@ if 3 in selected_options:
 
     # Apply filters to each specified Anndata object
     for obj in l_obj:
-        apply_filters(re.split(r'[/\\]', obj)[-1], processing_dir)
+        apply_filters(re.split(r'[/\\]', obj)[-1], processing_dir, plots = plots)
     messagebox.showinfo('Information', 'Finished')
     root.destroy()
 
@@ -132,3 +149,6 @@ if 4 in selected_options:
     messagebox.showinfo('Information', 'Merging finished')
     root.destroy()
 
+# Wait for the QC plots
+if plots is not None:
+    report_errors(plots.wait(), 'Plot')
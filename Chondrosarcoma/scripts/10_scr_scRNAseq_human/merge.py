@@ -3,59 +3,178 @@
 # R script : Main script to call functions
 # Auteur  : Léa ROGUE
 # Date    : 31-03-2025
-# Description : This script merge objects by outer join of multiple objects choosen by user.
+# Description : This script merge objects by outer join of multiple objects choosen by user. With on_disk, the objects are not loaded:
+# the matrices are copied by chunks of cells from the input files to the merged file, with the genes aligned on the genes of the
+# merged object (inner or outer join), so only one chunk is in memory whatever the number of objects (objects saved with a csc
+# layout are read whole, one at a time).
 # ----------------------------------------------------------------------------------------------------------------------------------------
 
 import anndata as ad
+import numpy as np
 import os
+import pandas as pd
+import scipy.sparse as sp
+import time
+from functools import reduce
+from instrumentation import instrumented, peak_rss, record
+from log_files import append_log
+from storage import EXTENSIONS, append_rows, extension, matrix_element, open_store, write_object
+from virtual_objects import read_annotations, read_filtered
 
-def merge(l, output_dir):
+def align_chunk(X, columns, n_vars):
+    """
+    Move the columns of a CSR chunk to the genes of the merged object
+
+    Input:
+        X (scipy CSR matrix): Chunk of an input object
+        columns (np.ndarray): Position in the merged object of each gene of the input object, -1 for genes not kept (inner join)
+        n_vars (int): Number of genes of the merged object
+
+    Output:
+        CSR matrix (cells of the chunk x genes of the merged object) with sorted indices
+    """
+    new_indices = columns[X.indices]
+    kept = new_indices >= 0
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[kept], minlength = X.shape[0]))])
+    X = sp.csr_matrix((X.data[kept], new_indices[kept], indptr), shape = (X.shape[0], n_vars))
+    X.sort_indices()
+    return X
+
+def merge_on_disk(l_path, path_out, join = 'inner', chunk_size = 10000, storage = None):
+    """
+    Merge h5ad/zarr files into a new file by chunks of cells, like ad.concat (X, obs and the gene names, the other elements are not kept)
+    The inputs saved with a csc layout are read whole, once (the memory of one input object instead of one chunk).
+
+    Input:
+        l_path (list of str): h5ad/zarr files or mask files (see virtual_objects.py) to merge
+        path_out (str): Merged file (.h5ad or .zarr)
+        join (str): 'inner' (genes in all the objects) or 'outer' (genes in at least one object, missing values are 0)
+        chunk_size (int): Number of cells read at each step
+        storage (dict): Format, compression and chunks of the merged file (see storage.py), X is written as csr (appended by cells)
+
+    Output:
+        Dictionary with the number of cells, genes and values written, the time (s) and the peak memory of the process (MB)
+    """
+    if join not in ('inner', 'outer'):
+        raise ValueError(f'Unknown join {join}, use inner or outer')
+    start_time = time.perf_counter()
+
+    # Only the annotations are read, the gene sets are aligned with the positions of the genes of each object in the merged object
+    l_inputs = [read_annotations(path) for path in l_path]
+    l_obs = [obs for _, _, _, obs, _ in l_inputs]
+    l_var = [var.index for _, _, _, _, var in l_inputs]
+    l_dtypes = []
+    for source, _, _, _, _ in l_inputs:
+        with open_store(source) as f:
+            l_dtypes.append(matrix_element(f['X']).dtype)
+    var_names = reduce(lambda x, y: x.intersection(y) if join == 'inner' else x.union(y), l_var)
+    l_columns = []
+    for (_, _, genes, _, _), var in zip(l_inputs, l_var):
+        if genes is None:
+            l_columns.append(var_names.get_indexer(var))
+        else:
+            # Genes of the original object of a mask file, -1 for the genes removed by the filters
+            columns = np.full(len(genes), -1)
+            columns[genes] = var_names.get_indexer(var)
+            l_columns.append(columns)
+
+    # Observations concatenated as ad.concat, the categories of a column are the union of the categories of the objects
+    for column in set.intersection(*[set(obs.columns) for obs in l_obs]):
+        if all(isinstance(obs[column].dtype, pd.CategoricalDtype) for obs in l_obs):
+            categories = reduce(lambda x, y: x.union(y), [obs[column].cat.categories for obs in l_obs])
+            l_obs = [obs.assign(**{column: obs[column].cat.set_categories(categories)}) for obs in l_obs]
+    obs = pd.concat(l_obs, join = join, ignore_index = True)
+    obs.index = pd.Index(np.concatenate([obs_i.index.to_numpy() for obs_i in l_obs]))
+
+    # Annotations written first, then X chunk by chunk
+    storage = {**(storage or {}), 'layout': 'csr'}
+    write_object(ad.AnnData(obs = obs, var = pd.DataFrame(index = var_names)), path_out, storage)
+    dtype = np.result_type(*l_dtypes)
+    n_values = 0
+    with open_store(path_out, 'a') as f_out:
+        matrix_out = None
+        for (source, cells, _, _, _), columns in zip(l_inputs, l_columns):
+            with open_store(source) as f:
+                matrix = matrix_element(f['X'])
+                if getattr(matrix, 'format', None) == 'csc':
+                    # Each chunk of cells would read all the columns again: the csc matrix is read once and converted to csr
+                    matrix = matrix.to_memory().tocsr()
+                for start in range(0, matrix.shape[0], chunk_size):
+                    X = matrix[start:min(start + chunk_size, matrix.shape[0])]
+                    X = sp.csr_matrix(X) if not sp.issparse(X) else X.tocsr()
+                    if cells is not None:
+                        X = X[cells[start:start + chunk_size]]
+                    X = align_chunk(X, columns, len(var_names)).astype(dtype)
+                    n_values += X.nnz
+                    matrix_out = append_rows(f_out, X, storage, matrix_out)
+        if matrix_out is None:
+            append_rows(f_out, sp.csr_matrix((0, len(var_names)), dtype = dtype), storage)
+
+    return {'n_cells': len(obs), 'n_genes': len(var_names), 'n_values': n_values, 'time': time.perf_counter() - start_time,
+            'peak_rss_mb': peak_rss()}
+
+@instrumented('merge')
+def merge(l, output_dir, on_disk = False, join = 'inner', chunk_size = 10000, storage = None):
     """
     Merge multiple AnnData objects.
 
     Input:
         l (list of str): List of AnnData object file names to merge.
         output_dir (str): The output directory
-    
+        on_disk (bool): Merge the files by chunks of cells without loading the objects (see merge_on_disk)
+        join (str): 'inner' (genes in all the objects) or 'outer' (all the genes)
+        chunk_size (int): Number of cells read at each step with on_disk
+        storage (dict): Format, compression and chunks of the merged object (see storage.py), h5ad file written by adata.write if None
+
     Output:
-        Merged AnnData object saved as object_all-the-datasets.h5ad in the Objects/ directory.
+        Merged AnnData object saved as object_merged_<number>.h5ad (or .zarr) in the Objects/ directory.
+        Timing and memory of the merge appended to Objects/stage_metrics.jsonl (see instrumentation.py)
+        Returns the file name of the merged object
     """
     # Create folder
-    if not os.path.isdir(output_dir + '/Objects/Objects_merged'):
-        os.mkdir(output_dir + '/Objects/Objects_merged')    
+    os.makedirs(output_dir + '/Objects/Objects_merged', exist_ok = True)
 
     # Ensure traceability by creating a log file if it doesn't exist
-    if not os.path.exists(output_dir + '/Objects/Objects_merged/objects_merged.tab'):
-        with open(output_dir + '/Objects/Objects_merged/objects_merged.tab', 'a') as f:
-            # Write the header to the log file
-            f.write('object_number' + '\t' + 'objects_selected' + '\n')
+    header = 'object_number' + '\t' + 'objects_selected' + '\n'
+    append_log(output_dir + '/Objects/Objects_merged/objects_merged.tab', header)
 
     # Generate a unique filename for the object
     a = 1
-    obj_name = 'object_merged_1.h5ad'
-    while os.path.exists(output_dir + '/Objects/Objects_merged/' + obj_name):
+    while any(os.path.exists(output_dir + f'/Objects/Objects_merged/object_merged_{a}{ext}') for ext in EXTENSIONS):
         a += 1
-        obj_name = f'object_merged_{a}.h5ad'
+    obj_name = f'object_merged_{a}{extension(storage)}'
+
+    if on_disk:
+        d_stats = merge_on_disk([output_dir + '/Objects/Objects_filtered/' + file for file in l],
+                                output_dir + '/Objects/Objects_merged/' + obj_name, join, chunk_size, storage)
+        record(n_obs = d_stats['n_cells'], n_vars = d_stats['n_genes'], nnz = d_stats['n_values'])
+        duration = max(d_stats['time'], 1e-9)
+        message = (f'{d_stats["n_cells"]} cells x {d_stats["n_genes"]} genes merged in {d_stats["time"]:.1f} s '
+                   f'({d_stats["n_cells"] / duration:.0f} cells/s, {d_stats["n_values"] / duration:.0f} values/s)')
+        if d_stats['peak_rss_mb'] is not None:
+            message += f', peak memory {d_stats["peak_rss_mb"]:.0f} MB'
+        print(message)
+    else:
+        # Initialize dictionaries and lists to store AnnData objects
+        d_adata = {}
+        l_adata = []
 
-    # Initialize dictionaries and lists to store AnnData objects
-    d_adata = {}
-    l_adata = []
-    
-    # Read each AnnData object file and store it in the dictionary and list
-    for i in range(len(l)):
-        # Read the AnnData object from file
-        d_adata[f'adata{i}'] = ad.read_h5ad(output_dir + '/Objects/Objects_filtered/' + l[i])
-        l_adata.append(d_adata[f'adata{i}'])
+        # Read each AnnData object file and store it in the dictionary and list
+        for i in range(len(l)):
+            # Read the AnnData object from file (the original object sliced in backed mode for a mask file)
+            d_adata[f'adata{i}'] = read_filtered(output_dir + '/Objects/Objects_filtered/' + l[i])
+            l_adata.append(d_adata[f'adata{i}'])
 
-    # Merge all AnnData objects using an outer join to include all genes
-    adata_merge = ad.concat(l_adata)
+        # Merge all AnnData objects (inner join: genes found in all the objects)
+        adata_merge = ad.concat(l_adata, join = join)
+        record(n_obs = adata_merge.n_obs, n_vars = adata_merge.n_vars, nnz = adata_merge.X.nnz)
 
-    # Save the merged AnnData object to the specified directory
-    adata_merge.write(output_dir + '/Objects/Objects_merged/' + obj_name)
+        # Save the merged AnnData object to the specified directory
+        write_object(adata_merge, output_dir + '/Objects/Objects_merged/' + obj_name, storage)
 
     # Append object information to the log file
-    with open(output_dir + '/Objects/Objects_merged/objects_merged.tab', 'a') as f:
-        f.write(f'object_merged_{a}' + '\t' + ' '.join(l) + '\n')
+    append_log(output_dir + '/Objects/Objects_merged/objects_merged.tab', header, f'object_merged_{a}' + '\t' + ' '.join(l) + '\n')
 
     print('Done')
-    
\ No newline at end of file
+    return obj_name
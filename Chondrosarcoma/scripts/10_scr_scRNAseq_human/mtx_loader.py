@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Fast reading of 10X MatrixMarket directories with a binary cache
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module reads a 10X directory (matrix.mtx, genes.tsv, barcodes.tsv or their .gz version from Cell Ranger v3) into
+# the same AnnData object as sc.read_10x_mtx, but the coordinates of matrix.mtx are parsed by blocks in several threads (pyarrow csv
+# reader) and the cells x genes CSR matrix is built directly, without the genes x cells matrix transposed by scanpy. The matrix and the
+# names are saved in a npz cache keyed on the size and the modification time of the 3 files, so the next creations of the object (other
+# settings, other processing directory) only load the cache.
+#
+# Usage :
+#   python mtx_loader.py ../../data/scrnaseq_data/1_Low_L07_10X --threads 8
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import argparse
+import gzip
+import hashlib
+import os
+import anndata as ad
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import scipy.sparse as sp
+
+# Version of the cache files, to change if their content changes
+CACHE_VERSION = 1
+
+
+def files_10x(path):
+    """
+    Files of a 10X directory, Cell Ranger v2 (genes.tsv) or v3 (features.tsv.gz)
+
+    Output:
+        Tuple (matrix file, genes file, barcodes file, True for the v2 format)
+    """
+    if os.path.isfile(os.path.join(path, 'genes.tsv')):
+        return os.path.join(path, 'matrix.mtx'), os.path.join(path, 'genes.tsv'), os.path.join(path, 'barcodes.tsv'), True
+    return (os.path.join(path, 'matrix.mtx.gz'), os.path.join(path, 'features.tsv.gz'), os.path.join(path, 'barcodes.tsv.gz'),
+            False)
+
+
+def read_header(path):
+    """
+    Header of a MatrixMarket file
+
+    Output:
+        Tuple (field: integer, real or pattern, number of rows, number of columns, number of values, number of lines of the header)
+    """
+    with (gzip.open if path.endswith('.gz') else open)(path, 'rt') as f:
+        lig = f.readline()
+        if not lig.startswith('%%MatrixMarket matrix coordinate'):
+            raise ValueError(f'{path} is not a MatrixMarket coordinate file')
+        field = lig.split()[3].lower()
+        n_lines = 1
+        for lig in f:
+            n_lines += 1
+            if not lig.startswith('%') and lig.strip():
+                n_rows, n_cols, n_values = (int(x) for x in lig.split())
+                return field, n_rows, n_cols, n_values, n_lines
+    raise ValueError(f'{path} has no size line')
+
+
+def read_mtx(path, threads = None, block_size = 1 << 24):
+    """
+    Read a 10X matrix.mtx (genes x cells) as a cells x genes CSR matrix
+
+    Input:
+        path (str): matrix.mtx or matrix.mtx.gz
+        threads (int): Number of threads parsing the blocks, all the cores if None
+        block_size (int): Bytes per block
+
+    Output:
+        CSR matrix (float32) of shape (number of cells, number of genes)
+    """
+    field, n_genes, n_cells, n_values, n_lines = read_header(path)
+    if threads:
+        pa.set_cpu_count(threads)
+    l_columns = ['gene', 'cell'] if field == 'pattern' else ['gene', 'cell', 'value']
+    table = pv.read_csv(path,
+                        read_options = pv.ReadOptions(skip_rows = n_lines, column_names = l_columns, block_size = block_size,
+                                                      use_threads = True),
+                        parse_options = pv.ParseOptions(delimiter = ' ', ignore_empty_lines = True),
+                        convert_options = pv.ConvertOptions(column_types = {'gene': pa.int32(), 'cell': pa.int32(),
+                                                                            'value': pa.float32()}))
+    if table.num_rows != n_values:
+        raise ValueError(f'{path}: {table.num_rows} values read, {n_values} expected')
+
+    genes = table.column('gene').to_numpy() - 1
+    cells = table.column('cell').to_numpy() - 1
+    values = np.ones(len(genes), dtype = np.float32) if field == 'pattern' else table.column('value').to_numpy()
+    return sp.csr_matrix((values, (cells, genes)), shape = (n_cells, n_genes), dtype = np.float32)
+
+
+def cache_key(l_files):
+    h = hashlib.blake2b(digest_size = 8)
+    h.update(str(CACHE_VERSION).encode())
+    for file in l_files:
+        stat = os.stat(file)
+        h.update(f'{os.path.abspath(file)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return h.hexdigest()
+
+
+def read_10x(path, cache_dir = None, threads = None):
+    """
+    Read a 10X directory as sc.read_10x_mtx (gene symbols made unique as var names, gene_ids and feature_types in var, only the Gene
+    Expression features for Cell Ranger v3), with a cache of the parsed files
+
+    Input:
+        path (str): 10X directory
+        cache_dir (str): Directory of the cache, .mtx_cache next to the 10X directory if None (no cache if it can't be written)
+        threads (int): Number of threads parsing matrix.mtx
+
+    Output:
+        AnnData object, cells x genes, CSR matrix
+    """
+    path = path.rstrip('/\\')
+    path_matrix, path_genes, path_barcodes, is_legacy = files_10x(path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), '.mtx_cache')
+    prefix = os.path.basename(path) + '.'
+    path_cache = os.path.join(cache_dir, f'{prefix}{cache_key([path_matrix, path_genes, path_barcodes])}.npz')
+
+    if os.path.exists(path_cache):
+        with np.load(path_cache, allow_pickle = False) as data:
+            X = sp.csr_matrix((data['data'], data['indices'], data['indptr']), shape = tuple(data['shape']))
+            barcodes, gene_ids, symbols, feature_types = data['barcodes'], data['gene_ids'], data['symbols'], data['feature_types']
+    else:
+        X = read_mtx(path_matrix, threads)
+        genes = pd.read_csv(path_genes, header = None, sep = '\t', dtype = str)
+        barcodes = pd.read_csv(path_barcodes, header = None, dtype = str)[0].to_numpy(dtype = str)
+        gene_ids, symbols = genes[0].to_numpy(dtype = str), genes[1].to_numpy(dtype = str)
+        feature_types = genes[2].to_numpy(dtype = str) if not is_legacy else np.array([], dtype = str)
+        try:
+            os.makedirs(cache_dir, exist_ok = True)
+            # Remove the caches of previous versions of the files
+            for file in os.listdir(cache_dir):
+                if file.startswith(prefix) and file.endswith('.npz'):
+                    os.remove(os.path.join(cache_dir, file))
+            np.savez(path_cache + '.tmp.npz', data = X.data, indices = X.indices, indptr = X.indptr, shape = np.array(X.shape),
+                     barcodes = barcodes, gene_ids = gene_ids, symbols = symbols, feature_types = feature_types)
+            os.replace(path_cache + '.tmp.npz', path_cache)
+        except OSError:
+            pass
+
+    var = pd.DataFrame({'gene_ids': gene_ids.astype(object)}, index = ad.utils.make_index_unique(pd.Index(symbols.astype(object))))
+    if not is_legacy:
+        var['feature_types'] = feature_types.astype(object)
+    adata = ad.AnnData(X = X, obs = pd.DataFrame(index = pd.Index(barcodes.astype(object))), var = var)
+    if is_legacy:
+        return adata
+    return adata[:, adata.var['feature_types'] == 'Gene Expression'].copy()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Read a 10X directory and save its cache')
+    parser.add_argument('path', help = '10X directory')
+    parser.add_argument('--cache-dir', help = 'Directory of the cache (.mtx_cache next to the 10X directory by default)')
+    parser.add_argument('--threads', type = int, help = 'Number of threads parsing matrix.mtx')
+    args = parser.parse_args()
+
+    adata = read_10x(args.path, args.cache_dir, args.threads)
+    print(f'{adata.n_obs} cells, {adata.n_vars} genes')
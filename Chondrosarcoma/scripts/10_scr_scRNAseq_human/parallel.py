@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Parallel processing of the datasets
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module runs the steps done for each dataset (creation of the objects, filters) in a pool of processes. The memory
+# needed by each dataset is estimated from the number of non-zero values of its matrix (header of matrix.mtx or size of X in the h5ad
+# file) and a dataset is started only if the memory of the running datasets plus its own stays under a limit (80 % of the available
+# memory by default), the largest datasets first. A dataset larger than the limit runs alone. The errors of a dataset are reported at
+# the end without stopping the others. When a process is killed (e.g. out of memory), the datasets that were running are started again
+# one by one and only the dataset killed when running alone is reported.
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import gzip
+import multiprocessing
+import os
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from storage import open_store
+
+# Bytes per non-zero value (float32 value and int32 index) and number of copies of the matrix during a step (reading, CSR conversion,
+# QC metrics, filtered copy)
+BYTES_PER_VALUE = 8
+MATRIX_COPIES = 4
+# Memory of a process with scanpy imported
+BASE_MEMORY = 300 * 1024 ** 2
+
+
+def available_memory():
+    """
+    Available memory in bytes (MemAvailable of /proc/meminfo, the physical memory if it is not found)
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for lig in f:
+                if lig.startswith('MemAvailable:'):
+                    return int(lig.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def matrix_values(path):
+    """
+    Number of values stored in the matrix of a 10X directory or an h5ad/zarr object, without reading the matrix
+
+    Input:
+        path (str): 10X directory (matrix.mtx or matrix.mtx.gz) or h5ad/zarr object
+
+    Output:
+        Number of non-zero values (all the values for a dense X), None if the file is not found
+    """
+    if os.path.isdir(path) and not path.rstrip('/\\').endswith('.zarr'):
+        for file in ['matrix.mtx.gz', 'matrix.mtx']:
+            path_matrix = os.path.join(path, file)
+            if os.path.exists(path_matrix):
+                with (gzip.open if file.endswith('.gz') else open)(path_matrix, 'rt') as f:
+                    for lig in f:
+                        if not lig.startswith('%'):
+                            return int(lig.split()[2])
+        return None
+    if not os.path.exists(path):
+        return None
+    with open_store(path) as f:
+        if f['X'].attrs.get('encoding-type', '') in ('csr_matrix', 'csc_matrix'):
+            return f['X']['data'].shape[0]
+        return f['X'].size
+
+
+def estimate_memory(path):
+    """
+    Memory in bytes needed to create or filter the object of a dataset (unreadable files are reported by the job itself)
+    """
+    try:
+        n_values = matrix_values(path)
+    except (OSError, ValueError, IndexError, KeyError):
+        n_values = None
+    return BASE_MEMORY + (n_values or 0) * BYTES_PER_VALUE * MATRIX_COPIES
+
+
+def init_worker():
+    # No graphical backend in the processes (the figures are only saved)
+    import matplotlib
+    matplotlib.use('Agg', force = True)
+
+
+def call(func, args, kwargs):
+    """
+    Run a job in a process, the error is returned as text to be reported by the main process
+    """
+    try:
+        return True, func(*args, **kwargs)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def start_method():
+    """
+    Start method of the processes: fork on Linux only (it keeps the functions of the main script available), spawn elsewhere, where
+    forking is missing or unsafe (macOS after Tk/Cocoa was initialized, which is why Python uses spawn by default there)
+    """
+    return 'fork' if sys.platform.startswith('linux') else 'spawn'
+
+
+def run_parallel(func, d_jobs, workers = None, max_memory = None, d_memory = None):
+    """
+    Run a function for several datasets in a pool of processes with a memory limit
+
+    Input:
+        func (function): Function run for each dataset, importable by the processes (e.g. create_anndata_object)
+        d_jobs (dict): Dataset name -> tuple (args, kwargs) of func
+        workers (int): Number of processes, the number of cores if None, the jobs are run in this process if 1
+        max_memory (int): Memory limit in bytes for the running jobs, 80 % of the available memory if None
+        d_memory (dict): Dataset name -> estimated memory in bytes (see estimate_memory), 0 for the missing datasets
+
+    Output:
+        Tuple of dictionaries (dataset name -> result of func, dataset name -> error message)
+    """
+    d_results, d_errors = {}, {}
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        for name, (args, kwargs) in d_jobs.items():
+            ok, result = call(func, args, kwargs)
+            (d_results if ok else d_errors)[name] = result
+        return d_results, d_errors
+
+    if max_memory is None:
+        available = available_memory()
+        max_memory = int(available * 0.8) if available else float('inf')
+    d_memory = d_memory or {}
+
+    # Largest datasets first, so the small ones fill the remaining memory
+    l_pending = sorted(d_jobs, key = lambda name: d_memory.get(name, 0), reverse = True)
+    context = multiprocessing.get_context(start_method())
+    executor = ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = init_worker)
+    d_running = {}
+    used = 0
+    s_alone = set()
+    try:
+        while l_pending or d_running:
+            # Start the pending datasets that fit in the memory, a dataset larger than the limit runs alone
+            for name in list(l_pending):
+                if len(d_running) >= workers or any(running in s_alone for running in d_running.values()):
+                    break
+                memory = d_memory.get(name, 0)
+                if d_running and (used + memory > max_memory or name in s_alone):
+                    continue
+                args, kwargs = d_jobs[name]
+                d_running[executor.submit(call, func, args, kwargs)] = name
+                l_pending.remove(name)
+                used += memory
+
+            done, _ = wait(d_running, return_when = FIRST_COMPLETED)
+            l_killed = []
+            for future in done:
+                name = d_running.pop(future)
+                used -= d_memory.get(name, 0)
+                try:
+                    ok, result = future.result()
+                    (d_results if ok else d_errors)[name] = result
+                except BrokenProcessPool:
+                    l_killed.append(name)
+
+            # A killed process stops the whole pool: the datasets that were running are started again alone in a new pool, so only
+            # the dataset killed when running alone is reported
+            if l_killed:
+                l_killed += list(d_running.values())
+                d_running, used = {}, 0
+                executor.shutdown(wait = True)
+                executor = ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = init_worker)
+                for name in l_killed:
+                    if name in s_alone:
+                        d_errors[name] = 'The process was killed (out of memory?)'
+                    else:
+                        s_alone.add(name)
+                        l_pending.insert(0, name)
+    finally:
+        executor.shutdown(wait = True)
+    return d_results, d_errors
+
+
+def report_errors(d_errors, step):
+    """
+    Print the errors of the datasets of a step
+    """
+    for name, error in d_errors.items():
+        print(f'{step} failed for {name}:\n{error}')
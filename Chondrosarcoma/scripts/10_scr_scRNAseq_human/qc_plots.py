@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : QC violin plots drawn in a background process
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module draws the QC violin plots of create_anndata_object and apply_filters (n_genes_by_counts, total_counts,
+# pct_counts_MT). The violins and the quartiles are computed from all the cells, but only a random subset of cells is drawn as points
+# (5000 by default), rasterized in the PDF, so the size and the time of a plot don't grow with the number of cells. With a PlotWorker,
+# the plots are drawn by a separate process while the pipeline goes on (the processes of parallel.py send their plots to the same
+# worker), and the pipeline waits for them only at the end of the run.
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import multiprocessing
+import traceback
+import numpy as np
+from parallel import start_method
+
+QC_KEYS = ['n_genes_by_counts', 'total_counts', 'pct_counts_MT']
+
+
+def density(values, coords, bins = 2048):
+    """
+    Gaussian kernel density of all the values (Scott bandwidth, as the violins of matplotlib) computed on a fine histogram, so the time
+    depends on the number of bins and not on the number of cells
+    """
+    counts, edges = np.histogram(values, bins = bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    bandwidth = max(values.std(ddof = 1) * len(values) ** (-1 / 5), (edges[1] - edges[0]) / 2)
+    kernel = np.exp(-0.5 * ((coords[:, None] - centers[None, :]) / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    return kernel @ counts / len(values)
+
+
+def violin_plot(path, d_values, max_points = 5000, rasterized = True, seed = 0):
+    """
+    Draw one violin per QC metric with the quartiles and a subset of the cells as jittered points
+
+    Input:
+        path (str): Output file (pdf, png...)
+        d_values (dict): Metric name -> values per cell
+        max_points (int): Maximum number of cells drawn as points (0 for none)
+        rasterized (bool): Points rasterized in vector formats
+        seed (int): Seed of the subset of cells and of the jitter
+    """
+    from matplotlib import pyplot as plt
+    from matplotlib.cbook import violin_stats
+
+    rng = np.random.default_rng(seed)
+    fig, axes = plt.subplots(1, len(d_values), figsize = (3.2 * len(d_values), 4), squeeze = False)
+    for ax, (key, values) in zip(axes[0], d_values.items()):
+        values = np.asarray(values, dtype = np.float64)
+        values = values[np.isfinite(values)]
+        ax.set_title(key)
+        ax.set_xticks([])
+        if len(values) == 0:
+            continue
+        # Density of all the cells (a constant metric has no density)
+        if len(values) > 1 and values.min() < values.max():
+            stats = violin_stats(values[:, None], lambda x, coords: density(x, coords), points = 200)
+            parts = ax.violin(stats, positions = [0], widths = 0.8, showextrema = False)
+            for body in parts['bodies']:
+                body.set_alpha(0.6)
+        # Subset of the cells as points
+        if max_points:
+            points = values if len(values) <= max_points else rng.choice(values, max_points, replace = False)
+            ax.scatter(rng.uniform(-0.2, 0.2, len(points)), points, s = 1.6, c = 'black', alpha = 0.5, linewidths = 0,
+                       rasterized = rasterized)
+        # Quartiles of all the cells
+        q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        ax.vlines(0, q1, q3, color = 'tab:red', linewidth = 3)
+        ax.hlines(median, -0.15, 0.15, color = 'white', linewidth = 2)
+        ax.set_xlabel(f'n = {len(values)}, median = {median:.4g}')
+    fig.tight_layout()
+    fig.savefig(path, bbox_inches = 'tight', dpi = 200)
+    plt.close(fig)
+
+
+def qc_values(obs, keys = QC_KEYS):
+    """
+    QC metrics of the cells sent to the plots (only these columns, not the object)
+    """
+    return {key: obs[key].to_numpy() for key in keys}
+
+
+def worker_loop(queue, results):
+    # Draw the plots of the queue until None, the errors are sent back with the path of the plot
+    import matplotlib
+    matplotlib.use('Agg', force = True)
+    while True:
+        job = queue.get()
+        if job is None:
+            break
+        path, d_values, max_points, rasterized = job
+        try:
+            violin_plot(path, d_values, max_points, rasterized)
+        except Exception:
+            results.put((path, traceback.format_exc()))
+    results.put(None)
+
+
+class PlotWorker:
+    """
+    Background process drawing the QC plots, the queue can be used by several processes (the object is sent to the processes of
+    parallel.py with the jobs)
+
+    Input:
+        max_points (int): Maximum number of cells drawn as points per metric
+        rasterized (bool): Points rasterized in the PDF files
+    """
+
+    def __init__(self, max_points = 5000, rasterized = True):
+        self.max_points = max_points
+        self.rasterized = rasterized
+        context = multiprocessing.get_context(start_method())
+        self.manager = context.Manager()
+        self.queue = self.manager.Queue()
+        self.results = self.manager.Queue()
+        self.process = context.Process(target = worker_loop, args = (self.queue, self.results), daemon = True)
+        self.process.start()
+
+    def __getstate__(self):
+        # Only the queue is sent to the other processes, they can submit plots but not wait for them
+        return {'max_points': self.max_points, 'rasterized': self.rasterized, 'queue': self.queue, 'results': None,
+                'manager': None, 'process': None}
+
+    def submit(self, path, d_values):
+        self.queue.put((path, d_values, self.max_points, self.rasterized))
+
+    def wait(self):
+        """
+        Wait for all the plots submitted and stop the worker
+
+        Output:
+            Dictionary plot path -> error message of the plots that failed
+        """
+        if self.process is None:
+            raise RuntimeError('Only the process that created the PlotWorker can wait for the plots')
+        self.queue.put(None)
+        d_errors = {}
+        while True:
+            result = self.results.get()
+            if result is None:
+                break
+            d_errors[result[0]] = result[1]
+        self.process.join()
+        self.manager.shutdown()
+        return d_errors
+
+
+def plot_qc(plots, path, obs, max_points = 5000):
+    """
+    Draw the QC violin plot of the cells of obs, in the background with a PlotWorker or now if plots is None
+    """
+    if plots is None:
+        violin_plot(path, qc_values(obs), max_points)
+    else:
+        plots.submit(path, qc_values(obs))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : QC metrics saved with the objects and preview of the filters
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module saves the QC metrics of an object (n_genes_by_counts, total_counts, pct_counts_MT per cell and number of
+# cells per gene) in a small npz file next to the object, when the object is created. From this file, the numbers of cells and genes
+# kept by apply_filters are computed for a whole grid of thresholds at once, without reading the object. The genes kept depend on the
+# cells kept by min_genes (sc.pp.filter_genes runs after sc.pp.filter_cells), so the file also contains, for each gene, the number of
+# cells expressing it per number of genes of the cells.
+#
+# Usage :
+#   python qc_sweep.py ../../results/sc_results/chondro/Objects/Objects_ori/object_1_Low_L07_ori.h5ad --min-genes 100,200,300
+#       --min-cells 3,5 --pct-mt 5,10,20
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from storage import matrix_element, open_store, strip_extension
+try:
+    from anndata.io import read_elem
+except ImportError:
+    from anndata.experimental import read_elem
+
+
+def qc_path(path_object):
+    """
+    QC file of an object: Objects_ori/qc/object_name_ori.qc.npz for Objects_ori/object_name_ori.h5ad (or .zarr)
+    """
+    directory, file = os.path.split(path_object.rstrip('/\\'))
+    return os.path.join(directory, 'qc', strip_extension(file) + '.qc.npz')
+
+
+def compute_qc(X, obs):
+    """
+    QC metrics of an object
+
+    Input:
+        X (scipy sparse matrix or np.ndarray): Counts, cells x genes
+        obs (DataFrame): Observations with total_counts and pct_counts_MT (sc.pp.calculate_qc_metrics)
+
+    Output:
+        Dictionary of arrays: n_genes_by_counts, total_counts, pct_counts_MT (per cell), n_cells_by_counts (per gene), levels (sorted
+        numbers of genes of the cells) and the matrix genes x levels of the number of cells expressing each gene (CSR arrays
+        hist_data, hist_indices, hist_indptr)
+    """
+    X = sp.csr_matrix(X)
+    expressed = X.data > 0
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))[expressed]
+    genes = X.indices[expressed]
+    n_genes = np.bincount(rows, minlength = X.shape[0])
+    levels, cell_levels = np.unique(n_genes, return_inverse = True)
+    hist = sp.csr_matrix((np.ones(len(genes), dtype = np.int32), (genes, cell_levels[rows])), shape = (X.shape[1], len(levels)))
+    hist.sum_duplicates()
+    return {'n_genes_by_counts': n_genes.astype(np.int32), 'total_counts': obs['total_counts'].to_numpy(np.float64),
+            'pct_counts_MT': obs['pct_counts_MT'].to_numpy(np.float64),
+            'n_cells_by_counts': np.bincount(genes, minlength = X.shape[1]).astype(np.int32), 'levels': levels.astype(np.int32),
+            'hist_data': hist.data, 'hist_indices': hist.indices, 'hist_indptr': hist.indptr}
+
+
+def write_qc(adata, path_object):
+    """
+    Save the QC metrics of an object created by create_anndata_object (path_object is the h5ad/zarr file of the object)
+    """
+    path = qc_path(path_object)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    np.savez(path, **compute_qc(adata.X, adata.obs))
+    return path
+
+
+def load_qc(path_object):
+    """
+    QC metrics of an object, computed from the h5ad/zarr file and saved if the QC file doesn't exist (objects created before)
+
+    Output:
+        Dictionary of arrays (see compute_qc)
+    """
+    path = qc_path(path_object)
+    if not os.path.exists(path):
+        with open_store(path_object) as f:
+            obs = read_elem(f['obs'])
+            matrix = matrix_element(f['X'])
+            X = matrix.to_memory() if hasattr(matrix, 'to_memory') else matrix[()]
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        np.savez(path, **compute_qc(X, obs))
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def sweep(qc, min_genes, min_cells, pct_mt):
+    """
+    Numbers of cells and genes kept by apply_filters for all the combinations of thresholds
+
+    Input:
+        qc (dict): QC metrics (see load_qc)
+        min_genes, min_cells, pct_mt (list of numbers): Thresholds tested
+
+    Output:
+        DataFrame with one line per combination: min_genes, min_cells, max_pct_mt, nb_cells_after, nb_genes_after
+    """
+    min_genes = np.asarray(min_genes)
+    min_cells = np.asarray(min_cells)
+    pct_mt = np.asarray(pct_mt)
+    n_genes, pct = qc['n_genes_by_counts'], qc['pct_counts_MT']
+    hist = sp.csr_matrix((qc['hist_data'], qc['hist_indices'], qc['hist_indptr']),
+                         shape = (len(qc['n_cells_by_counts']), len(qc['levels'])))
+    hist_rows = np.repeat(np.arange(hist.shape[0]), np.diff(hist.indptr))
+
+    nb_cells = np.empty((len(min_genes), len(pct_mt)), dtype = np.int64)
+    nb_genes = np.empty((len(min_genes), len(min_cells)), dtype = np.int64)
+    for i, threshold in enumerate(min_genes):
+        # Cells kept by min_genes, then by the percentage of mitochondrial genes (strict, as in apply_filters)
+        kept = n_genes >= threshold
+        nb_cells[i] = np.searchsorted(np.sort(pct[kept]), pct_mt, side = 'left')
+        # Number of these cells expressing each gene, then genes with at least min_cells cells
+        from_level = hist.indices >= np.searchsorted(qc['levels'], threshold, side = 'left')
+        cells_per_gene = np.bincount(hist_rows[from_level], weights = hist.data[from_level], minlength = hist.shape[0])
+        nb_genes[i] = len(cells_per_gene) - np.searchsorted(np.sort(cells_per_gene), min_cells, side = 'left')
+
+    i_genes, i_cells, i_mt = np.meshgrid(np.arange(len(min_genes)), np.arange(len(min_cells)), np.arange(len(pct_mt)), indexing = 'ij')
+    return pd.DataFrame({'min_genes': min_genes[i_genes.ravel()], 'min_cells': min_cells[i_cells.ravel()],
+                         'max_pct_mt': pct_mt[i_mt.ravel()], 'nb_cells_after': nb_cells[i_genes.ravel(), i_mt.ravel()],
+                         'nb_genes_after': nb_genes[i_genes.ravel(), i_cells.ravel()]})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Numbers of cells and genes kept for a grid of filters')
+    parser.add_argument('object', help = 'h5ad/zarr file of an object of Objects_ori')
+    parser.add_argument('--min-genes', default = '100,200,300,500', help = 'Comma-separated minimum numbers of genes per cell')
+    parser.add_argument('--min-cells', default = '3,5,10', help = 'Comma-separated minimum numbers of cells per gene')
+    parser.add_argument('--pct-mt', default = '5,10,15,20', help = 'Comma-separated maximum percentages of mitochondrial genes')
+    args = parser.parse_args()
+
+    df = sweep(load_qc(args.object), [int(x) for x in args.min_genes.split(',')], [int(x) for x in args.min_cells.split(',')],
+               [float(x) for x in args.pct_mt.split(',')])
+    print(df.to_string(index = False))
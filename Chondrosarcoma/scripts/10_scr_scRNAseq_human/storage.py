@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Storage of the objects (h5ad or zarr, chunked and compressed)
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module writes and reads the objects of Objects_ori, Objects_filtered and Objects_merged. The storage is a dictionary
+# (format h5ad or zarr, compression gzip or lzf for h5ad, number of values per chunk of X, layout csr or csc of X), the default storage
+# is the h5ad file written by adata.write. The annotations (obs, var) and subsets of cells or genes (e.g. the CTA list or MHC_genes.txt)
+# are read from the file without reading the whole matrix: a csc layout makes the subsets of genes cheap, a csr layout the subsets of
+# cells (chunks of cells read by merge).
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import anndata as ad
+import h5py
+import numpy as np
+import scipy.sparse as sp
+try:
+    from anndata.io import read_elem, sparse_dataset, write_elem
+except ImportError:
+    from anndata.experimental import read_elem, sparse_dataset, write_elem
+
+STORAGE = {'format': 'h5ad', 'compression': None, 'compression_opts': None, 'chunk_size': None, 'layout': 'csr'}
+EXTENSIONS = ('.h5ad', '.zarr')
+
+
+def get_storage(storage = None):
+    """
+    Storage completed by the default values
+    """
+    storage = {**STORAGE, **(storage or {})}
+    if storage['format'] not in ('h5ad', 'zarr'):
+        raise ValueError(f'Unknown format {storage["format"]}, use h5ad or zarr')
+    if storage['layout'] not in ('csr', 'csc'):
+        raise ValueError(f'Unknown layout {storage["layout"]}, use csr or csc')
+    return storage
+
+
+def extension(storage = None):
+    return '.' + get_storage(storage)['format']
+
+
+def strip_extension(file):
+    """
+    File name of an object without its extension (.h5ad or .zarr)
+    """
+    for ext in EXTENSIONS:
+        if file.endswith(ext):
+            return file[:-len(ext)]
+    return file
+
+
+def open_store(path, mode = 'r'):
+    """
+    Open an h5ad file or a zarr directory, to use in a with statement
+    """
+    if path.rstrip('/\\').endswith('.zarr'):
+        import zarr
+        return ZarrStore(zarr.open_group(path, mode = mode))
+    return h5py.File(path, mode)
+
+
+class ZarrStore:
+    # zarr group usable in a with statement as an h5py file
+    def __init__(self, group):
+        self.group = group
+
+    def __enter__(self):
+        return self.group
+
+    def __exit__(self, *args):
+        return False
+
+
+def matrix_element(elem):
+    """
+    Matrix of a file without reading it: sparse dataset (sliced by rows and columns) or dense array
+    """
+    if elem.attrs.get('encoding-type', '') in ('csr_matrix', 'csc_matrix'):
+        return sparse_dataset(elem)
+    return elem
+
+
+def dataset_kwargs(storage, n_values):
+    """
+    Arguments of the datasets of X: compression (h5ad only, zarr uses its default compressor) and chunks
+    """
+    kwargs = {}
+    if storage['format'] == 'h5ad' and storage['compression']:
+        kwargs['compression'] = storage['compression']
+        if storage['compression_opts'] is not None:
+            kwargs['compression_opts'] = storage['compression_opts']
+    if storage['chunk_size'] and n_values:
+        kwargs['chunks'] = (min(storage['chunk_size'], n_values),)
+    return kwargs
+
+
+def write_object(adata, path, storage = None):
+    """
+    Write an object with a storage
+
+    Input:
+        adata (AnnData): Object
+        path (str): Output file (.h5ad) or directory (.zarr)
+        storage (dict): See STORAGE, the file written by adata.write if None
+    """
+    storage = get_storage(storage)
+    if storage == STORAGE:
+        adata.write(path)
+        return
+
+    # Annotations written by anndata, then X with its layout, chunks and compression
+    X = adata.X
+    if sp.issparse(X):
+        X = X.tocsc() if storage['layout'] == 'csc' else X.tocsr()
+    annotations = ad.AnnData(obs = adata.obs, var = adata.var, uns = adata.uns, obsm = adata.obsm, varm = adata.varm,
+                             layers = adata.layers, obsp = adata.obsp, varp = adata.varp)
+    # String columns saved as categories, as adata.write does
+    annotations.strings_to_categoricals()
+    if storage['format'] == 'zarr':
+        # Metadata not consolidated (as write_zarr does), so X can be written or appended after the annotations
+        with open_store(path, 'w') as f:
+            write_elem(f, '/', annotations)
+    else:
+        annotations.write_h5ad(path, compression = storage['compression'], compression_opts = storage['compression_opts'])
+    if X is not None:
+        with open_store(path, 'a') as f:
+            if 'X' in f:
+                del f['X']
+            # The chunks are set on the values of the sparse matrices, a dense X keeps the chunks of h5py/zarr
+            write_elem(f, 'X', X, dataset_kwargs = dataset_kwargs(storage, X.nnz if sp.issparse(X) else None))
+
+
+def append_rows(f, X, storage, matrix = None):
+    """
+    Add a CSR chunk of cells to the X of an open file (merge by chunks), X is created with the first chunk
+
+    Output:
+        Sparse dataset of X, to give to the next calls
+    """
+    if matrix is None:
+        if 'X' in f:
+            del f['X']
+        write_elem(f, 'X', X, dataset_kwargs = dataset_kwargs(get_storage(storage), max(X.nnz, 1)))
+        return sparse_dataset(f['X'])
+    matrix.append(X)
+    return matrix
+
+
+def read_object(path):
+    """
+    Read a whole object (.h5ad or .zarr)
+    """
+    if path.rstrip('/\\').endswith('.zarr'):
+        return ad.read_zarr(path)
+    return ad.read_h5ad(path)
+
+
+def read_obs_var(path):
+    """
+    obs and var of an object without reading X
+
+    Output:
+        Tuple (obs, var)
+    """
+    with open_store(path) as f:
+        return read_elem(f['obs']), read_elem(f['var'])
+
+
+def read_subset(path, cells = None, genes = None):
+    """
+    Read a subset of the cells and genes of an object, only the needed part of X is read for the sparse layouts (the columns of the
+    genes for csc, the rows of the cells for csr)
+
+    Input:
+        path (str): Object file
+        cells (np.ndarray): Positions of the cells (sorted), all the cells if None
+        genes (np.ndarray): Positions of the genes (sorted), all the genes if None
+
+    Output:
+        AnnData object with X, obs and var of the subset
+    """
+    obs, var = read_obs_var(path)
+    cells = slice(None) if cells is None else np.asarray(cells)
+    genes = slice(None) if genes is None else np.asarray(genes)
+    with open_store(path) as f:
+        matrix = matrix_element(f['X'])
+        # The axis of the layout is selected first (contiguous parts of the file)
+        if getattr(matrix, 'format', None) == 'csc':
+            X = matrix[:, genes][cells]
+        else:
+            X = matrix[cells][:, genes]
+    return ad.AnnData(X = X, obs = obs.iloc[cells], var = var.iloc[genes])
+
+
+def read_genes(path, genes):
+    """
+    Read a subset of genes of an object (genes missing in the object are skipped)
+
+    Input:
+        path (str): Object file
+        genes (iterable of str): Gene names, e.g. the lines of CTA_list_clean.txt or MHC_genes.txt
+    """
+    _, var = read_obs_var(path)
+    return read_subset(path, genes = np.flatnonzero(var.index.isin(list(genes))))
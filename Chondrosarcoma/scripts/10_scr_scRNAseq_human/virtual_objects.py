@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Filtered objects saved as masks of the original objects
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module saves a filtered object as a small npz file (object_name_filtered_N.mask.npz in Objects_filtered) with the
+# masks of the cells and genes kept (packed bits), the filters and the n_genes / n_cells columns added by scanpy, instead of a copy of
+# the matrix. The file references the original object of Objects_ori, whose cells and genes kept are read (see storage.read_subset)
+# only when the filtered object is used (merge, analysis), so several filters of a dataset take almost no space and no time to write.
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load packages
+import os
+import numpy as np
+from storage import read_obs_var, read_object, read_subset
+
+EXTENSION = '.mask.npz'
+
+
+def is_virtual(file):
+    return file.endswith(EXTENSION)
+
+
+def source_path(path):
+    """
+    Original object of a mask file: Objects/Objects_ori/source for Objects/Objects_filtered/object_name_filtered_N.mask.npz
+    """
+    with np.load(path) as data:
+        source = str(data['source'])
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(path))), 'Objects_ori', source)
+
+
+def write_mask(path, source, cells, genes, n_genes, n_cells, filters):
+    """
+    Save a filtered object as masks of its original object
+
+    Input:
+        path (str): Mask file (.mask.npz) in Objects/Objects_filtered
+        source (str): File name of the original object in Objects/Objects_ori
+        cells, genes (np.ndarray of bool): Cells and genes kept
+        n_genes (np.ndarray): Number of genes of the cells kept (obs column n_genes added by sc.pp.filter_cells)
+        n_cells (np.ndarray): Number of cells of the genes kept (var column n_cells added by sc.pp.filter_genes)
+        filters (dict): Filters applied (min_genes, min_cells, max_pct_mt)
+    """
+    stat = os.stat(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(path))), 'Objects_ori', source))
+    np.savez(path, source = np.array(source), source_size = stat.st_size, source_mtime_ns = stat.st_mtime_ns,
+             cells = np.packbits(cells), n_obs = len(cells), genes = np.packbits(genes), n_vars = len(genes),
+             n_genes = n_genes, n_cells = n_cells, filter_names = np.array(list(filters)),
+             filter_values = np.array(list(filters.values()), dtype = np.float64))
+
+
+def read_mask(path):
+    """
+    Content of a mask file
+
+    Output:
+        Dictionary: source (path of the original object), cells and genes (np.ndarray of bool), n_genes, n_cells and filters (dict)
+    """
+    with np.load(path) as data:
+        d_mask = {'source': source_path(path), 'cells': np.unpackbits(data['cells'], count = int(data['n_obs'])).astype(bool),
+                  'genes': np.unpackbits(data['genes'], count = int(data['n_vars'])).astype(bool), 'n_genes': data['n_genes'],
+                  'n_cells': data['n_cells'], 'filters': dict(zip(data['filter_names'].tolist(), data['filter_values'].tolist()))}
+        size, mtime_ns = int(data['source_size']), int(data['source_mtime_ns'])
+    stat = os.stat(d_mask['source'])
+    if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+        raise ValueError(f'{d_mask["source"]} changed since {os.path.basename(path)} was created, apply the filters again')
+    return d_mask
+
+
+def read_annotations(path):
+    """
+    obs and var of a filtered object (h5ad/zarr file or mask file) without reading the matrix
+
+    Output:
+        Tuple (file of the matrix, cells kept in this file or None for all, genes kept or None for all, obs, var)
+    """
+    if not is_virtual(path):
+        return (path, None, None) + read_obs_var(path)
+    d_mask = read_mask(path)
+    obs, var = read_obs_var(d_mask['source'])
+    obs = obs[d_mask['cells']].copy()
+    var = var[d_mask['genes']].copy()
+    obs['n_genes'] = d_mask['n_genes']
+    var['n_cells'] = d_mask['n_cells']
+    return d_mask['source'], d_mask['cells'], d_mask['genes'], obs, var
+
+
+def read_filtered(path):
+    """
+    Read a filtered object, only the cells and genes kept of the original object are read for a mask file
+
+    Output:
+        AnnData object (the same as the full copy written by apply_filters)
+    """
+    if not is_virtual(path):
+        return read_object(path)
+    source, cells, genes, obs, var = read_annotations(path)
+    adata = read_subset(source, np.flatnonzero(cells), np.flatnonzero(genes))
+    # Unused categories are removed as in the copy of a subset
+    for df in [obs, var]:
+        for key in df.select_dtypes('category'):
+            df[key] = df[key].cat.remove_unused_categories()
+    adata.obs = obs
+    adata.var = var
+    return adata
@@ -3,59 +3,32 @@
 # Python script : Compute transcripts per million from pseudo-bulk scRNAseq
 # Auteur  : Léa ROGUE
 # Date    : 26-03-2025
-# Description : This python script read anndata object, extract counts and summary it per samples. Next, lengths of genes are search and
-# calculated in gtf file. Then TPM are computed and saved.
+# Description : This python script read anndata object by chunks, extract counts and summary it per samples. Next, lengths of genes are search and
+# calculated in gtf file (from the gene length index of the gtf file). Then TPM are computed on the sparse or dense layer and saved.
 # ----------------------------------------------------------------------------------------------------------------------------------------
 
 # Load libraries
-import pandas as pd
-import scanpy as sc
-import anndata as ad
-from collections import defaultdict
-import re
-from bioinfokit.analys import norm
-
-# Read object created with scRNAseq tool from my M1 internship
-adata = ad.read_h5ad("../../results/sc_results/chondro_pseudo_bulk/Objects/Objects_merged/object_merged_1.h5ad")
-
-# Aggregate counts
-aggr = sc.get.aggregate(adata, by = 'dataset', func = 'sum')
-
-# Transform and save the df
-df = aggr.to_df(layer="sum")
-#df.to_csv('matrix_pseudo_bulk.tsv', sep='\t', index=True)
-
-# List of genes
-l = list(df.columns)
-
-# Read GTF file
-d_length = defaultdict(int)
-with open('../../data/Homo_sapiens.GRCh38.113.gtf', 'r') as f:
-    for lig in f:
-        lig = lig.strip()
-        lig = lig.split('\t')
-        if len(lig) == 9 and lig[2] == 'exon':
-            match = re.search(r'gene_name "([^"]+)"', lig[8])
-            if match:
-                gene_name = match.group(1)  # Extract name
-                if gene_name in l:
-                    d_length[gene_name] += abs(int(lig[4]) - int(lig[3]) + 1)
-
-# Convert
-lengths = pd.Series(d_length)
-
-# Transpose df to have genes in index
-df_transposed = df.T
-
-# Filter
-df_transposed = df_transposed[df_transposed.index.isin(d_length.keys())]
-
-# Add length column and save
-df_transposed['length'] = df_transposed.index.map(lengths)
-df_transposed.to_csv("../results/matrix_pseudo_bulk_length.tsv", sep='\t', index=True)
-
-# TPM computing and save
-nm = norm()
-tpm_norm = nm.tpm(df=df_transposed, gl='length')
-df_tpm = nm.tpm_norm
-df_tpm.to_csv("../../results/matrix_pseudo_bulk_tpm_normalized.tsv", sep='\t', index=True)
+from gtf_index import gene_lengths
+from pseudo_bulk import aggregate_h5ad
+from tpm_normalization import layer_to_frame, normalize_anndata
+
+# Aggregate counts per dataset of the object created with scRNAseq tool from my M1 internship, the object is read by chunks of cells
+# (see pseudo_bulk.py, other obs keys can be added to by)
+aggr = aggregate_h5ad("../../results/sc_results/chondro_pseudo_bulk/Objects/Objects_merged/object_merged_1.h5ad", by = ['dataset'],
+                      funcs = ('sum',))
+
+# Lengths of the genes of the object (union of their exons), read from the index of the GTF file (built at the first run, see
+# gtf_index.py)
+lengths = gene_lengths('../../data/Homo_sapiens.GRCh38.113.gtf', aggr.var_names)
+
+# TPM computing on the sum layer, without converting it to a dense DataFrame (see tpm_normalization.py)
+normalize_anndata(aggr, lengths, method = 'tpm', layer = 'sum', key_added = 'tpm')
+
+# Filter genes with a length
+aggr = aggr[:, lengths.index]
+
+# Save counts with length column and TPM (genes in lines, samples in columns)
+df_length = layer_to_frame(aggr, 'sum')
+df_length['length'] = lengths
+df_length.to_csv("../results/matrix_pseudo_bulk_length.tsv", sep='\t', index=True)
+layer_to_frame(aggr, 'tpm').to_csv("../../results/matrix_pseudo_bulk_tpm_normalized.tsv", sep='\t', index=True)
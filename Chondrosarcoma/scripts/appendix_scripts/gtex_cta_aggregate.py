@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python script : Mean and quantiles of the CTA expression per normal tissue from GTEx, compared with the pseudo-bulk TPM
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script computes the same matrix as 07_expression_cta_normal_tissues_gtex.R (mean TPM of each CTA and housekeeping
+# gene per tissue of GTEx) without reading the whole GCT file: the gzipped file is read line by line and only the lines of the CTA and
+# housekeeping genes are parsed. The samples of the GCT columns are mapped once to their tissue (SMTS of SampleAttributesDS, RNASEQ
+# samples) as an array of tissue codes, so the mean and the quantiles of each tissue are computed from each gene line in the same pass,
+# with the memory of one line and of the results. The means are saved with the layout of the R script (tissues in lines, genes in
+# columns), the quantiles as a table gene x tissue, and the means are added to the pseudo-bulk TPM matrix (genes in lines) for the
+# genes of this matrix, to compare the datasets of scRNAseq with the normal tissues gene by gene.
+#
+# Usage :
+#   python gtex_cta_aggregate.py
+#   python gtex_cta_aggregate.py --gct ../../data/GTEx_Analysis_v10_RNASeQCv2.4.2_gene_tpm.gct.gz --quantiles 0.1,0.5,0.9
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load libraries
+import argparse
+import gzip
+import numpy as np
+import pandas as pd
+
+HOUSEKEEPING_GENES = ('EGFR', 'ERBB2', 'FOLH1', 'SSTR1', 'SSTR2', 'SSTR3', 'SSTR4', 'SSTR5')
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def sample_tissues(path):
+    """
+    Tissue (SMTS) of the GTEx RNAseq samples, as selected by 07_expression_cta_normal_tissues_gtex.R
+
+    Input:
+        path (str): GTEx_Analysis_v10_Annotations_SampleAttributesDS.txt
+
+    Output:
+        Series sample id -> tissue
+    """
+    df_samples = pd.read_csv(path, sep = '\t', usecols = ['SAMPID', 'SMTS', 'SMAFRZE'], dtype = str)
+    df_samples = df_samples[df_samples['SAMPID'].str.contains('GTEX') & (df_samples['SMAFRZE'] == 'RNASEQ')]
+    return df_samples.set_index('SAMPID')['SMTS']
+
+
+def tissue_codes(columns, tissues):
+    """
+    Tissue code of each sample column of the GCT file
+
+    Input:
+        columns (list of str): Sample ids of the GCT header (without Name and Description)
+        tissues (pd.Series): Sample id -> tissue (see sample_tissues)
+
+    Output:
+        Tuple (code of each column, -1 for the samples without tissue; tissue names sorted, indexed by the codes)
+    """
+    codes, names = pd.factorize(pd.Series(columns).map(tissues), sort = True)
+    return codes, pd.Index(names)
+
+
+def segment_quantiles(values, starts, counts, quantiles):
+    """
+    Quantiles of consecutive segments of sorted values, with the linear interpolation of np.quantile
+
+    Input:
+        values (np.ndarray): Values sorted inside each segment
+        starts, counts (np.ndarray): Start and length of each segment (length > 0)
+        quantiles (np.ndarray): Quantiles between 0 and 1
+
+    Output:
+        Array segments x quantiles
+    """
+    position = starts[:, None] + quantiles[None, :] * (counts[:, None] - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, (starts + counts - 1)[:, None])
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def aggregate_gct(path, genes, tissues, quantiles = QUANTILES):
+    """
+    Mean and quantiles of the TPM per tissue for some genes of a GCT file, read line by line
+
+    Input:
+        path (str): GCT file (gzipped or not), genes in lines with Name and Description (gene symbol) columns
+        genes (iterable of str): Gene symbols kept, the first line of a symbol is kept if it is in several lines
+        tissues (pd.Series): Sample id -> tissue (see sample_tissues)
+        quantiles (tuple of float): Quantiles computed per tissue
+
+    Output:
+        Tuple (DataFrame of the means, genes in lines in the order of the file and tissues in columns; DataFrame of the number of
+        samples, the mean and the quantiles, one line per gene x tissue)
+    """
+    s_genes = set(genes)
+    quantiles = np.asarray(quantiles, dtype = np.float64)
+    with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as f:
+        # Version and dimensions lines, then the header
+        f.readline()
+        f.readline()
+        codes, names = tissue_codes(f.readline().rstrip('\n').split('\t')[2:], tissues)
+
+        # Columns sorted by tissue, the samples of a tissue are a segment of the sorted columns
+        order = np.argsort(codes, kind = 'stable')
+        order = order[codes[order] >= 0]
+        codes_sorted = codes[order]
+        counts = np.bincount(codes_sorted, minlength = len(names))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        used = counts > 0
+
+        l_genes, l_means, l_quantiles = [], [], []
+        for lig in f:
+            # Only the two first fields are split for the genes not kept
+            _, gene, values = lig.split('\t', 2)
+            if gene not in s_genes:
+                continue
+            s_genes.discard(gene)
+            values = np.array(values.split('\t'), dtype = np.float64)[order]
+            l_genes.append(gene)
+            l_means.append(np.bincount(codes_sorted, weights = values, minlength = len(names))[used] / counts[used])
+            values = values[np.lexsort((values, codes_sorted))]
+            l_quantiles.append(segment_quantiles(values, starts[used], counts[used], quantiles))
+
+    names = names[used]
+    df_means = pd.DataFrame(np.array(l_means).reshape(len(l_genes), len(names)), index = pd.Index(l_genes, name = 'gene'),
+                            columns = names)
+    df_stats = pd.DataFrame({'gene': np.repeat(l_genes, len(names)), 'tissue': np.tile(names, len(l_genes)),
+                             'n_samples': np.tile(counts[used], len(l_genes)), 'mean': df_means.to_numpy().ravel()})
+    quantile_values = np.array(l_quantiles).reshape(len(l_genes) * len(names), len(quantiles))
+    for i, q in enumerate(quantiles):
+        df_stats[f'q{q * 100:g}'] = quantile_values[:, i]
+    return df_means, df_stats
+
+
+def compare_pseudo_bulk(df_pseudo_bulk, df_means):
+    """
+    Pseudo-bulk TPM of the genes of the GTEx means with the mean TPM of each tissue, genes in lines in the order of the pseudo-bulk
+    matrix (NaN for a gene missing in GTEx)
+    """
+    df_pseudo_bulk = df_pseudo_bulk[df_pseudo_bulk.index.isin(df_means.index)]
+    return df_pseudo_bulk.join(df_means.add_prefix('GTEx_'), how = 'left')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Mean and quantiles of the CTA expression per GTEx tissue, compared with the pseudo-bulk')
+    parser.add_argument('--gct', default = '../../data/GTEx_Analysis_v10_RNASeQCv2.4.2_gene_tpm.gct.gz', help = 'GTEx TPM file')
+    parser.add_argument('--samples', default = '../../data/GTEx_Analysis_v10_Annotations_SampleAttributesDS.txt',
+                        help = 'GTEx sample attributes')
+    parser.add_argument('--cta', default = '../../data/CTA_list_clean.txt', help = 'List of CTA (one per line)')
+    parser.add_argument('--quantiles', default = ','.join(str(q) for q in QUANTILES), help = 'Comma-separated quantiles')
+    parser.add_argument('--pseudo-bulk', default = '../../results/matrix_pseudo_bulk_tpm_normalized.tsv',
+                        help = 'Pseudo-bulk TPM matrix of 00_appendix_pseudo_bulk_compute_tpm.py (genes in lines)')
+    parser.add_argument('--out-means', default = '../../results/matrix_expr_cta_tissues_gtex.tsv',
+                        help = 'Means per tissue, same layout as 07_expression_cta_normal_tissues_gtex.R')
+    parser.add_argument('--out-stats', default = '../../results/gtex_cta_tissues_quantiles.tsv', help = 'Quantiles per gene x tissue')
+    parser.add_argument('--out-comparison', default = '../../results/matrix_pseudo_bulk_tpm_gtex.tsv',
+                        help = 'Pseudo-bulk TPM with the GTEx means (genes in lines)')
+    args = parser.parse_args()
+
+    # CTA and housekeeping genes, as in 07_expression_cta_normal_tissues_gtex.R
+    with open(args.cta) as f:
+        l_genes = [lig.strip() for lig in f if lig.strip()]
+    l_genes += [gene for gene in HOUSEKEEPING_GENES if gene not in l_genes]
+
+    df_means, df_stats = aggregate_gct(args.gct, l_genes, sample_tissues(args.samples),
+                                       [float(q) for q in args.quantiles.split(',')])
+    print(f'{len(df_means)} genes of {len(l_genes)} found in {len(df_means.columns)} tissues')
+
+    # Save the means as the R script (tissues in lines), the quantiles and the comparison with the pseudo-bulk
+    df_means.T.rename_axis('SMTS').to_csv(args.out_means, sep = '\t')
+    df_stats.to_csv(args.out_stats, sep = '\t', index = False)
+    df_pseudo_bulk = pd.read_csv(args.pseudo_bulk, sep = '\t', index_col = 0)
+    compare_pseudo_bulk(df_pseudo_bulk, df_means).to_csv(args.out_comparison, sep = '\t')
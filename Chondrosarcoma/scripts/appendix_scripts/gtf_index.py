@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Index of the gene lengths of a GTF file
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module parses the exons of a GTF file once, with several processes on byte ranges of the file, and computes the
+# length of each gene as the length of the union of its exons (overlapping exons of different transcripts are counted once). The
+# lengths are saved in a small npz index keyed on the checksum of the GTF file, so later runs load the index instead of parsing the
+# GTF file. The checksum is saved with the size and the modification time of the file, to be computed again only if the file changed.
+#
+# Usage :
+#   python gtf_index.py ../../data/Homo_sapiens.GRCh38.113.gtf --processes 8
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load libraries
+import argparse
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+
+def gtf_checksum(path, index_dir):
+    """
+    Checksum of the GTF file, computed again only if its size or modification time changed
+
+    Input:
+        path (str): GTF file
+        index_dir (str): Directory of the index, contains the saved checksum
+
+    Output:
+        Hexadecimal blake2b digest of the file
+    """
+    stat = os.stat(path)
+    path_checksum = os.path.join(index_dir, os.path.basename(path) + '.checksum.json')
+    if os.path.exists(path_checksum):
+        with open(path_checksum, 'r') as f:
+            saved = json.load(f)
+        if saved['size'] == stat.st_size and saved['mtime_ns'] == stat.st_mtime_ns:
+            return saved['checksum']
+
+    h = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            h.update(block)
+    os.makedirs(index_dir, exist_ok = True)
+    with open(path_checksum, 'w') as f:
+        json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'checksum': h.hexdigest()}, f)
+    return h.hexdigest()
+
+
+def parse_exons(args):
+    """
+    Read the exons of the lines starting in a byte range of a GTF file
+
+    Input:
+        args (tuple): GTF file, first byte, last byte (excluded)
+
+    Output:
+        Tuple of arrays (gene names, chromosomes, starts, ends)
+    """
+    path, start, end = args
+    l_genes, l_chroms, l_starts, l_ends = [], [], [], []
+    with open(path, 'rb') as f:
+        # A line belongs to the range where it starts
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            lig = f.readline()
+            if not lig:
+                break
+            lig = lig.rstrip(b'\r\n').split(b'\t')
+            if len(lig) != 9 or lig[2] != b'exon':
+                continue
+            i = lig[8].find(b'gene_name "')
+            if i < 0:
+                continue
+            i += 11
+            l_genes.append(lig[8][i:lig[8].index(b'"', i)].decode())
+            l_chroms.append(lig[0].decode())
+            l_starts.append(int(lig[3]))
+            l_ends.append(int(lig[4]))
+    return (np.array(l_genes, dtype = object), np.array(l_chroms, dtype = object), np.array(l_starts, dtype = np.int64),
+            np.array(l_ends, dtype = np.int64))
+
+
+def merged_lengths(genes, chroms, starts, ends):
+    """
+    Length of the union of the exons of each gene
+
+    Input:
+        genes, chroms, starts, ends (np.ndarray): Exons (1-based, closed intervals)
+
+    Output:
+        Series gene -> length, sorted by gene
+    """
+    gene_ids, gene_names = pd.factorize(genes, sort = True)
+    group_ids = pd.factorize(pd.MultiIndex.from_arrays([gene_ids, chroms]))[0]
+
+    # Shift the intervals of each gene and chromosome so they never overlap the intervals of another group
+    lo = np.minimum(starts, ends) + group_ids.astype(np.int64) * (1 << 32)
+    hi = np.maximum(starts, ends) + group_ids.astype(np.int64) * (1 << 32)
+    order = np.lexsort((hi, lo))
+    lo, hi, gene_ids = lo[order], hi[order], gene_ids[order]
+
+    # Each exon adds the bases after the end of all the previous exons of its group
+    previous_end = np.concatenate([[0], np.maximum.accumulate(hi)[:-1]])
+    covered = np.maximum(0, hi - np.maximum(lo - 1, previous_end))
+    lengths = np.bincount(gene_ids, weights = covered, minlength = len(gene_names)).astype(np.int64)
+    return pd.Series(lengths, index = pd.Index(gene_names, name = 'gene'), name = 'length')
+
+
+def build_index(path, processes = None):
+    """
+    Parse the GTF file with several processes and compute the gene lengths
+
+    Input:
+        path (str): GTF file
+        processes (int): Number of processes, all the cores if None
+
+    Output:
+        Series gene -> length
+    """
+    processes = processes or os.cpu_count()
+    size = os.path.getsize(path)
+    step = max(size // (processes * 4), 1 << 20)
+    l_ranges = [(path, start, min(start + step, size)) for start in range(0, size, step)]
+    with Pool(processes) as pool:
+        l_parts = pool.map(parse_exons, l_ranges)
+    if not l_parts:
+        return pd.Series([], index = pd.Index([], name = 'gene'), name = 'length', dtype = np.int64)
+    return merged_lengths(*[np.concatenate([part[i] for part in l_parts]) for i in range(4)])
+
+
+def gene_lengths(path, genes = None, index_dir = None, processes = None):
+    """
+    Gene lengths from the index of the GTF file, the index is built if it doesn't exist
+
+    Input:
+        path (str): GTF file
+        genes (iterable of str): Genes to keep (genes missing in the GTF file are skipped), all the genes if None
+        index_dir (str): Directory of the index, the directory of the GTF file if None
+        processes (int): Number of processes used to build the index
+
+    Output:
+        Series gene -> length, in the order of genes
+    """
+    index_dir = index_dir or os.path.dirname(os.path.abspath(path))
+    path_index = os.path.join(index_dir, f'{os.path.basename(path)}.gene_lengths_{gtf_checksum(path, index_dir)}.npz')
+    if os.path.exists(path_index):
+        with np.load(path_index, allow_pickle = False) as data:
+            lengths = pd.Series(data['lengths'], index = pd.Index(data['genes'], name = 'gene'), name = 'length')
+    else:
+        lengths = build_index(path, processes)
+        # Remove the indexes of previous versions of the GTF file
+        for file in os.listdir(index_dir):
+            if file.startswith(os.path.basename(path) + '.gene_lengths_') and file.endswith('.npz'):
+                os.remove(os.path.join(index_dir, file))
+        np.savez(path_index, genes = lengths.index.to_numpy(dtype = str), lengths = lengths.to_numpy())
+    if genes is None:
+        return lengths
+    genes = pd.Index(genes)
+    return lengths.reindex(genes[genes.isin(lengths.index)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Build the gene length index of a GTF file')
+    parser.add_argument('gtf', help = 'GTF file')
+    parser.add_argument('--index-dir', help = 'Directory of the index (directory of the GTF file by default)')
+    parser.add_argument('--processes', type = int, help = 'Number of processes')
+    args = parser.parse_args()
+
+    lengths = gene_lengths(args.gtf, index_dir = args.index_dir, processes = args.processes)
+    print(f'{len(lengths)} genes')
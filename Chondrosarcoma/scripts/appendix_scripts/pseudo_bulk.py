@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : Pseudo-bulk aggregation of h5ad files by chunks
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module aggregates the cells of an h5ad file per group of one or several obs keys (e.g. dataset x cluster x cell
+# type) without loading the whole matrix: chunks of cells are read from the file and added to the groups with the product of a sparse
+# indicator matrix (groups x cells) and the chunk. Sums, means and numbers of non-zero values per group are returned in a new AnnData
+# object with the same layers as sc.get.aggregate ('sum', 'mean', 'count_nonzero').
+#
+# Usage :
+#   python pseudo_bulk.py object_merged_1.h5ad pseudo_bulk.h5ad --by dataset,leiden --genes ../../data/CTA_list_clean.txt
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load libraries
+import argparse
+import anndata as ad
+import h5py
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+try:
+    from anndata.io import read_elem, sparse_dataset
+except ImportError:
+    from anndata.experimental import read_elem, sparse_dataset
+
+FUNCS = ('sum', 'mean', 'count_nonzero')
+
+
+def group_codes(obs, by):
+    """
+    Group of each cell for the combination of several obs keys, groups are sorted as the categories of the keys
+
+    Input:
+        obs (DataFrame): Observations
+        by (list of str): obs keys
+
+    Output:
+        Tuple (group code of each cell, -1 for cells with a missing value; DataFrame of the groups with the keys as columns)
+    """
+    l_codes, l_categories = [], []
+    for key in by:
+        if isinstance(obs[key].dtype, pd.CategoricalDtype):
+            codes, categories = obs[key].cat.codes.to_numpy(), obs[key].cat.categories
+        else:
+            codes, categories = pd.factorize(obs[key], sort = True)
+        l_codes.append(codes)
+        l_categories.append(categories)
+
+    # Combination of the codes of the keys, only the combinations with cells are kept
+    missing = np.any([codes < 0 for codes in l_codes], axis = 0)
+    combined = np.ravel_multi_index([np.maximum(codes, 0) for codes in l_codes], [len(c) for c in l_categories])
+    used, group = np.unique(combined[~missing], return_inverse = True)
+    codes = np.full(len(obs), -1)
+    codes[~missing] = group
+    df_groups = pd.DataFrame({key: categories[index] for key, categories, index in
+                              zip(by, l_categories, np.unravel_index(used, [len(c) for c in l_categories]))})
+    return codes, df_groups
+
+
+def aggregate_h5ad(path, by, funcs = FUNCS, layer = None, genes = None, chunk_size = 20000):
+    """
+    Aggregate the cells of an h5ad file per group of obs keys, by chunks of cells
+
+    Input:
+        path (str): h5ad file
+        by (str or list of str): obs keys defining the groups
+        funcs (tuple of str): Aggregations among 'sum', 'mean' and 'count_nonzero'
+        layer (str): Layer of the counts, X if None
+        genes (iterable of str): Genes kept (genes missing in the object are skipped), all the genes if None
+        chunk_size (int): Number of cells read at each step
+
+    Output:
+        AnnData with one observation per group (keys and number of cells in obs) and one layer per aggregation
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    for func in funcs:
+        if func not in FUNCS:
+            raise ValueError(f'Unknown aggregation {func}, use one of {", ".join(FUNCS)}')
+
+    with h5py.File(path, 'r') as f:
+        obs = read_elem(f['obs'])
+        var = read_elem(f['var'])
+        element = f['X'] if layer is None else f['layers'][layer]
+        matrix = element if isinstance(element, h5py.Dataset) else sparse_dataset(element)
+
+        codes, df_groups = group_codes(obs, by)
+        n_groups = len(df_groups)
+        columns = None if genes is None else np.flatnonzero(var.index.isin(list(genes)))
+        n_genes = len(var) if columns is None else len(columns)
+
+        sums = np.zeros((n_groups, n_genes))
+        nonzero = np.zeros((n_groups, n_genes), dtype = np.int64)
+        for start in range(0, len(obs), chunk_size):
+            end = min(start + chunk_size, len(obs))
+            X = matrix[start:end]
+            X = sp.csr_matrix(X) if not sp.issparse(X) else X.tocsr()
+            if columns is not None:
+                X = X[:, columns]
+
+            # Indicator matrix groups x cells of the chunk (cells with a missing key are in no group)
+            kept = codes[start:end] >= 0
+            indicator = sp.csr_matrix((np.ones(kept.sum()), (codes[start:end][kept], np.flatnonzero(kept))),
+                                      shape = (n_groups, end - start))
+            sums += (indicator @ X).toarray()
+            if 'count_nonzero' in funcs:
+                X.data = (X.data != 0).astype(np.float64)
+                nonzero += np.rint((indicator @ X).toarray()).astype(np.int64)
+
+    n_cells = np.bincount(codes[codes >= 0], minlength = n_groups)
+    df_groups['n_cells'] = n_cells
+    df_groups.index = df_groups[by].astype(str).agg('_'.join, axis = 1).to_numpy()
+    for key in by:
+        df_groups[key] = df_groups[key].astype('category')
+
+    layers = {}
+    if 'sum' in funcs:
+        layers['sum'] = sums
+    if 'mean' in funcs:
+        layers['mean'] = sums / np.maximum(n_cells, 1)[:, None]
+    if 'count_nonzero' in funcs:
+        layers['count_nonzero'] = nonzero
+    return ad.AnnData(obs = df_groups, var = var if columns is None else var.iloc[columns], layers = layers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Pseudo-bulk aggregation of an h5ad file by chunks')
+    parser.add_argument('h5ad', help = 'h5ad file')
+    parser.add_argument('out', help = 'Output h5ad file')
+    parser.add_argument('--by', default = 'dataset', help = 'Comma-separated obs keys')
+    parser.add_argument('--layer', help = 'Layer of the counts (X by default)')
+    parser.add_argument('--genes', help = 'File with one gene per line to keep only these genes')
+    parser.add_argument('--chunk-size', type = int, default = 20000, help = 'Number of cells read at each step')
+    args = parser.parse_args()
+
+    genes = None
+    if args.genes:
+        with open(args.genes, 'r') as f:
+            genes = [lig.strip() for lig in f if lig.strip()]
+    adata = aggregate_h5ad(args.h5ad, args.by.split(','), layer = args.layer, genes = genes, chunk_size = args.chunk_size)
+    adata.write_h5ad(args.out)
+    print(f'{adata.n_obs} groups, {adata.n_vars} genes')
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------------------------
+# Python module : TPM, RPKM and CPM normalization of AnnData layers
+# Auteur  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module normalizes a samples x genes count matrix (dense or sparse, e.g. the 'sum' layer of sc.get.aggregate) with
+# the gene lengths, without converting a sparse matrix to a dense one: the values are divided by the gene lengths and scaled per
+# sample on the stored values only. The result is saved as a layer of the AnnData object or as a Parquet file (one line per non-zero
+# value). For matrices larger than the memory, an h5ad file is normalized by chunks of samples read from the file.
+#
+# Usage :
+#   python tpm_normalization.py object.h5ad ../../data/Homo_sapiens.GRCh38.113.gtf out.parquet --layer sum --method tpm
+# ----------------------------------------------------------------------------------------------------------------------------------------
+
+# Load libraries
+import argparse
+import h5py
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from gtf_index import gene_lengths
+try:
+    from anndata.io import read_elem, sparse_dataset
+except ImportError:
+    from anndata.experimental import read_elem, sparse_dataset
+
+METHODS = ('tpm', 'rpkm', 'cpm')
+
+
+def scale_rows(X, factors):
+    """
+    Multiply each row of a CSR or dense matrix by a factor, in place
+    """
+    if sp.issparse(X):
+        X.data *= np.repeat(factors, np.diff(X.indptr))
+    else:
+        X *= factors[:, None]
+    return X
+
+
+def scale_columns(X, factors):
+    """
+    Multiply each column of a CSR or dense matrix by a factor, in place
+    """
+    if sp.issparse(X):
+        X.data *= factors[X.indices]
+    else:
+        X *= factors[None, :]
+    return X
+
+
+def row_sums(X):
+    return np.asarray(X.sum(axis = 1)).ravel()
+
+
+def inverse(values, scale):
+    """
+    scale / values, 0 where values is 0 (samples without counts, genes without length)
+    """
+    values = np.asarray(values, dtype = np.float64)
+    return np.divide(scale, values, out = np.zeros_like(values), where = values != 0)
+
+
+def normalize(X, lengths = None, method = 'tpm'):
+    """
+    Normalize a samples x genes count matrix
+
+    Input:
+        X (np.ndarray or scipy sparse matrix): Counts, one row per sample
+        lengths (np.ndarray): Gene lengths in bp, aligned with the columns (0 or NaN for genes to exclude), needed for tpm and rpkm
+        method (str): 'tpm', 'rpkm' or 'cpm'
+
+    Output:
+        Normalized matrix of the same type (CSR for sparse input), X is not modified
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method}, use one of {", ".join(METHODS)}')
+    X = sp.csr_matrix(X, dtype = np.float64, copy = True) if sp.issparse(X) else np.array(X, dtype = np.float64)
+    if method == 'cpm':
+        return scale_rows(X, inverse(row_sums(X), 1e6))
+    if lengths is None:
+        raise ValueError(f'Gene lengths are needed for {method}')
+    lengths = np.nan_to_num(np.asarray(lengths, dtype = np.float64))
+
+    if method == 'tpm':
+        # Reads per kilobase, then scaled to 1e6 per sample
+        scale_columns(X, inverse(lengths, 1e3))
+        return scale_rows(X, inverse(row_sums(X), 1e6))
+
+    # rpkm: library size of the genes with a length
+    library = row_sums(scale_columns(X.copy(), (lengths > 0).astype(np.float64)))
+    scale_columns(X, inverse(lengths, 1e9))
+    return scale_rows(X, inverse(library, 1))
+
+
+def normalize_anndata(adata, lengths, method = 'tpm', layer = None, key_added = None):
+    """
+    Normalize a layer of an AnnData object and save the result as a layer
+
+    Input:
+        adata (AnnData): Object with samples as observations
+        lengths (pd.Series): Gene -> length in bp, genes missing in lengths are set to 0 and excluded from the per-sample scaling
+        method (str): 'tpm', 'rpkm' or 'cpm'
+        layer (str): Layer of the counts, X if None
+        key_added (str): Name of the new layer, method if None
+
+    Output:
+        adata with the new layer
+    """
+    X = adata.X if layer is None else adata.layers[layer]
+    adata.layers[key_added or method] = normalize(X, lengths.reindex(adata.var_names).to_numpy(), method)
+    return adata
+
+
+def layer_to_frame(adata, layer = None):
+    """
+    Layer of a small AnnData object (e.g. pseudo-bulk) as a DataFrame with genes in lines and samples in columns
+    """
+    X = adata.X if layer is None else adata.layers[layer]
+    return pd.DataFrame((X.toarray() if sp.issparse(X) else np.asarray(X)).T, index = adata.var_names, columns = adata.obs_names)
+
+
+def write_parquet(X, obs_names, var_names, path, writer = None):
+    """
+    Write the non-zero values of a samples x genes matrix as a Parquet table (sample, gene, value)
+
+    Input:
+        X (np.ndarray or scipy sparse matrix): Matrix
+        obs_names, var_names (list of str): Sample and gene names
+        path (str): Parquet file (not used if writer is given)
+        writer (pq.ParquetWriter): Open writer to append the rows of a chunk
+
+    Output:
+        Writer if one was given, None otherwise
+    """
+    X = sp.coo_matrix(X)
+    values = X.data != 0
+    table = pa.table({
+        'sample': pa.DictionaryArray.from_arrays(pa.array(X.row[values], pa.int32()), pa.array(list(obs_names), pa.string())),
+        'gene': pa.DictionaryArray.from_arrays(pa.array(X.col[values], pa.int32()), pa.array(list(var_names), pa.string())),
+        'value': pa.array(X.data[values], pa.float64()),
+    })
+    if writer is None:
+        pq.write_table(table, path)
+        return None
+    writer.write_table(table)
+    return writer
+
+
+def normalize_h5ad(path, lengths, out, method = 'tpm', layer = None, chunk_size = 10000):
+    """
+    Normalize an h5ad file by chunks of samples and write the result as Parquet, only one chunk is in memory
+
+    Input:
+        path (str): h5ad file with samples as observations
+        lengths (pd.Series): Gene -> length in bp
+        out (str): Parquet file (sample, gene, value)
+        method (str): 'tpm', 'rpkm' or 'cpm'
+        layer (str): Layer of the counts, X if None
+        chunk_size (int): Number of samples per chunk
+
+    Output:
+        Number of samples normalized
+    """
+    with h5py.File(path, 'r') as f:
+        obs_names = read_elem(f['obs']).index
+        var_names = read_elem(f['var']).index
+        element = f['X'] if layer is None else f['layers'][layer]
+        matrix = element if isinstance(element, h5py.Dataset) else sparse_dataset(element)
+        gene_lengths = lengths.reindex(var_names).to_numpy()
+
+        schema = pa.schema([('sample', pa.dictionary(pa.int32(), pa.string())),
+                            ('gene', pa.dictionary(pa.int32(), pa.string())), ('value', pa.float64())])
+        with pq.ParquetWriter(out, schema) as writer:
+            for start in range(0, len(obs_names), chunk_size):
+                end = min(start + chunk_size, len(obs_names))
+                X = normalize(matrix[start:end], gene_lengths, method)
+                write_parquet(X, obs_names[start:end], var_names, out, writer)
+    return len(obs_names)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Normalize an h5ad file by chunks and write the result as Parquet')
+    parser.add_argument('h5ad', help = 'h5ad file with samples as observations')
+    parser.add_argument('gtf', help = 'GTF file for the gene lengths')
+    parser.add_argument('out', help = 'Parquet file')
+    parser.add_argument('--layer', help = 'Layer of the counts (X by default)')
+    parser.add_argument('--method', default = 'tpm', choices = METHODS)
+    parser.add_argument('--chunk-size', type = int, default = 10000, help = 'Number of samples per chunk')
+    args = parser.parse_args()
+
+    n = normalize_h5ad(args.h5ad, gene_lengths(args.gtf), args.out, args.method, args.layer, args.chunk_size)
+    print(f'{n} samples normalized')
@@ -6,6 +6,8 @@
 -- tables related to epitopes, cancer associated diseases, immune cell types (T and B cells), and molecular object sequences 
 -- for the species Homo sapiens. The resulting data is saved as .tsv files in results folder. These tables  will be used for 
 -- peptides analysis.
+-- The same queries can be streamed directly into Parquet tables, without the OUTFILE step, with iedb_extract.py (also
+-- works with a local SQLite or DuckDB load of iedb_public.sql).
 ----------------------------------------------------------------------------------------------------------------------------
 
 -- Bash commands
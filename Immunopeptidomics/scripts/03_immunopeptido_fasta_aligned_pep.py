@@ -4,11 +4,13 @@
 # Author  : Léa ROGUE
 # Date    : 21-04-2025
 # Description : This script permit to create a fasta files with peptide sequences that are aligned by blastp to run the
-# netMHC tool to predict affinity of peptides to MHC.
+# netMHC tool to predict affinity of peptides to MHC. Only the selected records are read from seq_pep.fasta, through
+# its index (see fasta_index.py).
 # ----------------------------------------------------------------------------------------------------------------------
 
 # Import packages
 from collections import defaultdict
+from fasta_index import FastaIndex
 
 # Read gene names and their corresponding entry names
 d_genes = defaultdict()
@@ -24,23 +26,6 @@ with open('../results/selected_results_blastp_0_mismatch.tsv') as f:
     for lig in f:
         pep_id.add(lig.strip().split()[0])
 
-# Extract peptides from the fasta file
-d_pep_aligned = defaultdict(str)
-in_seq = False
-with open('../results/seq_pep.fasta') as f:
-    for lig in f:
-        lig = lig.strip()
-        
-        if lig.startswith('>'): # if line starts with '>', verify if it is an aligned peptide
-            in_seq = False
-            if lig.replace('>', '') in pep_id:# if it is an aligned peptide, save the id and start saving the sequence
-                id = lig
-                d_pep_aligned[id] = ''
-                in_seq = True
-        elif in_seq:
-            d_pep_aligned[id] += lig
-
-# Save the aligned peptides in a new fasta file
-with open('../results/seq_pep_aligned.fasta', 'w') as f:
-    for id, seq in d_pep_aligned.items():
-        f.write(id + '\n' + seq + '\n')
+# Extract the aligned peptides from the fasta file with its index and save them in a new fasta file
+with FastaIndex('../results/seq_pep.fasta') as fasta:
+    fasta.write_subset(pep_id, '../results/seq_pep_aligned.fasta')
@@ -4,7 +4,10 @@
 # Author  : Léa ROGUE
 # Date    : 28-04-2024
 # Description : This script performs prediction of peptide binding affinity to MHC class I molecules using netMHC
-# and selects strong binding peptides.
+# and selects strong binding peptides. Jobs are run by netmhc_scheduler.py (limited number of workers, retries and
+# manifest of the finished jobs). Predictions are kept in ../results/cache/affinity_cache.sqlite, so a rerun only
+# predicts the peptides not seen in a previous run. The 8/9/10-mer windows shared by several peptides are predicted
+# only once (--dedup, see kmer_windows.py).
 # ------------------------------------------------------------------------------------------------------------------
 
 # Predict the binding affinity of the selected peptides to MHC class I molecules using NetMHCpan
@@ -22,20 +25,9 @@ alleles=(
     HLA-C0702
 )
 
-# Create output dir
-mkdir ../results/res_netmhc
-mkdir ../results/netmhc_sb
-
-# Predict binding affinity for each allele
-for allele in "${alleles[@]}"; do
-    nohup netMHC -a "$allele" -l 8,9,10 ../results/seq_pep_aligned.fasta > ../results/res_netmhc/res_netmhc_${allele}_selected_blastp.out 2>&1 &
-done
-
-# Loop for each NetMHC output file
-for file in ../results/res_netmhc/res_netmhc_*_selected_blastp.out; do
-    # Extract file name
-    base=$(basename "$file" .out)
-
-    # Select th strong binding peptides
-    grep 'SB' "$file" > "../results/netmhc_sb/${base}_sb.out"
-done
+# Predict binding affinity for each allele on shards of the fasta file, with at most 8 jobs at the same time, and
+# select the strong binding peptides while netMHC outputs are read (see netmhc_scheduler.py). NETMHC="python
+# stub_netmhc.py" runs the pipeline without netMHC.
+python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta --alleles "$(IFS=,; echo "${alleles[*]}")" \
+    --results-dir ../results --predictor "${NETMHC:-netMHC}" --lengths 8,9,10 --workers 8 \
+    --dedup --shard-size 50000 --cache ../results/cache/affinity_cache.sqlite --predictor-version 4.0 --max-cache-entries 50000000
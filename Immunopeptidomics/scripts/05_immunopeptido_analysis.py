@@ -4,58 +4,32 @@
 # Author  : Léa ROGUE
 # Date    : 02-05-2025
 # Description : This script analyzes the affinity of peptides per gene from the results of the strong binding peptides for
-# HLA-A0201.
+# HLA-A0201. The netMHC output is read in a typed DataFrame and annotated with the genes of the peptides by joins on
+# the hits of 02 (see netmhc_io.py). The binders of all the alleles are then integrated with the expression summary of
+# their genes in one table (see peptide_integration.py).
 # ----------------------------------------------------------------------------------------------------------------------
 
 # Import packages
-from collections import defaultdict 
 import pandas as pd
-
-# Read gene names and their corresponding entry names
-d_pep_gene = defaultdict(list)
-d_genes = defaultdict()
-with open('../data/entry_name_gene_name.tsv', 'r') as f:
-    for lig in f:
-        lig = lig.strip().split()
-        d_genes[lig[0]] = lig[1]
-
-# Read peptides IDs and their corresponding gene
-with open('../results/selected_results_blastp_0_mismatch.tsv', 'r') as f:
-    for lig in f:
-        lig = lig.strip().split()
-        d_pep_gene[lig[0]].append(d_genes[lig[4]])
-
-# Adding column with genes in the file with genes
-with open('../results/netmhc_sb/res_netmhc_HLA-A0201_selected_blastp_sb_annotated.out', 'w') as f_w:
-    with open('../results/netmhc_sb/res_netmhc_HLA-A0201_selected_blastp_sb.out', 'r') as f_r:
-        for lig in f_r:
-            genes = str(d_pep_gene[lig.strip().split()[10]]).replace('\'', '').replace('[', '').replace(']', '')
-            lig = lig.strip() + '\t' + genes
-            f_w.write(lig + '\n')
-
-# Read the data
-df_int = pd.read_csv('../../Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv', sep = '\t')
-
-# Select CTA genes
-df_int = df_int[df_int['SYMBOL'].isin(d_genes.values())]
-
-# Mean expression level
-df_int['Mean_expression'] = df_int.iloc[:,3:].mean(axis = 1)
-
-# Have affinity for each peptide
-# Prepare data
-d_pep_affinity = defaultdict(dict)
-with open('../results/netmhc_sb/res_netmhc_HLA-A0201_selected_blastp_sb_annotated.out', 'r') as f:
-    for lig in f:
-        lig = lig.strip().split()
-        d_pep_affinity[lig[2]][' '.join(lig[16:])] = float(lig[12])
-
-# Convert to DataFrame with 3 columns: Gene, Peptide, Affinity
-l = []
-for pep, d_pep in d_pep_affinity.items():
-    for gene, affinity in d_pep.items():
-        l.append((pep, gene, affinity))
-
-# Create and DataFrame
-df_pep_genes_aff = pd.DataFrame(l, columns=['Peptide', 'Genes', 'Affinity'])
+from netmhc_io import annotate_genes, peptide_genes, read_predictions
+from peptide_integration import integrate
+
+# Read the strong binding peptides and add the genes of their peptide IDs
+df_sb = read_predictions('../results/netmhc_sb/res_netmhc_HLA-A0201_selected_blastp_sb.out')
+s_genes = peptide_genes('../results/selected_results_blastp_0_mismatch.tsv', '../data/entry_name_gene_name.tsv')
+df_sb = annotate_genes(df_sb, s_genes)
+
+# Have affinity for each peptide: last affinity of each peptide and genes, peptides in the order of their first line
+df_pep_genes_aff = df_sb.groupby(['peptide', 'genes'], sort = False)['affinity'].last().reset_index()
+df_pep_genes_aff['order'] = pd.factorize(df_pep_genes_aff['peptide'])[0]
+df_pep_genes_aff = df_pep_genes_aff.sort_values('order', kind = 'stable')
+
+# Create and DataFrame with 3 columns: Gene, Peptide, Affinity
+df_pep_genes_aff = df_pep_genes_aff[['peptide', 'genes', 'affinity']]
+df_pep_genes_aff.columns = ['Peptide', 'Genes', 'Affinity']
 df_pep_genes_aff.to_csv('../results/df_peptides_genes_aff_hla_a0201.tsv', index = False, sep = '\t')
+
+# Integrate the strong and weak binders of all the alleles with the expression level of their genes
+integrate(['../results/netmhc_sb', '../results/netmhc_wb'], '../results/selected_results_blastp_0_mismatch.tsv',
+          '../data/entry_name_gene_name.tsv', '../../Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv',
+          '../results/df_peptides_alleles_genes_expr')
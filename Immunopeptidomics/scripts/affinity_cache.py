@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Persistent cache of the peptide binding predictions
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module stores the netMHC predictions in a SQLite database keyed by (peptide, allele, length,
+# predictor version), with the affinity (nM), the %rank, the binder level and the other fields of the netMHC line. The
+# scheduler of 04 (netmhc_scheduler.py) looks up the peptides of each job, sends only the missing ones to the predictor
+# and adds the new predictions to the cache. The least recently used entries are removed when the cache is larger than
+# a maximal number of entries, and the hit rate of each run is appended to a report.
+#
+# Usage :
+#   python affinity_cache.py ../results/cache/affinity_cache.sqlite                  (summary of the cache)
+#   python affinity_cache.py ../results/cache/affinity_cache.sqlite --max-entries 5000000
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import os
+import sqlite3
+import time
+
+# Fields of the netMHC line saved for each key (the columns of netmhc_io.COLUMNS without pos, allele, peptide, identity)
+FIELDS = ['core', 'offset', 'i_pos', 'i_len', 'd_pos', 'd_len', 'icore', 'log_aff', 'affinity', 'rank', 'binder']
+
+# Number of keys per SQL statement (SQLite limits the number of parameters)
+BATCH_SIZE = 500
+
+
+class AffinityCache:
+    """
+    SQLite store of the predictions, shared by the processes of the scheduler
+    """
+
+    def __init__(self, path, version, timeout = 600):
+        """
+        Input:
+            path (str): SQLite file, created if it doesn't exist
+            version (str): Predictor version, part of the key so predictions of different versions are never mixed
+            timeout (int): Seconds a process waits for the lock of another process
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        self.path = path
+        self.version = version
+        self.conn = sqlite3.connect(path, timeout = timeout)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(f'''CREATE TABLE IF NOT EXISTS affinity (
+            peptide TEXT NOT NULL, allele TEXT NOT NULL, length INTEGER NOT NULL, version TEXT NOT NULL,
+            {', '.join(f'"{field}" TEXT' for field in FIELDS)}, last_used REAL NOT NULL,
+            PRIMARY KEY (peptide, allele, length, version)) WITHOUT ROWID''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS affinity_last_used ON affinity (last_used)')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS report (
+            run TEXT, allele TEXT, version TEXT, hits INTEGER, misses INTEGER, hit_rate REAL)''')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM affinity').fetchone()[0]
+
+    def get_many(self, allele, peptides):
+        """
+        Look up the predictions of peptides for an allele and mark them as used
+
+        Input:
+            allele (str): Allele
+            peptides (iterable of str): Peptides
+
+        Output:
+            Dictionary peptide -> dictionary of FIELDS, only for the peptides in the cache
+        """
+        l_peptides = list(peptides)
+        d_found = {}
+        now = time.time()
+        columns = ', '.join(f'"{field}"' for field in FIELDS)
+        with self.conn:
+            for i in range(0, len(l_peptides), BATCH_SIZE):
+                batch = l_peptides[i:i + BATCH_SIZE]
+                marks = ', '.join('?' * len(batch))
+                params = [allele, self.version] + batch
+                for row in self.conn.execute(f'SELECT peptide, {columns} FROM affinity WHERE allele = ? AND version = ? '
+                                             f'AND peptide IN ({marks})', params):
+                    d_found[row[0]] = dict(zip(FIELDS, row[1:]))
+                self.conn.execute(f'UPDATE affinity SET last_used = ? WHERE allele = ? AND version = ? '
+                                  f'AND peptide IN ({marks})', [now] + params)
+        return d_found
+
+    def put_many(self, allele, d_predictions):
+        """
+        Add predictions to the cache
+
+        Input:
+            allele (str): Allele
+            d_predictions (dict): Peptide -> dictionary of FIELDS
+        """
+        now = time.time()
+        rows = [(peptide, allele, len(peptide), self.version) + tuple(str(values[field]) for field in FIELDS) + (now,)
+                for peptide, values in d_predictions.items()]
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO affinity VALUES ({", ".join("?" * (len(FIELDS) + 5))})', rows)
+
+    def evict(self, max_entries):
+        """
+        Remove the least recently used entries when the cache has more than max_entries entries
+
+        Output:
+            Number of removed entries
+        """
+        excess = len(self) - max_entries
+        if excess <= 0:
+            return 0
+        with self.conn:
+            self.conn.execute('DELETE FROM affinity WHERE (peptide, allele, length, version) IN '
+                              '(SELECT peptide, allele, length, version FROM affinity ORDER BY last_used LIMIT ?)',
+                              (excess,))
+        return excess
+
+    def add_report(self, run, allele, hits, misses):
+        """
+        Save the hit rate of an allele for a run
+        """
+        total = hits + misses
+        with self.conn:
+            self.conn.execute('INSERT INTO report VALUES (?, ?, ?, ?, ?, ?)',
+                              (run, allele, self.version, hits, misses, hits / total if total else 0))
+
+    def report(self, run = None):
+        """
+        Return the hit rates saved for a run (or for all the runs) as a list of (run, allele, version, hits, misses,
+        hit rate)
+        """
+        if run is None:
+            return self.conn.execute('SELECT * FROM report ORDER BY run, allele').fetchall()
+        return self.conn.execute('SELECT * FROM report WHERE run = ? ORDER BY allele', (run,)).fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Summary and eviction of the affinity cache')
+    parser.add_argument('path', help = 'SQLite file of the cache')
+    parser.add_argument('--max-entries', type = int, help = 'Remove the least recently used entries above this number')
+    args = parser.parse_args()
+
+    with AffinityCache(args.path, version = '') as cache:
+        if args.max_entries is not None:
+            print(f'{cache.evict(args.max_entries)} entries removed')
+        print(f'{len(cache)} entries')
+        for version, allele, n in cache.conn.execute('SELECT version, allele, COUNT(*) FROM affinity '
+                                                     'GROUP BY version, allele ORDER BY version, allele'):
+            print(f'{version}\t{allele}\t{n}')
+        for run, allele, version, hits, misses, hit_rate in cache.report():
+            print(f'run {run}\t{allele}\t{version}\thits {hits}\tmisses {misses}\thit rate {hit_rate:.1%}')
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Indexed access to fasta files
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module builds a faidx-style index (name, length, offset, bases per line, bytes per line, same
+# format as samtools faidx) of a fasta file once and saves it next to the file (file.fasta.fai). Sequences are read
+# from a memory-mapped file, so selecting some records of a large fasta file only reads these records. It is used by
+# 02 (gene names of the CTA proteins, peptide search) and 03 (selection of the aligned peptides).
+#
+# Usage :
+#   python fasta_index.py gene-names data/proteine_seq_targeted_cta.fasta > data/entry_name_gene_name.tsv
+#   python fasta_index.py fetch results/seq_pep.fasta ids.txt results/seq_pep_subset.fasta
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import mmap
+import os
+import sys
+
+
+def build_index(path):
+    """
+    Scan a fasta file and compute the index of its records
+
+    Input:
+        path (str): Fasta file
+
+    Output:
+        Dictionary name -> (length, offset, bases per line, bytes per line), in the order of the file. Records whose lines
+        don't have the same length (except the last one) have 0 bases per line and are read up to the next header.
+    """
+    d_index = {}
+    name = None
+    with open(path, 'rb') as f:
+        pos = 0
+        for lig in f:
+            if lig.startswith(b'>'):
+                if name is not None:
+                    d_index[name] = (length, offset, line_bases, line_width) if regular else (length, offset, 0, 0)
+                name = lig[1:].split(maxsplit = 1)[0].decode() if lig[1:].strip() else ''
+                offset = pos + len(lig)
+                length, line_bases, line_width, last, regular = 0, 0, 0, False, True
+            elif name is not None:
+                bases = len(lig.rstrip(b'\r\n'))
+                # Only the last line of a record can be shorter, otherwise the record is marked with 0 bases per line
+                if length == 0:
+                    if bases:
+                        line_bases, line_width = bases, len(lig)
+                    else:
+                        offset = pos + len(lig)
+                elif bases and (last or bases > line_bases or len(lig) - bases != line_width - line_bases):
+                    regular = False
+                elif bases < line_bases:
+                    last = True
+                length += bases
+            pos += len(lig)
+        if name is not None:
+            d_index[name] = (length, offset, line_bases, line_width) if regular else (length, offset, 0, 0)
+    return d_index
+
+
+class FastaIndex:
+    """
+    Fasta file with a faidx-style index and memory-mapped access to the sequences
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.path_index = path + '.fai'
+
+        # Build the index if it doesn't exist or if the fasta file changed
+        if not os.path.exists(self.path_index) or os.path.getmtime(self.path_index) < os.path.getmtime(path):
+            self.index = build_index(path)
+            with open(self.path_index, 'w') as f:
+                for name, values in self.index.items():
+                    f.write(name + '\t' + '\t'.join(str(v) for v in values) + '\n')
+        else:
+            self.index = {}
+            with open(self.path_index, 'r') as f:
+                for lig in f:
+                    lig = lig.rstrip('\n').split('\t')
+                    self.index[lig[0]] = tuple(int(v) for v in lig[1:5])
+
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.file.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    def _block(self, name):
+        """
+        Bytes of the sequence of a record, with its line breaks
+        """
+        length, offset, line_bases, line_width = self.index[name]
+        if length == 0:
+            return b''
+        if line_bases == 0:
+            end = self.mm.find(b'\n>', offset)
+            return self.mm[offset:end if end >= 0 else len(self.mm)]
+        n_lines = (length - 1) // line_bases
+        return self.mm[offset:offset + length + n_lines * (line_width - line_bases)]
+
+    def fetch(self, name):
+        """
+        Return the sequence of a record
+        """
+        return self._block(name).translate(None, b'\r\n').decode()
+
+    def header(self, name):
+        """
+        Return the header line of a record without '>'
+        """
+        start = self.mm.rfind(b'>', 0, self.index[name][1])
+        return self.mm[start + 1:self.mm.find(b'\n', start)].rstrip(b'\r').decode()
+
+    def iter_records(self):
+        """
+        Iterate over (name, sequence) in the order of the file
+        """
+        for name in self.index:
+            yield name, self.fetch(name)
+
+    def write_subset(self, names, out):
+        """
+        Write the records of a set of names in a fasta file, in the order of the input file, with the sequence on one line
+
+        Input:
+            names (iterable of str): Names of the records, names missing in the fasta file are skipped
+            out (str): Output fasta file
+
+        Output:
+            Number of records written
+        """
+        l_names = sorted((name for name in set(names) if name in self.index), key = lambda name: self.index[name][1])
+        with open(out, 'wb') as f:
+            for name in l_names:
+                f.write(b'>' + name.encode() + b'\n' + self._block(name).translate(None, b'\r\n') + b'\n')
+        return len(l_names)
+
+    def gene_names(self):
+        """
+        Iterate over (name, gene) for the 'GN=' fields of the UniProt headers
+        """
+        for name in self.index:
+            for field in self.header(name).split():
+                if field.startswith('GN='):
+                    yield name, field[3:]
+
+
+if __name__ == '__main__':
+    command = sys.argv[1]
+    with FastaIndex(sys.argv[2]) as fasta:
+        if command == 'gene-names':
+            for name, gene in fasta.gene_names():
+                print(name + '\t' + gene)
+        elif command == 'fetch':
+            with open(sys.argv[3], 'r') as f:
+                names = [lig.strip() for lig in f if lig.strip()]
+            fasta.write_subset(names, sys.argv[4])
+        elif command != 'index':
+            sys.exit(f'Unknown command {command}, use index, fetch or gene-names')
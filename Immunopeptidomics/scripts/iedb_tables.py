@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Columnar ingest of the IEDB tables
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module reads the IEDB tables extracted by 00_immunopeptido_extract_data_iedb.sql in typed chunks,
+# annotates the epitopes with their cancer diseases by a vectorized join on disease.tsv and links epitopes to their
+# sequences. Parsed tables are cached as Parquet files keyed on the hash of their source files, so reruns skip parsing.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import csv
+import hashlib
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Columns of each table, in the order of the SELECT statements of 00_immunopeptido_extract_data_iedb.sql
+TABLE_COLUMNS = {
+    'disease': ['disease_id', 'disease_name'],
+    't_cell': ['id', 'mhc_type', 'mhc_allele', 'iv1_disease_id', 'iv2_disease_id', 'adt_iv_disease_id'],
+    'b_cell': ['id', 'mhc_type', 'iv1_disease_id', 'iv2_disease_id', 'adt_iv_disease_id'],
+    'mhc_epitope': ['id', 'iv1_disease_id', 'mhc_type', 'mhc_allele'],
+    'epitope_object': ['id', 'object_id'],
+    'object_seq': ['object_id', 'sequence'],
+    'epitope_seq': ['id', 'sequence'],
+}
+
+# Disease id columns searched for each table, in the order they are checked
+DISEASE_COLUMNS = {
+    't_cell': ['iv1_disease_id', 'iv2_disease_id', 'adt_iv_disease_id'],
+    'b_cell': ['iv1_disease_id', 'iv2_disease_id', 'adt_iv_disease_id'],
+    'mhc_epitope': ['iv1_disease_id'],
+}
+
+# Columns kept for each cell/epitope table once annotated
+KEPT_COLUMNS = {
+    't_cell': ['id', 'mhc_type', 'mhc_allele'],
+    'b_cell': ['id', 'mhc_type'],
+    'mhc_epitope': ['id', 'mhc_type', 'mhc_allele'],
+}
+
+CHUNK_SIZE = 500_000
+NULL = '\\N'
+
+
+def file_hash(path, block_size = 1 << 22):
+    """
+    Compute the hash of a file by blocks
+
+    Input:
+        path (str): File path
+        block_size (int): Number of bytes read at each step
+
+    Output:
+        Hexadecimal blake2b digest of the file content
+    """
+    h = hashlib.blake2b(digest_size = 16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cached(name, sources, build, cache_dir):
+    """
+    Return a table from the Parquet cache or build it and save it in the cache
+
+    Input:
+        name (str): Name of the cached table
+        sources (list of str): Files the table is computed from, their content is the cache key
+        build (function): Function without argument returning the DataFrame when the cache is missing
+        cache_dir (str): Directory containing the Parquet files
+
+    Output:
+        DataFrame of the table
+    """
+    h = hashlib.blake2b(digest_size = 16)
+    for source in sources:
+        h.update(file_hash(source).encode())
+    key = h.hexdigest()
+    path = os.path.join(cache_dir, f'{name}_{key}.parquet')
+
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    df = build()
+
+    # Remove outdated versions of the table and save the new one
+    os.makedirs(cache_dir, exist_ok = True)
+    for file in os.listdir(cache_dir):
+        if file.startswith(name + '_') and file.endswith('.parquet'):
+            os.remove(os.path.join(cache_dir, file))
+    df.to_parquet(path, index = False)
+    return df
+
+
+def read_chunks(path, table, chunk_size = CHUNK_SIZE):
+    """
+    Read an IEDB table in typed chunks
+
+    Input:
+        path (str): TSV file written by the SQL extraction (no header, NULL written as \\N) or Parquet file written by
+            iedb_extract.py
+        table (str): Name of the table, key of TABLE_COLUMNS
+        chunk_size (int): Number of lines per chunk
+
+    Output:
+        Iterator of DataFrames with string columns
+    """
+    columns = TABLE_COLUMNS[table]
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size = chunk_size, columns = columns):
+            yield batch.to_pandas()
+        return
+
+    reader = pd.read_csv(path, sep = '\t', header = None, names = columns, usecols = range(len(columns)),
+                         dtype = str, na_filter = False, quoting = csv.QUOTE_NONE, chunksize = chunk_size)
+    for chunk in reader:
+        yield chunk.fillna('')
+
+
+def read_disease(path):
+    """
+    Read the cancer diseases table
+
+    Input:
+        path (str): disease.tsv file
+
+    Output:
+        DataFrame with disease_id and disease_name columns, one line per disease id (the last one is kept)
+    """
+    df = pd.concat(read_chunks(path, 'disease'), ignore_index = True)
+    return df.drop_duplicates('disease_id', keep = 'last').reset_index(drop = True)
+
+
+def annotate_diseases(chunk, id_cols, df_disease):
+    """
+    Add the names of the cancer diseases to each line of a chunk and drop lines without a cancer disease
+
+    Input:
+        chunk (DataFrame): Lines of an epitope table
+        id_cols (list of str): Disease id columns, the names are joined in this order without duplicates
+        df_disease (DataFrame): Cancer diseases from read_disease
+
+    Output:
+        DataFrame with the lines associated to at least one cancer, and a disease column
+    """
+    chunk = chunk.reset_index(drop = True)
+
+    # Long format with one line per (line, disease id column) and join with the disease names
+    df_long = chunk[id_cols].rename(columns = dict(zip(id_cols, range(len(id_cols)))))
+    df_long = df_long.rename_axis('line').reset_index().melt(id_vars = 'line', var_name = 'rank', value_name = 'disease_id')
+    df_long = df_long.merge(df_disease, on = 'disease_id', how = 'inner')
+
+    # Keep the first occurrence of each disease name per line, in column order
+    df_long = df_long.sort_values(['line', 'rank'], kind = 'stable').drop_duplicates(['line', 'disease_name'])
+    disease = df_long.groupby('line', sort = True)['disease_name'].agg(', '.join)
+
+    df = chunk.loc[disease.index].copy()
+    df['disease'] = disease.values
+    return df
+
+
+def read_epitopes(path, table, df_disease, chunk_size = CHUNK_SIZE):
+    """
+    Read a T cell, B cell or MHC elution table and keep epitopes associated with a cancer
+
+    Input:
+        path (str): TSV or Parquet file of the table
+        table (str): 't_cell', 'b_cell' or 'mhc_epitope'
+        df_disease (DataFrame): Cancer diseases from read_disease
+        chunk_size (int): Number of lines per chunk
+
+    Output:
+        DataFrame with one line per epitope id (the last line of the file is kept) and the kept columns and disease
+    """
+    l_chunks = []
+    for chunk in read_chunks(path, table, chunk_size):
+        df = annotate_diseases(chunk, DISEASE_COLUMNS[table], df_disease)
+        l_chunks.append(df[KEPT_COLUMNS[table] + ['disease']])
+
+    if l_chunks:
+        df = pd.concat(l_chunks, ignore_index = True)
+    else:
+        df = pd.DataFrame(columns = KEPT_COLUMNS[table] + ['disease'], dtype = str)
+    return df.drop_duplicates('id', keep = 'last').reset_index(drop = True)
+
+
+def read_epitope_sequences(path_epitope_object, path_object_seq, chunk_size = CHUNK_SIZE):
+    """
+    Link epitope ids to the sequence of their object
+
+    Input:
+        path_epitope_object (str): epitope_object.tsv file
+        path_object_seq (str): object_seq.tsv file
+        chunk_size (int): Number of lines per chunk
+
+    Output:
+        DataFrame with id and sequence columns
+    """
+    # Objects with a sequence
+    df_obj = pd.concat([chunk[chunk['sequence'] != NULL] for chunk in read_chunks(path_object_seq, 'object_seq', chunk_size)],
+                       ignore_index = True)
+    df_obj = df_obj.drop_duplicates('object_id', keep = 'last')
+
+    # Epitopes with a sequence
+    l_chunks = [chunk.merge(df_obj, on = 'object_id', how = 'inner')[['id', 'sequence']]
+                for chunk in read_chunks(path_epitope_object, 'epitope_object', chunk_size)]
+    df = pd.concat(l_chunks, ignore_index = True)
+    return df.drop_duplicates('id', keep = 'last').reset_index(drop = True)
+
+
+def aggregate_unique(df, key):
+    """
+    Group lines by key and join the unique values of each column with ', ', in order of appearance
+
+    Input:
+        df (DataFrame): Table to aggregate, missing values are written 'nan'
+        key (str): Column to group by
+
+    Output:
+        DataFrame with one line per key sorted by key
+    """
+    l_cols = []
+    for col in df.columns.drop(key):
+        df_col = pd.DataFrame({key: df[key], col: df[col].astype(str)}).drop_duplicates()
+        l_cols.append(df_col.groupby(key, sort = True)[col].agg(', '.join))
+    return pd.concat(l_cols, axis = 1).reset_index()
+
+
+def table_path(db_dir, table):
+    """
+    Return the file of a table, the Parquet file written by iedb_extract.py if it exists or the TSV file
+
+    Input:
+        db_dir (str): Directory with the tables extracted from IEDB
+        table (str): Name of the table
+
+    Output:
+        Path of the table file
+    """
+    path = os.path.join(db_dir, f'{table}.parquet')
+    if os.path.exists(path):
+        return path
+    return os.path.join(db_dir, f'{table}.tsv')
+
+
+def load_tables(db_dir, cache_dir = None, chunk_size = CHUNK_SIZE):
+    """
+    Load the cancer associated epitope tables, from the cache when the source files did not change
+
+    Input:
+        db_dir (str): Directory with the tables extracted from IEDB (TSV or Parquet)
+        cache_dir (str): Directory of the Parquet cache, db_dir/cache by default
+        chunk_size (int): Number of lines per chunk
+
+    Output:
+        Dictionary with the DataFrames 't_cell', 'b_cell', 'mhc_epitope' and 'epitope_seq'
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(db_dir, 'cache')
+    path_disease = table_path(db_dir, 'disease')
+
+    d_tables = {}
+    for table in ['t_cell', 'b_cell', 'mhc_epitope']:
+        path = table_path(db_dir, table)
+        d_tables[table] = cached(table, [path, path_disease],
+                                 lambda: read_epitopes(path, table, read_disease(path_disease), chunk_size), cache_dir)
+
+    # Sequences already joined in SQL by iedb_extract.py, or join of the epitope and object tables
+    path_epitope_seq = os.path.join(db_dir, 'epitope_seq.parquet')
+    if os.path.exists(path_epitope_seq):
+        df = pd.concat(read_chunks(path_epitope_seq, 'epitope_seq', chunk_size), ignore_index = True)
+        d_tables['epitope_seq'] = df.drop_duplicates('id', keep = 'last').reset_index(drop = True)
+    else:
+        path_epitope_object = table_path(db_dir, 'epitope_object')
+        path_object_seq = table_path(db_dir, 'object_seq')
+        d_tables['epitope_seq'] = cached('epitope_seq', [path_epitope_object, path_object_seq],
+                                         lambda: read_epitope_sequences(path_epitope_object, path_object_seq, chunk_size),
+                                         cache_dir)
+    return d_tables
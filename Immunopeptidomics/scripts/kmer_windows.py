@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Deduplicated peptide windows of the aligned peptides
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : netMHC predicts every 8/9/10-mer window of each peptide of seq_pep_aligned.fasta, but the IEDB peptides
+# overlap and the same window is predicted many times per allele. This module enumerates all the windows once, gives
+# an id to each unique window and keeps, in numpy arrays, the record, the position and the window id of every window.
+# Only the unique windows are sent to the predictor (netmhc_scheduler.py --dedup) and the predictions are written back
+# for every window in the netMHC format. The windows of a peptide can be traced back to their epitope IDs and genes.
+#
+# Usage :
+#   python kmer_windows.py ../results/seq_pep_aligned.fasta --lengths 8,9,10        (number of windows saved)
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+from collections import defaultdict
+import numpy as np
+from fasta_index import FastaIndex
+from netmhc_io import format_line
+
+
+class WindowIndex:
+    """
+    Windows of a fasta file with interned peptide ids
+
+    Attributes:
+        records (np.ndarray of str): Record names (epitope IDs), in the order of the fasta file
+        peptides (np.ndarray of bytes): Unique windows, the id of a window is its index in this array
+        window_record, window_pos, window_peptide (np.ndarray of int): Record index, position and peptide id of every
+            window, in the order of the netMHC output (record, length, position)
+    """
+
+    def __init__(self, records, peptides, window_record, window_pos, window_peptide):
+        self.records = records
+        self.peptides = peptides
+        self.window_record = window_record
+        self.window_pos = window_pos
+        self.window_peptide = window_peptide
+        self._offsets = None
+        self._order = None
+
+    @classmethod
+    def build(cls, fasta, lengths):
+        """
+        Enumerate the windows of a fasta file
+
+        Input:
+            fasta (str): Fasta file of the peptides
+            lengths (list of int): Window lengths
+
+        Output:
+            WindowIndex
+        """
+        d_ids = {}
+        l_records, l_record, l_pos, l_peptide = [], [], [], []
+        with FastaIndex(fasta) as f:
+            for i, (name, seq) in enumerate(f.iter_records()):
+                l_records.append(name)
+                for length in lengths:
+                    for pos in range(len(seq) - length + 1):
+                        l_record.append(i)
+                        l_pos.append(pos)
+                        l_peptide.append(d_ids.setdefault(seq[pos:pos + length], len(d_ids)))
+        peptides = np.array(list(d_ids), dtype = f'S{max(lengths)}') if d_ids else np.array([], dtype = 'S1')
+        return cls(np.array(l_records, dtype = str), peptides, np.array(l_record, dtype = np.int32),
+                   np.array(l_pos, dtype = np.int32), np.array(l_peptide, dtype = np.int32))
+
+    def save(self, path):
+        """
+        Save the arrays in a npz file
+        """
+        np.savez(path, records = self.records, peptides = self.peptides, window_record = self.window_record,
+                 window_pos = self.window_pos, window_peptide = self.window_peptide)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the arrays saved by save
+        """
+        with np.load(path) as data:
+            return cls(data['records'], data['peptides'], data['window_record'], data['window_pos'],
+                       data['window_peptide'])
+
+    def __len__(self):
+        return len(self.window_peptide)
+
+    def n_unique(self):
+        return len(self.peptides)
+
+    def report(self):
+        """
+        Text with the number of windows, of unique windows and the fraction of predictions saved
+        """
+        saved = 1 - self.n_unique() / len(self) if len(self) else 0
+        return f'{len(self)} windows, {self.n_unique()} unique peptides, {saved:.1%} of the predictions saved'
+
+    def write_peptide_shards(self, prefix, shard_size):
+        """
+        Write the unique windows in peptide list files (one peptide per line, netMHC -p input)
+
+        Input:
+            prefix (str): Prefix of the files, followed by _NNNN.pep
+            shard_size (int): Number of peptides per file
+
+        Output:
+            List of the files
+        """
+        l_shards = []
+        for i in range(0, max(self.n_unique(), 1), shard_size):
+            shard = f'{prefix}_{i // shard_size:04d}.pep'
+            with open(shard, 'wb') as f:
+                f.writelines(peptide + b'\n' for peptide in self.peptides[i:i + shard_size])
+            l_shards.append(shard)
+        return l_shards
+
+    def peptide_ids(self, peptides):
+        """
+        Ids of peptides (-1 for the peptides that are not windows)
+        """
+        d_ids = {peptide: i for i, peptide in enumerate(self.peptides.astype(str))}
+        return np.array([d_ids.get(peptide, -1) for peptide in peptides], dtype = np.int32)
+
+    def sources(self, peptide_id, d_record_genes = None):
+        """
+        Epitope IDs (and genes) of the windows of a peptide
+
+        Input:
+            peptide_id (int): Peptide id
+            d_record_genes (dict): Epitope ID -> list of genes (see record_genes)
+
+        Output:
+            Sorted list of the epitope IDs, and sorted list of their genes if d_record_genes is given
+        """
+        # Windows grouped by peptide id, computed at the first call
+        if self._order is None:
+            self._order = np.argsort(self.window_peptide, kind = 'stable')
+            self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self.window_peptide,
+                                                                       minlength = self.n_unique()))])
+        windows = self._order[self._offsets[peptide_id]:self._offsets[peptide_id + 1]]
+        l_ids = sorted(set(self.records[self.window_record[windows]].tolist()))
+        if d_record_genes is None:
+            return l_ids
+        return l_ids, sorted({gene for record in l_ids for gene in d_record_genes.get(record, [])})
+
+    def fan_out(self, allele, d_predictions, path_out, path_sb, path_wb):
+        """
+        Write the predictions of the unique windows for every window, in the netMHC format
+
+        Input:
+            allele (str): Allele
+            d_predictions (dict): Peptide -> list of the 15 fields of netmhc_io.COLUMNS
+            path_out, path_sb, path_wb (str): Files of all the windows, of the strong and of the weak binders
+
+        Output:
+            Tuple (number of SB lines, number of WB lines)
+        """
+        # Fields of the predictions in the order of the peptide ids
+        l_fields = [d_predictions[peptide] for peptide in self.peptides.astype(str)]
+        n_sb = n_wb = 0
+        with open(path_out, 'w') as f_out, open(path_sb, 'w') as f_sb, open(path_wb, 'w') as f_wb:
+            for record, pos, peptide_id in zip(self.window_record.tolist(), self.window_pos.tolist(),
+                                               self.window_peptide.tolist()):
+                fields = l_fields[peptide_id]
+                lig = format_line(pos, allele, fields[2], fields[3], fields[9], self.records[record], fields[11],
+                                  fields[12], fields[13], fields[14], *fields[4:9]) + '\n'
+                f_out.write(lig)
+                if fields[14] == 'SB':
+                    f_sb.write(lig)
+                    n_sb += 1
+                elif fields[14] == 'WB':
+                    f_wb.write(lig)
+                    n_wb += 1
+        return n_sb, n_wb
+
+
+def record_genes(path_hits, path_genes):
+    """
+    Genes of each epitope ID from the selected hits of 02
+
+    Input:
+        path_hits (str): Hits with 0 mismatch (selected_results_blastp_0_mismatch.tsv)
+        path_genes (str): Entry names and gene names (entry_name_gene_name.tsv)
+
+    Output:
+        Dictionary epitope ID -> list of genes
+    """
+    d_genes = {}
+    with open(path_genes, 'r') as f:
+        for lig in f:
+            lig = lig.strip().split()
+            d_genes[lig[0]] = lig[1]
+    d_record_genes = defaultdict(list)
+    with open(path_hits, 'r') as f:
+        for lig in f:
+            lig = lig.strip().split()
+            d_record_genes[lig[0]].append(d_genes[lig[4]])
+    return d_record_genes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Count the unique peptide windows of a fasta file')
+    parser.add_argument('fasta', help = 'Fasta file of the peptides')
+    parser.add_argument('--lengths', default = '8,9,10', help = 'Window lengths')
+    args = parser.parse_args()
+
+    print(WindowIndex.build(args.fasta, [int(length) for length in args.lengths.split(',')]).report())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Reading and writing of netMHC 4.0 output lines
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module parses the prediction lines of netMHC 4.0 (pos, HLA, peptide, Core, Offset, I_pos, I_len,
+# D_pos, D_len, iCore, Identity, 1-log50k(aff), Affinity(nM), %Rank, BindLevel) and writes lines in the same format.
+# It also reads netMHC output files (or a directory of files, one per allele) in a typed DataFrame and annotates the
+# predictions with the genes of their peptide IDs by joins on the hits of 02 (used by 05).
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import os
+import pandas as pd
+
+# Columns of a prediction line
+COLUMNS = ['pos', 'allele', 'peptide', 'core', 'offset', 'i_pos', 'i_len', 'd_pos', 'd_len', 'icore', 'identity',
+           'log_aff', 'affinity', 'rank', 'binder']
+
+# Columns of the DataFrame of the predictions, with their type
+FRAME_TYPES = {'allele': 'category', 'pos': 'int32', 'peptide': 'str', 'core': 'str', 'affinity': 'float64',
+               'rank': 'float64', 'binder': 'category', 'identity': 'str'}
+
+
+def parse_line(lig):
+    """
+    Parse a netMHC output line
+
+    Input:
+        lig (str): Line of the netMHC output
+
+    Output:
+        List of the 15 fields of COLUMNS as str (binder is 'SB', 'WB' or ''), None if it is not a prediction line
+    """
+    fields = lig.split()
+    if len(fields) < 14 or not fields[0].isdigit() or not fields[1].startswith('HLA'):
+        return None
+    binder = fields[15] if len(fields) > 15 and fields[14] == '<=' else ''
+    return fields[:14] + [binder]
+
+
+def format_line(pos, allele, peptide, core, icore, identity, log_aff, affinity, rank, binder = '', offset = 0, i_pos = 0,
+                i_len = 0, d_pos = 0, d_len = 0):
+    """
+    Write a prediction line in the netMHC format
+
+    Output:
+        Line without the line break
+    """
+    lig = (f'{pos:>5} {allele:>12} {peptide:>12} {core:>12} {offset:>6} {i_pos:>6} {i_len:>6} {d_pos:>6} {d_len:>6} '
+           f'{icore:>12} {identity:>15} {float(log_aff):>13.3f} {float(affinity):>12.2f} {float(rank):>8.2f}')
+    if binder:
+        lig += f' <= {binder}'
+    return lig
+
+
+def iter_predictions(path, binders = None, chunk_size = 1_000_000):
+    """
+    Read netMHC output files by chunks of prediction lines
+
+    Input:
+        path (str or list of str): netMHC output file, or directory whose .out files are read (e.g. res_netmhc/ or
+            netmhc_sb/), or list of files and directories
+        binders (set of str): Binder levels kept ({'SB'}, {'SB', 'WB'}), None to keep all the predictions
+        chunk_size (int): Maximal number of predictions per chunk
+
+    Output:
+        Iterator of DataFrames with the columns of FRAME_TYPES
+    """
+    l_paths = []
+    for path_input in [path] if isinstance(path, str) else path:
+        if os.path.isdir(path_input):
+            l_paths += sorted(os.path.join(path_input, name) for name in os.listdir(path_input) if name.endswith('.out'))
+        else:
+            l_paths.append(path_input)
+    d_columns = {column: [] for column in FRAME_TYPES}
+    index = [COLUMNS.index(column) for column in FRAME_TYPES]
+    for path_file in l_paths:
+        with open(path_file, 'r') as f:
+            for lig in f:
+                fields = parse_line(lig)
+                if fields is None or (binders is not None and fields[14] not in binders):
+                    continue
+                for column, i in zip(FRAME_TYPES, index):
+                    d_columns[column].append(fields[i])
+                if len(d_columns['pos']) == chunk_size:
+                    yield pd.DataFrame(d_columns).astype(FRAME_TYPES)
+                    d_columns = {column: [] for column in FRAME_TYPES}
+    if d_columns['pos']:
+        yield pd.DataFrame(d_columns).astype(FRAME_TYPES)
+
+
+def read_predictions(path, binders = None):
+    """
+    Read netMHC output files in a DataFrame
+
+    Input:
+        path (str or list of str): netMHC output file, directory of output files (one per allele) or list of them
+        binders (set of str): Binder levels kept, None to keep all the predictions
+
+    Output:
+        DataFrame with the columns of FRAME_TYPES, in the order of the files
+    """
+    l_chunks = list(iter_predictions(path, binders))
+    if not l_chunks:
+        return pd.DataFrame({column: pd.Series(dtype = dtype) for column, dtype in FRAME_TYPES.items()})
+    # Union of the categories so the concatenation keeps the category type
+    df = pd.concat(l_chunks, ignore_index = True)
+    return df.astype({column: 'category' for column, dtype in FRAME_TYPES.items() if dtype == 'category'})
+
+
+def read_gene_names(path_genes):
+    """
+    Read the entry names and their gene name (entry_name_gene_name.tsv), the last line of an entry name is kept. The
+    fields are separated by any white space, as in 03 and kmer_windows.py (the file written by the awk command of 02 has
+    spaces around the tab)
+
+    Output:
+        DataFrame with the columns entry and gene
+    """
+    df = pd.read_csv(path_genes, sep = r'\s+', header = None, names = ['entry', 'gene'], usecols = [0, 1], dtype = str)
+    return df.drop_duplicates('entry', keep = 'last')
+
+
+def peptide_genes(path_hits, path_genes):
+    """
+    Genes of each peptide ID from the hits of 02
+
+    Input:
+        path_hits (str): Hits with 0 mismatch (selected_results_blastp_0_mismatch.tsv), peptide ID in column 1 and entry
+            name in column 5
+        path_genes (str): Entry names and gene names (entry_name_gene_name.tsv)
+
+    Output:
+        Series peptide ID -> genes of its hits in the order of the hits, separated by ', '
+    """
+    df_hits = pd.read_csv(path_hits, sep = '\t', header = None, usecols = [0, 4], names = ['identity', 'entry'],
+                          dtype = str)
+    df_hits = df_hits.merge(read_gene_names(path_genes), on = 'entry', how = 'left', validate = 'many_to_one')
+    if df_hits['gene'].isna().any():
+        raise KeyError(f'Entry names without gene: {", ".join(df_hits.loc[df_hits["gene"].isna(), "entry"].unique())}')
+    return df_hits.groupby('identity', sort = False)['gene'].agg(', '.join).rename('genes')
+
+
+def annotate_genes(df, s_genes):
+    """
+    Add the genes of the peptide IDs (identity column)
+
+    Input:
+        df (DataFrame): Predictions (read_predictions)
+        s_genes (Series): Genes of each peptide ID (peptide_genes)
+
+    Output:
+        DataFrame with a genes column ('' for peptides without hit)
+    """
+    df = df.merge(s_genes, left_on = 'identity', right_index = True, how = 'left')
+    df['genes'] = df['genes'].fillna('')
+    return df
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Scheduling of the netMHC predictions
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script runs netMHC for each allele on shards of the peptide fasta file through a process pool with
+# a limited number of workers. The output of each job is read while it is written, the strong (SB) and weak (WB)
+# binders are saved as they arrive. Failed jobs are retried and the state of every job is saved in a manifest, so an
+# interrupted run only restarts the missing jobs. When all the shards of an allele are done, the outputs are
+# concatenated in res_netmhc/res_netmhc_ALLELE_selected_blastp.out, netmhc_sb/res_netmhc_ALLELE_selected_blastp_sb.out
+# and netmhc_wb/res_netmhc_ALLELE_selected_blastp_wb.out. stub_netmhc.py can be used instead of the netMHC binary.
+# With --cache, the predictions are saved in a persistent cache (affinity_cache.py): each job only sends the peptides
+# missing in the cache to the predictor and writes the lines of all the peptides from the cache. With --dedup, the
+# windows of all the peptides are enumerated and deduplicated first (kmer_windows.py): the shards are lists of unique
+# windows predicted with netMHC -p, and the predictions are written back for every window of every peptide.
+#
+# Usage :
+#   python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta --workers 8
+#   python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta --predictor "python stub_netmhc.py"
+#   python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta --cache ../results/cache/affinity_cache.sqlite
+#   python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta --dedup --shard-size 50000
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from affinity_cache import FIELDS, AffinityCache
+from fasta_index import FastaIndex
+from iedb_tables import file_hash
+from kmer_windows import WindowIndex
+from netmhc_io import format_line, parse_line
+
+ALLELES = ['HLA-A0101', 'HLA-A0201', 'HLA-A0301', 'HLA-B0702', 'HLA-B0801', 'HLA-B4402', 'HLA-C0401', 'HLA-C0501',
+           'HLA-C0602', 'HLA-C0701', 'HLA-C0702']
+
+
+def split_fasta(path, shard_dir, shard_size):
+    """
+    Split a fasta file in shards of shard_size records
+
+    Input:
+        path (str): Fasta file
+        shard_dir (str): Output directory of the shards
+        shard_size (int): Number of records per shard
+
+    Output:
+        List of the shard files
+    """
+    os.makedirs(shard_dir, exist_ok = True)
+    l_shards = []
+    with FastaIndex(path) as fasta:
+        names = fasta.names()
+        for i in range(0, max(len(names), 1), shard_size):
+            shard = os.path.join(shard_dir, f'shard_{i // shard_size:04d}.fasta')
+            fasta.write_subset(names[i:i + shard_size], shard)
+            l_shards.append(shard)
+    return l_shards
+
+
+def shard_name(shard):
+    """
+    Name of a shard file without its directory and extension
+    """
+    return os.path.splitext(os.path.basename(shard))[0]
+
+
+def run_job(predictor, allele, lengths, shard, out_dir, extra_args = ()):
+    """
+    Run the predictor on one shard and save the raw output and the binders while the output is read
+
+    Input:
+        predictor (str): Predictor command ('netMHC' or 'python stub_netmhc.py')
+        allele (str): Allele
+        lengths (str): Peptide lengths ('8,9,10')
+        shard (str): Fasta file of the shard, or list of peptides (.pep) predicted with -p
+        out_dir (str): Output directory of the allele shards
+        extra_args (tuple): Other arguments given to the predictor before the input file
+
+    Output:
+        Dictionary with the status of the job, the number of SB and WB and the runtime
+    """
+    start = time.time()
+    name = shard_name(shard)
+    path_out = os.path.join(out_dir, name + '.out')
+    path_sb = os.path.join(out_dir, name + '_sb.out')
+    path_wb = os.path.join(out_dir, name + '_wb.out')
+
+    input_args = ['-p'] if shard.endswith('.pep') else ['-l', lengths]
+    cmd = shlex.split(predictor) + ['-a', allele] + input_args + list(extra_args) + [shard]
+    n_sb = n_wb = 0
+    f_err = open(path_out + '.err', 'w')
+    with open(path_out + '.tmp', 'w') as f_out, open(path_sb + '.tmp', 'w') as f_sb, open(path_wb + '.tmp', 'w') as f_wb:
+        proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = f_err, text = True)
+        for lig in proc.stdout:
+            f_out.write(lig)
+            fields = parse_line(lig)
+            if fields is None:
+                continue
+            if fields[-1] == 'SB':
+                f_sb.write(lig)
+                n_sb += 1
+            elif fields[-1] == 'WB':
+                f_wb.write(lig)
+                n_wb += 1
+        returncode = proc.wait()
+    f_err.close()
+
+    if returncode != 0:
+        with open(path_out + '.err', 'r') as f:
+            error = f.read().strip()[-500:]
+        return {'status': 'failed', 'error': error, 'seconds': round(time.time() - start, 2)}
+
+    # Files are renamed only when the job succeeded
+    for path in [path_out, path_sb, path_wb]:
+        os.replace(path + '.tmp', path)
+    return {'status': 'done', 'n_sb': n_sb, 'n_wb': n_wb, 'seconds': round(time.time() - start, 2)}
+
+
+def run_job_cached(predictor, allele, lengths, shard, out_dir, extra_args, cache_path, version):
+    """
+    Run the predictor only on the peptides of a shard missing in the cache, then write the raw output and the binders of
+    all the peptides from the cache
+
+    Input:
+        predictor, allele, lengths, shard, out_dir, extra_args: Same as run_job
+        cache_path (str): SQLite file of the cache
+        version (str): Predictor version
+
+    Output:
+        Dictionary with the status of the job, the number of SB and WB, the cache hits and misses and the runtime
+    """
+    start = time.time()
+    name = shard_name(shard)
+    path_out = os.path.join(out_dir, name + '.out')
+    path_sb = os.path.join(out_dir, name + '_sb.out')
+    path_wb = os.path.join(out_dir, name + '_wb.out')
+
+    # Peptides of the shard in the order of the netMHC output (record, length, position)
+    l_windows = []
+    if shard.endswith('.pep'):
+        with open(shard, 'r') as f:
+            l_windows = [(0, lig.strip(), 'PEPLIST') for lig in f if lig.strip()]
+    else:
+        with FastaIndex(shard) as fasta:
+            for identity, seq in fasta.iter_records():
+                for length in [int(length) for length in lengths.split(',')]:
+                    l_windows += [(pos, seq[pos:pos + length], identity) for pos in range(len(seq) - length + 1)]
+    s_peptides = {peptide for _, peptide, _ in l_windows}
+
+    with AffinityCache(cache_path, version) as cache:
+        d_predictions = cache.get_many(allele, s_peptides)
+        hits = len(d_predictions)
+        l_missing = sorted(s_peptides - d_predictions.keys())
+
+        # Prediction of the missing peptides as a peptide list (-p)
+        if l_missing:
+            path_pep = os.path.join(out_dir, name + '_missing.pep')
+            with open(path_pep, 'w') as f:
+                f.writelines(peptide + '\n' for peptide in l_missing)
+            cmd = shlex.split(predictor) + ['-a', allele, '-p'] + list(extra_args) + [path_pep]
+            d_new = {}
+            with open(path_out + '.err', 'w') as f_err:
+                proc = subprocess.Popen(cmd, stdout = subprocess.PIPE, stderr = f_err, text = True)
+                for lig in proc.stdout:
+                    fields = parse_line(lig)
+                    if fields is not None:
+                        d_new[fields[2]] = dict(zip(FIELDS, fields[3:10] + fields[11:]))
+                returncode = proc.wait()
+            os.remove(path_pep)
+            if returncode != 0 or len(d_new) < len(l_missing):
+                with open(path_out + '.err', 'r') as f:
+                    error = f.read().strip()[-500:] or f'{len(l_missing) - len(d_new)} peptides not predicted'
+                return {'status': 'failed', 'error': error, 'seconds': round(time.time() - start, 2)}
+            cache.put_many(allele, d_new)
+            d_predictions.update(d_new)
+
+    n_sb = n_wb = 0
+    with open(path_out + '.tmp', 'w') as f_out, open(path_sb + '.tmp', 'w') as f_sb, open(path_wb + '.tmp', 'w') as f_wb:
+        for pos, peptide, identity in l_windows:
+            d = d_predictions[peptide]
+            lig = format_line(pos, allele, peptide, d['core'], d['icore'], identity, d['log_aff'], d['affinity'],
+                              d['rank'], d['binder'], d['offset'], d['i_pos'], d['i_len'], d['d_pos'], d['d_len']) + '\n'
+            f_out.write(lig)
+            if d['binder'] == 'SB':
+                f_sb.write(lig)
+                n_sb += 1
+            elif d['binder'] == 'WB':
+                f_wb.write(lig)
+                n_wb += 1
+    for path in [path_out, path_sb, path_wb]:
+        os.replace(path + '.tmp', path)
+    return {'status': 'done', 'n_sb': n_sb, 'n_wb': n_wb, 'hits': hits, 'misses': len(l_missing),
+            'seconds': round(time.time() - start, 2)}
+
+
+def save_manifest(manifest, path):
+    """
+    Save the manifest as JSON, through a temporary file so it is never partially written
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(path + '.tmp', path)
+
+
+def concat_files(l_paths, out):
+    """
+    Concatenate files in out
+    """
+    with open(out, 'wb') as f_out:
+        for path in l_paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, f_out)
+
+
+def schedule(fasta, alleles, results_dir, predictor = 'netMHC', lengths = '8,9,10', workers = 8, shard_size = 2000,
+             retries = 2, extra_args = (), suffix = 'selected_blastp', cache = None, predictor_version = '4.0',
+             max_cache_entries = None, dedup = False):
+    """
+    Run the predictions of all the alleles on all the shards of a fasta file
+
+    Input:
+        fasta (str): Fasta file of the peptides
+        alleles (list of str): Alleles
+        results_dir (str): Results directory, contains res_netmhc, netmhc_sb and netmhc_wb
+        predictor (str): Predictor command
+        lengths (str): Peptide lengths
+        workers (int): Maximal number of jobs running at the same time
+        shard_size (int): Number of fasta records per shard (of unique windows with dedup)
+        retries (int): Number of retries of a failed job
+        extra_args (tuple): Other arguments given to the predictor
+        suffix (str): Suffix of the output file names
+        cache (str): SQLite file of the affinity cache, None to run the predictor on all the peptides
+        predictor_version (str): Predictor version, part of the cache key
+        max_cache_entries (int): Maximal number of entries of the cache after the run, None for no limit
+        dedup (bool): Predict each unique window once and write the predictions back for all the windows
+
+    Output:
+        Manifest dictionary (also saved in res_netmhc/manifest.json)
+    """
+    res_dir = os.path.join(results_dir, 'res_netmhc')
+    shard_dir = os.path.join(res_dir, 'shards')
+    path_manifest = os.path.join(res_dir, 'manifest.json')
+    for directory in [res_dir, os.path.join(results_dir, 'netmhc_sb'), os.path.join(results_dir, 'netmhc_wb')]:
+        os.makedirs(directory, exist_ok = True)
+
+    # Reuse the manifest only if the input and the settings are the same
+    settings = {'fasta_hash': file_hash(fasta), 'predictor': predictor, 'predictor_version': predictor_version,
+                'lengths': lengths, 'shard_size': shard_size, 'extra_args': list(extra_args), 'dedup': dedup}
+    manifest = None
+    if os.path.exists(path_manifest):
+        with open(path_manifest, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('settings') != settings:
+            manifest = None
+    if manifest is None:
+        if os.path.isdir(shard_dir):
+            shutil.rmtree(shard_dir)
+        if dedup:
+            windows = WindowIndex.build(fasta, [int(length) for length in lengths.split(',')])
+            windows.save(os.path.join(res_dir, 'windows.npz'))
+            os.makedirs(os.path.join(shard_dir, 'input'))
+            l_shards = windows.write_peptide_shards(os.path.join(shard_dir, 'input', 'shard'), shard_size)
+            print(windows.report())
+        else:
+            l_shards = split_fasta(fasta, os.path.join(shard_dir, 'input'), shard_size)
+        manifest = {'settings': settings, 'shards': l_shards, 'jobs': {}}
+        if dedup:
+            manifest['windows'] = {'n_windows': len(windows), 'n_unique': windows.n_unique()}
+        save_manifest(manifest, path_manifest)
+    l_shards = manifest['shards']
+
+    # Jobs still to run
+    l_todo = []
+    for allele in alleles:
+        os.makedirs(os.path.join(shard_dir, allele), exist_ok = True)
+        for shard in l_shards:
+            key = f'{allele}/{os.path.basename(shard)}'
+            if manifest['jobs'].get(key, {}).get('status') != 'done':
+                manifest['jobs'][key] = {'status': 'pending', 'attempts': 0}
+                l_todo.append((allele, shard, key))
+
+    # Run the jobs, at most `workers` at the same time, and retry the failed ones
+    if cache is None:
+        job_function, cache_args = run_job, ()
+    else:
+        job_function, cache_args = run_job_cached, (cache, predictor_version)
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        d_futures = {pool.submit(job_function, predictor, allele, lengths, shard, os.path.join(shard_dir, allele),
+                                 extra_args, *cache_args): (allele, shard, key) for allele, shard, key in l_todo}
+        while d_futures:
+            future = next(as_completed(d_futures))
+            allele, shard, key = d_futures.pop(future)
+            job = manifest['jobs'][key]
+            job['attempts'] += 1
+            try:
+                job.update(future.result())
+            except Exception as e:
+                job.update({'status': 'failed', 'error': repr(e)})
+            if job['status'] == 'failed' and job['attempts'] <= retries:
+                print(f'{key} failed (attempt {job["attempts"]}), retry')
+                d_futures[pool.submit(job_function, predictor, allele, lengths, shard, os.path.join(shard_dir, allele),
+                                      extra_args, *cache_args)] = (allele, shard, key)
+            save_manifest(manifest, path_manifest)
+
+    # Hit rate of the cache for the jobs of this run, and eviction of the least recently used entries
+    if cache is not None:
+        run = time.strftime('%Y-%m-%d %H:%M:%S')
+        with AffinityCache(cache, predictor_version) as affinity_cache:
+            for allele in alleles:
+                l_jobs = [manifest['jobs'][key] for job_allele, _, key in l_todo if job_allele == allele]
+                hits = sum(job.get('hits', 0) for job in l_jobs)
+                misses = sum(job.get('misses', 0) for job in l_jobs)
+                if hits + misses:
+                    affinity_cache.add_report(run, allele, hits, misses)
+                    print(f'{allele}: cache hit rate {hits / (hits + misses):.1%} ({hits} hits, {misses} misses)')
+            if max_cache_entries is not None:
+                print(f'{affinity_cache.evict(max_cache_entries)} cache entries removed')
+
+    # Concatenate the outputs of the alleles with all their shards done (or write the predictions of the unique windows
+    # back for all the windows)
+    windows = None
+    for allele in alleles:
+        keys = [f'{allele}/{os.path.basename(shard)}' for shard in l_shards]
+        if any(manifest['jobs'][key]['status'] != 'done' for key in keys):
+            print(f'{allele}: some shards failed, outputs not written')
+            continue
+        l_names = [os.path.join(shard_dir, allele, shard_name(shard)) for shard in l_shards]
+        if dedup:
+            if windows is None:
+                windows = WindowIndex.load(os.path.join(res_dir, 'windows.npz'))
+            d_predictions = {}
+            for name in l_names:
+                with open(name + '.out', 'r') as f:
+                    for lig in f:
+                        fields = parse_line(lig)
+                        if fields is not None:
+                            d_predictions[fields[2]] = fields
+            n_sb, n_wb = windows.fan_out(allele, d_predictions,
+                                         os.path.join(res_dir, f'res_netmhc_{allele}_{suffix}.out'),
+                                         os.path.join(results_dir, 'netmhc_sb', f'res_netmhc_{allele}_{suffix}_sb.out'),
+                                         os.path.join(results_dir, 'netmhc_wb', f'res_netmhc_{allele}_{suffix}_wb.out'))
+            print(f'{allele}: {n_sb} SB, {n_wb} WB')
+            continue
+        concat_files([name + '.out' for name in l_names], os.path.join(res_dir, f'res_netmhc_{allele}_{suffix}.out'))
+        concat_files([name + '_sb.out' for name in l_names],
+                     os.path.join(results_dir, 'netmhc_sb', f'res_netmhc_{allele}_{suffix}_sb.out'))
+        concat_files([name + '_wb.out' for name in l_names],
+                     os.path.join(results_dir, 'netmhc_wb', f'res_netmhc_{allele}_{suffix}_wb.out'))
+        n_sb = sum(manifest['jobs'][key]['n_sb'] for key in keys)
+        n_wb = sum(manifest['jobs'][key]['n_wb'] for key in keys)
+        print(f'{allele}: {n_sb} SB, {n_wb} WB')
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run netMHC on shards of a fasta file with a limited number of workers')
+    parser.add_argument('--fasta', default = '../results/seq_pep_aligned.fasta', help = 'Fasta file of the peptides')
+    parser.add_argument('--alleles', default = ','.join(ALLELES), help = 'Comma-separated alleles')
+    parser.add_argument('--results-dir', default = '../results', help = 'Results directory')
+    parser.add_argument('--predictor', default = 'netMHC', help = 'Predictor command, e.g. "python stub_netmhc.py"')
+    parser.add_argument('--lengths', default = '8,9,10', help = 'Peptide lengths')
+    parser.add_argument('--workers', type = int, default = 8, help = 'Maximal number of jobs at the same time')
+    parser.add_argument('--shard-size', type = int, default = 2000, help = 'Number of fasta records per shard')
+    parser.add_argument('--retries', type = int, default = 2, help = 'Number of retries of a failed job')
+    parser.add_argument('--cache', help = 'SQLite file of the affinity cache (no cache if not given)')
+    parser.add_argument('--predictor-version', default = '4.0', help = 'Predictor version, part of the cache key')
+    parser.add_argument('--max-cache-entries', type = int, help = 'Maximal number of entries kept in the cache')
+    parser.add_argument('--dedup', action = 'store_true', help = 'Predict each unique peptide window only once')
+    args = parser.parse_args()
+
+    schedule(args.fasta, args.alleles.split(','), args.results_dir, args.predictor, args.lengths, args.workers,
+             args.shard_size, args.retries, cache = args.cache, predictor_version = args.predictor_version,
+             max_cache_entries = args.max_cache_entries, dedup = args.dedup)
+    print('Done')
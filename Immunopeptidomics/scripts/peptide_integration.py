@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Integration of the predicted binders of all the alleles with the expression level
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module builds one table of the binding peptides of all the alleles predicted by 04, with one line
+# per allele, peptide and gene (best affinity and rank, number of peptide IDs), and joins it once with a summary of the
+# expression of each gene in chondrosarcoma (mean, median and quartiles over the patients). The summary is computed
+# once with numpy and cached as a Parquet file keyed on the hash of the expression file. The netMHC outputs are read
+# by chunks and each chunk is reduced before the join, so the memory and the runtime grow with the number of predicted
+# binders and not with the number of joins. The table is written as TSV (read by 06) and as Parquet.
+#
+# Usage :
+#   python peptide_integration.py          (from the scripts directory, writes ../results/df_peptides_alleles_genes_expr)
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import numpy as np
+import pandas as pd
+from iedb_tables import cached
+from netmhc_io import annotate_genes, iter_predictions, peptide_genes
+
+# Quantiles of the expression over the patients
+QUANTILES = {'Q25_expression': 0.25, 'Median_expression': 0.5, 'Q75_expression': 0.75}
+
+
+def expression_summary(path_int, first_sample = 3):
+    """
+    Summary of the expression of each gene over the patients, missing values are ignored
+
+    Input:
+        path_int (str): Expression table with a SYMBOL column and one column per patient
+        first_sample (int): Index of the first patient column
+
+    Output:
+        DataFrame with the columns SYMBOL, Mean_expression, Q25_expression, Median_expression, Q75_expression (first line
+        of each gene)
+    """
+    df = pd.read_csv(path_int, sep = '\t')
+    values = df.iloc[:, first_sample:].to_numpy(dtype = np.float64)
+    df_summary = pd.DataFrame({'SYMBOL': df['SYMBOL'], 'Mean_expression': np.nanmean(values, axis = 1)})
+    for column, q in zip(QUANTILES, np.nanquantile(values, list(QUANTILES.values()), axis = 1)):
+        df_summary[column] = q
+    return df_summary.drop_duplicates('SYMBOL').reset_index(drop = True)
+
+
+def reduce_chunk(df, s_genes):
+    """
+    One line per allele, peptide and gene for a chunk of predictions
+
+    Input:
+        df (DataFrame): Predictions (netmhc_io.iter_predictions)
+        s_genes (Series): Genes of each peptide ID (netmhc_io.peptide_genes)
+
+    Output:
+        DataFrame with the columns allele, peptide, gene, affinity (minimum), rank (minimum), binder (best level) and
+        identity (set of the peptide IDs)
+    """
+    df = annotate_genes(df, s_genes)
+    df = df[df['genes'] != ''].assign(gene = lambda d: d['genes'].str.split(', ')).explode('gene')
+    df['binder'] = df['binder'].astype(str)
+    return df.groupby(['allele', 'peptide', 'gene'], observed = True, sort = False).agg(
+        affinity = ('affinity', 'min'), rank = ('rank', 'min'), binder = ('binder', 'min'),
+        identity = ('identity', set)).reset_index()
+
+
+def integrate(l_netmhc, path_hits, path_genes, path_int, out, binders = ('SB', 'WB'), cache_dir = '../results/cache'):
+    """
+    Build the allele x peptide x gene table of the binders with the expression summary of the genes
+
+    Input:
+        l_netmhc (list of str): netMHC output files or directories (netmhc_sb/, netmhc_wb/ or res_netmhc/)
+        path_hits (str): Hits with 0 mismatch of 02
+        path_genes (str): Entry names and gene names
+        path_int (str): Expression table of the genes (whole_gene_int_CTA_sign_imm_clean.tsv)
+        out (str): Output path without extension, out.tsv and out.parquet are written
+        binders (tuple of str): Binder levels kept
+        cache_dir (str): Directory of the cached expression summary
+
+    Output:
+        DataFrame written in the output files
+    """
+    # Predictions of all the alleles, each chunk is reduced before the next one is read
+    s_genes = peptide_genes(path_hits, path_genes)
+    l_chunks = [reduce_chunk(df, s_genes) for df in iter_predictions(l_netmhc, set(binders))]
+    if l_chunks:
+        df = pd.concat(l_chunks, ignore_index = True)
+        df = df.groupby(['allele', 'peptide', 'gene'], observed = True, sort = True).agg(
+            affinity = ('affinity', 'min'), rank = ('rank', 'min'), binder = ('binder', 'min'),
+            identity = ('identity', lambda s: set().union(*s))).reset_index()
+    else:
+        df = pd.DataFrame(columns = ['allele', 'peptide', 'gene', 'affinity', 'rank', 'binder', 'identity'])
+    df['n_ids'] = df['identity'].map(len)
+    df = df.drop(columns = 'identity')
+    df.columns = ['Allele', 'Peptide', 'SYMBOL', 'Affinity', 'Rank', 'Binder', 'N_ids']
+
+    # Single join with the expression summary
+    df_expr = cached('expression_summary', [path_int], lambda: expression_summary(path_int), cache_dir)
+    df = df.merge(df_expr, on = 'SYMBOL', how = 'left')
+
+    df.to_csv(out + '.tsv', sep = '\t', index = False)
+    df.to_parquet(out + '.parquet', index = False)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Integrate the binders of all the alleles with the gene expression')
+    parser.add_argument('--netmhc', nargs = '+', default = ['../results/netmhc_sb', '../results/netmhc_wb'],
+                        help = 'netMHC output files or directories')
+    parser.add_argument('--hits', default = '../results/selected_results_blastp_0_mismatch.tsv')
+    parser.add_argument('--genes', default = '../data/entry_name_gene_name.tsv')
+    parser.add_argument('--expression', default = '../../Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv')
+    parser.add_argument('--out', default = '../results/df_peptides_alleles_genes_expr', help = 'Output without extension')
+    parser.add_argument('--binders', default = 'SB,WB', help = 'Binder levels kept')
+    args = parser.parse_args()
+
+    df = integrate(args.netmhc, args.hits, args.genes, args.expression, args.out, tuple(args.binders.split(',')))
+    print(f'{len(df)} lines, {df["Allele"].nunique()} alleles, {df["SYMBOL"].nunique()} genes')
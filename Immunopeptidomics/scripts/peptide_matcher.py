@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Exact and near-exact matching of peptides on the targeted CTA proteins
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script replaces blastp for the search of IEDB peptides in the targeted CTA protein sequences. A
+# k-mer index of the proteome is built once per process, each peptide is searched by its seeds and every occurrence
+# with 0 (and optionally 1) mismatch on the whole peptide length is reported. Peptides are dispatched on several
+# processes. The output has the 13 columns of results_blastp.tsv (blastp -outfmt '6 qseqid qlen qstart qend sseqid slen
+# sstart send length bitscore evalue pident mismatch'). Bit scores and e-values are computed from BLOSUM62 with the
+# Karlin-Altschul parameters of blastp, without gaps nor length correction, so they are close to but not exactly the
+# blastp values.
+#
+# Usage :
+#   python peptide_matcher.py --query results/seq_pep.fasta --db data/proteine_seq_targeted_cta.fasta
+#                             --out results/results_blastp.tsv --max-mismatch 1 --threads 6
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import bisect
+import math
+from collections import defaultdict
+from multiprocessing import Pool
+from fasta_index import FastaIndex
+
+# Maximal seed length used for the k-mer index
+MAX_SEED = 8
+
+# Karlin-Altschul parameters of blastp for BLOSUM62 (gap open 11, gap extend 1)
+LAMBDA = 0.267
+K = 0.041
+
+# BLOSUM62 substitution matrix
+AA = 'ARNDCQEGHILKMFPSTWYVBZX*'
+BLOSUM62_ROWS = '''
+ 4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0 -2 -1  0 -4
+-1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3 -1  0 -1 -4
+-2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3  3  0 -1 -4
+-2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3  4  1 -1 -4
+ 0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1 -3 -3 -2 -4
+-1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2  0  3 -1 -4
+-1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+ 0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3 -1 -2 -1 -4
+-2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3  0  0 -1 -4
+-1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3 -3 -3 -1 -4
+-1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1 -4 -3 -1 -4
+-1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2  0  1 -1 -4
+-1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1 -3 -1 -1 -4
+-2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1 -3 -3 -1 -4
+-1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2 -2 -1 -2 -4
+ 1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2  0  0  0 -4
+ 0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0 -1 -1  0 -4
+-3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3 -4 -3 -2 -4
+-2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1 -3 -2 -1 -4
+ 0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4 -3 -2 -1 -4
+-2 -1  3  4 -3  0  1 -1  0 -3 -4  0 -3 -3 -2  0 -1 -4 -3 -3  4  1 -1 -4
+-1  0  0  1 -3  3  4 -2  0 -3 -3  1 -1 -3 -1  0 -1 -3 -2 -2  1  4 -1 -4
+ 0 -1 -1 -1 -2 -1 -1 -1 -1 -1 -1 -1 -1 -1 -2  0  0 -2 -1 -1 -1 -1 -1 -4
+-4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4 -4  1
+'''
+BLOSUM62 = {}
+for a, row in zip(AA, BLOSUM62_ROWS.strip().split('\n')):
+    for b, score in zip(AA, row.split()):
+        BLOSUM62[(a, b)] = int(score)
+
+
+def read_fasta(path):
+    """
+    Read a fasta file through its index (see fasta_index.py)
+
+    Input:
+        path (str): Fasta file
+
+    Output:
+        List of (id, sequence), the id is the first word of the header as reported by blastp
+    """
+    with FastaIndex(path) as fasta:
+        return list(fasta.iter_records())
+
+
+class ProteomeIndex:
+    """
+    K-mer index of protein sequences
+
+    The sequences are concatenated in one string separated by '\\n', and for each seed length the positions of every
+    k-mer are stored in a dictionary built on the first use of this length.
+    """
+
+    def __init__(self, l_records):
+        self.ids = [id for id, _ in l_records]
+        self.lengths = [len(seq) for _, seq in l_records]
+        self.text = '\n'.join(seq.upper() for _, seq in l_records) + '\n'
+        self.starts = []
+        pos = 0
+        for length in self.lengths:
+            self.starts.append(pos)
+            pos += length + 1
+        self.db_length = sum(self.lengths)
+        self.d_index = {}
+
+    def kmers(self, k):
+        """
+        Return the dictionary k-mer -> list of positions in the concatenated sequences
+        """
+        if k not in self.d_index:
+            d_kmers = defaultdict(list)
+            text = self.text
+            for i in range(len(text) - k + 1):
+                kmer = text[i:i + k]
+                if '\n' not in kmer:
+                    d_kmers[kmer].append(i)
+            self.d_index[k] = dict(d_kmers)
+        return self.d_index[k]
+
+    def locate(self, pos):
+        """
+        Return the protein number and the 0-based position in this protein of a position of the concatenated sequences
+        """
+        i = bisect.bisect_right(self.starts, pos) - 1
+        return i, pos - self.starts[i]
+
+    def search(self, peptide, max_mismatch = 0):
+        """
+        Search all the occurrences of a peptide with at most max_mismatch mismatches (0 or 1)
+
+        Input:
+            peptide (str): Peptide sequence
+            max_mismatch (int): Maximal number of mismatches on the whole peptide
+
+        Output:
+            Sorted list of (position in the concatenated sequences, number of mismatches)
+        """
+        peptide = peptide.upper()
+        length = len(peptide)
+        if length == 0 or '\n' in peptide:
+            return []
+
+        # Seeds: a prefix for exact hits, and with 1 mismatch the 2 halves (one of them has no mismatch), peptides of one
+        # residue are only searched without mismatch
+        if max_mismatch == 0 or length < 2:
+            l_seeds = [(0, min(MAX_SEED, length))]
+        else:
+            half = length // 2
+            l_seeds = [(0, min(MAX_SEED, half)), (half, min(MAX_SEED, length - half))]
+
+        candidates = set()
+        for offset, k in l_seeds:
+            for pos in self.kmers(k).get(peptide[offset:offset + k], ()):
+                candidates.add(pos - offset)
+
+        l_hits = []
+        text = self.text
+        for start in candidates:
+            if start < 0 or start + length > len(text):
+                continue
+            window = text[start:start + length]
+            if window == peptide:
+                l_hits.append((start, 0))
+            elif max_mismatch > 0 and '\n' not in window:
+                mismatch = sum(a != b for a, b in zip(window, peptide))
+                if mismatch <= max_mismatch:
+                    l_hits.append((start, mismatch))
+        return sorted(l_hits)
+
+
+def score(peptide, subject):
+    """
+    Ungapped BLOSUM62 score of 2 sequences of the same length
+    """
+    return sum(BLOSUM62.get((a, b), BLOSUM62[('X', 'X')]) for a, b in zip(peptide, subject))
+
+
+def format_hits(index, qseqid, peptide, l_hits):
+    """
+    Write hits in the 13-column format of results_blastp.tsv
+
+    Input:
+        index (ProteomeIndex): Proteome index
+        qseqid (str): Peptide id
+        peptide (str): Peptide sequence
+        l_hits (list): Hits returned by ProteomeIndex.search
+
+    Output:
+        List of tab-separated lines
+    """
+    l_lines = []
+    length = len(peptide)
+    for start, mismatch in l_hits:
+        protein, pos = index.locate(start)
+        bits = (LAMBDA * score(peptide.upper(), index.text[start:start + length]) - math.log(K)) / math.log(2)
+        evalue = length * index.db_length * 2 ** -bits
+        evalue = f'{evalue:.2e}' if evalue < 1e-3 else f'{evalue:.3g}'
+        pident = 100 * (length - mismatch) / length
+        l_lines.append('\t'.join([qseqid, str(length), '1', str(length), index.ids[protein], str(index.lengths[protein]),
+                                  str(pos + 1), str(pos + length), str(length), f'{bits:.1f}', evalue, f'{pident:.3f}',
+                                  str(mismatch)]))
+    return l_lines
+
+
+# Index shared by the worker processes
+_index = None
+_max_mismatch = 0
+
+
+def _init_worker(l_proteins, max_mismatch):
+    global _index, _max_mismatch
+    _index = ProteomeIndex(l_proteins)
+    _max_mismatch = max_mismatch
+
+
+def _search_chunk(l_peptides):
+    l_lines = []
+    for qseqid, peptide in l_peptides:
+        l_lines.extend(format_hits(_index, qseqid, peptide, _index.search(peptide, _max_mismatch)))
+    return l_lines
+
+
+def match_peptides(l_peptides, l_proteins, out, max_mismatch = 0, threads = 1, chunk_size = 2000):
+    """
+    Search peptides on proteins and write the hits
+
+    Input:
+        l_peptides (list): List of (id, sequence) of the peptides
+        l_proteins (list): List of (id, sequence) of the proteins
+        out (str): Output file in the format of results_blastp.tsv
+        max_mismatch (int): 0 for exact hits only, 1 to add hits with one mismatch
+        threads (int): Number of processes
+        chunk_size (int): Number of peptides sent to a process at once
+
+    Output:
+        Number of hits written
+    """
+    l_chunks = [l_peptides[i:i + chunk_size] for i in range(0, len(l_peptides), chunk_size)]
+    n = 0
+    with open(out, 'w') as f:
+        if threads > 1:
+            with Pool(threads, initializer = _init_worker, initargs = (l_proteins, max_mismatch)) as pool:
+                for l_lines in pool.imap(_search_chunk, l_chunks):
+                    f.writelines(lig + '\n' for lig in l_lines)
+                    n += len(l_lines)
+        else:
+            _init_worker(l_proteins, max_mismatch)
+            for chunk in l_chunks:
+                l_lines = _search_chunk(chunk)
+                f.writelines(lig + '\n' for lig in l_lines)
+                n += len(l_lines)
+    return n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Search peptides on proteins with 0 or 1 mismatch')
+    parser.add_argument('--query', required = True, help = 'Fasta file of the peptides')
+    parser.add_argument('--db', required = True, help = 'Fasta file of the proteins')
+    parser.add_argument('--out', required = True, help = 'Output file (blastp outfmt 6 with 13 columns)')
+    parser.add_argument('--max-mismatch', type = int, default = 0, choices = [0, 1], help = 'Maximal number of mismatches')
+    parser.add_argument('--threads', type = int, default = 1, help = 'Number of processes')
+    args = parser.parse_args()
+
+    n = match_peptides(read_fasta(args.query), read_fasta(args.db), args.out, args.max_mismatch, args.threads)
+    print(f'{n} hits')
+    print('Done')
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Indexed queries on the binders, alleles, genes and expression levels
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script loads the netMHC predictions of 04, the genes of the peptides (hits of 02), the expression
+# of the genes in chondrosarcoma, the mean expression per GTEx tissue (07) and the IEDB references (table_ref.tsv)
+# once in memory, and answers queries such as "strong binders of HLA-B0702 from genes with a mean expression above 5
+# in chondrosarcoma and below 1 TPM in the GTEx tissues other than testis" without running 05 or the notebooks. The
+# predictions are stored as arrays (allele, peptide and gene codes of categorical names, float32 affinity and rank)
+# sorted by allele and affinity, so the binders of an allele under an affinity threshold are a slice found by binary
+# search; the gene filters are computed once per gene and applied to the rows through the gene codes. The files are
+# checked (size and date) before the queries and reloaded when they changed, the queries use the previous data
+# during the reload. The queries are made from Python (QueryService.query), from the command line, or through a
+# local HTTP server (asyncio, JSON results).
+#
+# Usage :
+#   python query_service.py query --allele HLA-B0702 --binder SB --min-expression 5 --max-gtex 1
+#   python query_service.py serve --port 8765
+#   curl "http://127.0.0.1:8765/query?allele=HLA-B0702&binder=SB&min_expression=5&max_gtex=1&exclude_tissues=Testis"
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from iedb_tables import cached
+from netmhc_io import annotate_genes, iter_predictions, peptide_genes
+from peptide_integration import QUANTILES, expression_summary
+
+# Files loaded by default (paths relative to the scripts directory)
+SOURCES = {
+    'netmhc': ['../results/netmhc_sb', '../results/netmhc_wb'],
+    'hits': '../results/selected_results_blastp_0_mismatch.tsv',
+    'genes': '../data/entry_name_gene_name.tsv',
+    'expression': '../../Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv',
+    'gtex': '../../Chondrosarcoma/results/matrix_expr_cta_tissues_gtex.tsv',
+    'ref': '../data/table_ref.tsv',
+}
+BINDERS = ['SB', 'WB', '']
+EXPRESSION_STATS = ['Mean_expression'] + list(QUANTILES)
+
+
+def reduce_predictions(df, s_genes):
+    """
+    One line per allele, peptide and gene for a chunk of predictions (best affinity, rank and binder level)
+
+    Input:
+        df (DataFrame): Predictions (netmhc_io.iter_predictions)
+        s_genes (Series): Genes of each peptide ID (netmhc_io.peptide_genes)
+
+    Output:
+        DataFrame with the columns allele, peptide, gene, affinity, rank and binder (position in BINDERS)
+    """
+    df = annotate_genes(df, s_genes)
+    df = df[df['genes'] != ''].assign(gene = lambda d: d['genes'].str.split(', ')).explode('gene')
+    df['binder'] = df['binder'].astype(str).map(BINDERS.index).astype('int8')
+    return df.groupby(['allele', 'peptide', 'gene'], observed = True, sort = False).agg(
+        affinity = ('affinity', 'min'), rank = ('rank', 'min'), binder = ('binder', 'min')).reset_index()
+
+
+class PeptideIndex:
+    """
+    Predictions and gene annotations in arrays, indexed by allele (sorted by affinity) and by gene
+
+    Input:
+        df_binders (DataFrame): Columns allele, peptide, gene, affinity, rank and binder (see reduce_predictions)
+        df_expr (DataFrame): Expression summary of the genes (peptide_integration.expression_summary), None if missing
+        df_gtex (DataFrame): Mean expression per tissue, tissues in lines and genes in columns, None if missing
+        df_ref (DataFrame): IEDB references (table_ref.tsv), None if missing
+    """
+    def __init__(self, df_binders, df_expr = None, df_gtex = None, df_ref = None):
+        # Names stored once, the rows only keep their codes
+        allele = pd.Categorical(df_binders['allele'].astype(str))
+        peptide = pd.Categorical(df_binders['peptide'].astype(str))
+        gene = pd.Categorical(df_binders['gene'].astype(str))
+        self.alleles, self.peptides, self.genes = allele.categories, peptide.categories, gene.categories
+
+        # Rows sorted by allele then affinity, the rows of an allele are between allele_start[a] and allele_start[a + 1]
+        affinity = df_binders['affinity'].to_numpy(dtype = np.float32)
+        order = np.lexsort((affinity, allele.codes))
+        self.allele_codes = allele.codes[order].astype(np.int16)
+        self.peptide_codes = peptide.codes[order].astype(np.int32)
+        self.gene_codes = gene.codes[order].astype(np.int32)
+        self.affinity = affinity[order]
+        self.rank = df_binders['rank'].to_numpy(dtype = np.float32)[order]
+        self.binder = df_binders['binder'].to_numpy(dtype = np.int8)[order]
+        self.allele_start = np.concatenate([[0], np.cumsum(np.bincount(self.allele_codes, minlength = len(self.alleles)))])
+
+        # Rows of each gene
+        self.gene_order = np.argsort(self.gene_codes, kind = 'stable')
+        self.gene_start = np.concatenate([[0], np.cumsum(np.bincount(self.gene_codes, minlength = len(self.genes)))])
+
+        # Annotations of the genes, aligned with the gene codes
+        self.expression = {}
+        if df_expr is not None:
+            df_expr = df_expr.set_index('SYMBOL').reindex(self.genes)
+            self.expression = {column: df_expr[column].to_numpy(dtype = np.float32) for column in EXPRESSION_STATS}
+        self.tissues = pd.Index([])
+        self.gtex = np.empty((len(self.genes), 0), dtype = np.float32)
+        if df_gtex is not None:
+            self.tissues = df_gtex.index
+            self.gtex = df_gtex.T.reindex(self.genes).to_numpy(dtype = np.float32)
+        self.refs = np.full(len(self.genes), np.nan, dtype = np.float32)
+        self.main_peptide = np.full(len(self.genes), None, dtype = object)
+        if df_ref is not None:
+            df_ref = df_ref.drop_duplicates('Genes').set_index('Genes').reindex(self.genes)
+            self.refs = df_ref['Number of IEDB ref'].to_numpy(dtype = np.float32)
+            self.main_peptide = df_ref['main peptide'].to_numpy(dtype = object)
+
+    def __len__(self):
+        return len(self.affinity)
+
+    def gtex_max(self, exclude_tissues = ()):
+        """
+        Maximum of the mean expression of each gene over the GTEx tissues, without the excluded tissues (NaN for the
+        genes missing in GTEx)
+        """
+        kept = ~self.tissues.isin(list(exclude_tissues))
+        if not kept.any():
+            return np.full(len(self.genes), np.nan, dtype = np.float32)
+        return np.fmax.reduce(self.gtex[:, kept], axis = 1)
+
+    def gene_mask(self, genes = None, min_expression = None, expression = 'Mean_expression', max_gtex = None,
+                  exclude_tissues = ('Testis',), min_refs = None):
+        """
+        Genes passing the gene filters (see query), None if there is no gene filter
+        """
+        mask = None
+        def combine(values):
+            return values if mask is None else mask & values
+        if genes is not None:
+            mask = combine(self.genes.isin(list(genes)))
+        if min_expression is not None:
+            if expression not in self.expression:
+                raise ValueError(f'No expression {expression}, use one of {", ".join(self.expression) or "none (file missing)"}')
+            mask = combine(self.expression[expression] >= min_expression)
+        if max_gtex is not None:
+            if not len(self.tissues):
+                raise ValueError('No GTEx expression loaded')
+            mask = combine(self.gtex_max(exclude_tissues) <= max_gtex)
+        if min_refs is not None:
+            mask = combine(self.refs >= min_refs)
+        return mask
+
+    def query(self, genes = None, alleles = None, max_affinity = None, max_rank = None, binders = None,
+              min_expression = None, expression = 'Mean_expression', max_gtex = None, exclude_tissues = ('Testis',),
+              min_refs = None, limit = None):
+        """
+        Binders passing all the filters (None: filter not used)
+
+        Input:
+            genes (list of str): Genes of the peptides
+            alleles (list of str): Alleles (e.g. HLA-B0702)
+            max_affinity (float): Maximal affinity in nM
+            max_rank (float): Maximal %Rank
+            binders (list of str): Binder levels ('SB', 'WB', '' for the predictions of res_netmhc without level)
+            min_expression (float): Minimal expression of the gene in chondrosarcoma
+            expression (str): Statistic of the expression used by min_expression (Mean_expression, Q25_expression,
+                Median_expression or Q75_expression)
+            max_gtex (float): Maximal mean TPM of the gene in the GTEx tissues (genes missing in GTEx are removed)
+            exclude_tissues (list of str): GTEx tissues not used by max_gtex
+            min_refs (int): Minimal number of IEDB references of the gene (table_ref.tsv)
+            limit (int): Maximal number of lines returned (best affinities first)
+
+        Output:
+            DataFrame with the columns Allele, Peptide, SYMBOL, Affinity, Rank, Binder, the expression summary, GTEx_max
+            and IEDB_refs, sorted by affinity
+        """
+        gene_ok = self.gene_mask(genes, min_expression, expression, max_gtex, exclude_tissues, min_refs)
+
+        # Candidate rows: slices of the alleles cut at the affinity threshold, or rows of the genes
+        if alleles is not None:
+            l_rows = []
+            for a in self.alleles.get_indexer(list(alleles)):
+                if a < 0:
+                    continue
+                start, end = self.allele_start[a], self.allele_start[a + 1]
+                if max_affinity is not None:
+                    end = start + np.searchsorted(self.affinity[start:end], max_affinity, side = 'right')
+                l_rows.append(np.arange(start, end))
+            rows = np.concatenate(l_rows) if l_rows else np.empty(0, dtype = np.int64)
+        elif genes is not None:
+            codes = np.flatnonzero(gene_ok)
+            rows = np.concatenate([self.gene_order[self.gene_start[g]:self.gene_start[g + 1]] for g in codes] +
+                                  [np.empty(0, dtype = np.int64)])
+        else:
+            rows = np.arange(len(self))
+
+        mask = np.ones(len(rows), dtype = bool)
+        if max_affinity is not None and alleles is None:
+            mask &= self.affinity[rows] <= max_affinity
+        if max_rank is not None:
+            mask &= self.rank[rows] <= max_rank
+        if binders is not None:
+            mask &= np.isin(self.binder[rows], [BINDERS.index(binder) for binder in binders])
+        if gene_ok is not None:
+            mask &= gene_ok[self.gene_codes[rows]]
+        rows = rows[mask]
+        rows = rows[np.argsort(self.affinity[rows], kind = 'stable')][:limit]
+        return self.frame(rows, exclude_tissues)
+
+    def frame(self, rows, exclude_tissues = ('Testis',)):
+        """
+        DataFrame of some rows with the annotations of their genes
+        """
+        genes = self.gene_codes[rows]
+        df = pd.DataFrame({'Allele': self.alleles[self.allele_codes[rows]], 'Peptide': self.peptides[self.peptide_codes[rows]],
+                           'SYMBOL': self.genes[genes], 'Affinity': self.affinity[rows], 'Rank': self.rank[rows],
+                           'Binder': np.array(BINDERS, dtype = object)[self.binder[rows]]})
+        for column, values in self.expression.items():
+            df[column] = values[genes]
+        if len(self.tissues):
+            df['GTEx_max'] = self.gtex_max(exclude_tissues)[genes]
+        df['IEDB_refs'] = self.refs[genes]
+        df['IEDB_main_peptide'] = self.main_peptide[genes]
+        return df
+
+
+def source_files(sources):
+    """
+    Files of the sources (the .out files of the netMHC directories), the missing optional files are kept
+    """
+    l_files = []
+    for path in sources['netmhc']:
+        if os.path.isdir(path):
+            l_files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.out'))
+        else:
+            l_files.append(path)
+    return l_files + [sources[key] for key in ('hits', 'genes', 'expression', 'gtex', 'ref')]
+
+
+def signature(sources):
+    """
+    Size and date of the files of the sources (None for a missing file), compared to detect a change
+    """
+    l_signature = []
+    for path in source_files(sources):
+        try:
+            stat = os.stat(path)
+            l_signature.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            l_signature.append((path, None, None))
+    return tuple(l_signature)
+
+
+def load_index(sources, binders = None, cache_dir = '../results/cache'):
+    """
+    Read the sources and build the index, the expression, GTEx and IEDB references files are optional
+
+    Input:
+        sources (dict): Paths of the files (see SOURCES)
+        binders (set of str): Binder levels read from the netMHC outputs, None for all the predictions
+        cache_dir (str): Directory of the cached expression summary (see peptide_integration.py)
+
+    Output:
+        PeptideIndex
+    """
+    s_genes = peptide_genes(sources['hits'], sources['genes'])
+    l_chunks = [reduce_predictions(df, s_genes) for df in iter_predictions(sources['netmhc'], binders)]
+    if l_chunks:
+        df_binders = pd.concat(l_chunks, ignore_index = True).groupby(['allele', 'peptide', 'gene'], observed = True).agg(
+            affinity = ('affinity', 'min'), rank = ('rank', 'min'), binder = ('binder', 'min')).reset_index()
+    else:
+        df_binders = pd.DataFrame({'allele': [], 'peptide': [], 'gene': [], 'affinity': [], 'rank': [], 'binder': []})
+    df_expr = df_gtex = df_ref = None
+    if os.path.exists(sources['expression']):
+        df_expr = cached('expression_summary', [sources['expression']], lambda: expression_summary(sources['expression']),
+                         cache_dir)
+    if os.path.exists(sources['gtex']):
+        df_gtex = pd.read_csv(sources['gtex'], sep = '\t', index_col = 0)
+    if os.path.exists(sources['ref']):
+        df_ref = pd.read_csv(sources['ref'], sep = '\t')
+    return PeptideIndex(df_binders, df_expr, df_gtex, df_ref)
+
+
+class QueryService:
+    """
+    Index of the sources reloaded when the files change
+
+    Input:
+        sources (dict): Paths of the files (see SOURCES), missing keys use SOURCES
+        binders (set of str): Binder levels read from the netMHC outputs, None for all the predictions
+        check_interval (float): Minimal time in seconds between two checks of the files before a query
+    """
+    def __init__(self, sources = None, binders = None, check_interval = 2.0):
+        self.sources = {**SOURCES, **(sources or {})}
+        self.binders = binders
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.index = None
+        self.loaded = None
+        self.failed = None
+        self.checked = 0.0
+        self.reload()
+
+    def reload(self, force = False, wait = True):
+        """
+        Build a new index if the files changed since the last load, the previous index is used until the new one is
+        ready (and kept if the files can't be read, e.g. while they are written)
+
+        Input:
+            force (bool): Reload even if the files didn't change
+            wait (bool): Wait for a reload already running in another thread, return False at once otherwise
+
+        Output:
+            True if a new index was loaded
+        """
+        if not self.lock.acquire(blocking = wait):
+            return False
+        try:
+            self.checked = time.monotonic()
+            current = signature(self.sources)
+            if not force and (current == self.loaded or current == self.failed):
+                return False
+            start = time.perf_counter()
+            try:
+                index = load_index(self.sources, self.binders)
+            except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+                self.failed = current
+                if self.index is None:
+                    raise
+                print(f'Reload failed ({type(e).__name__}: {e}), the previous data are used', flush = True)
+                return False
+            self.index, self.loaded, self.failed = index, current, None
+            self.load_time = time.perf_counter() - start
+            print(f'{len(index)} binders of {len(index.alleles)} alleles and {len(index.genes)} genes loaded in '
+                  f'{self.load_time:.1f} s', flush = True)
+            return True
+        finally:
+            self.lock.release()
+
+    def query(self, **filters):
+        """
+        Binders passing the filters (see PeptideIndex.query), the files are checked first if check_interval passed (the
+        current index is used if another thread is reloading it)
+        """
+        if time.monotonic() - self.checked >= self.check_interval:
+            self.reload(wait = False)
+        return self.index.query(**filters)
+
+    def status(self):
+        index = self.index
+        return {'binders': len(index), 'alleles': list(index.alleles), 'genes': len(index.genes),
+                'peptides': len(index.peptides), 'tissues': list(index.tissues), 'load_seconds': round(self.load_time, 3),
+                'files': [path for path, size, _ in self.loaded if size is not None]}
+
+
+def parse_filters(d_params):
+    """
+    Filters of PeptideIndex.query from the parameters of a URL or of the command line (lists separated by commas)
+    """
+    d_types = {'gene': ('genes', list), 'allele': ('alleles', list), 'binder': ('binders', list),
+               'exclude_tissues': ('exclude_tissues', list), 'max_affinity': ('max_affinity', float),
+               'max_rank': ('max_rank', float), 'min_expression': ('min_expression', float),
+               'expression': ('expression', str), 'max_gtex': ('max_gtex', float), 'min_refs': ('min_refs', float),
+               'limit': ('limit', int)}
+    d_filters = {}
+    for key, value in d_params.items():
+        if value is None or key not in d_types:
+            continue
+        name, kind = d_types[key]
+        d_filters[name] = [item for item in value.split(',') if item or key == 'binder'] if kind is list else kind(value)
+    return d_filters
+
+
+async def handle(service, reader, writer):
+    """
+    Answer one HTTP GET request: /query?<filters> (JSON lines of the binders) or /status
+    """
+    try:
+        request = (await reader.readline()).decode('latin-1').split()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        if len(request) < 2 or request[0] != 'GET':
+            code, body = 405, {'error': 'Only GET requests are accepted'}
+        else:
+            url = urlsplit(request[1])
+            if url.path == '/status':
+                code, body = 200, service.status()
+            elif url.path == '/query':
+                try:
+                    d_params = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values = True).items()}
+                    start = time.perf_counter()
+                    # The files are checked (and reloaded) in a thread, the other requests are answered meanwhile
+                    df = await asyncio.get_running_loop().run_in_executor(None, lambda: service.query(**parse_filters(d_params)))
+                    code, body = 200, {'n': len(df), 'milliseconds': round((time.perf_counter() - start) * 1000, 2),
+                                       'rows': json.loads(df.to_json(orient = 'records'))}
+                except ValueError as e:
+                    code, body = 400, {'error': str(e)}
+            else:
+                code, body = 404, {'error': 'Unknown path, use /query or /status'}
+        data = json.dumps(body).encode()
+        writer.write(f'HTTP/1.1 {code} {"OK" if code == 200 else "Error"}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(service, host = '127.0.0.1', port = 8765):
+    """
+    Local HTTP server answering the queries, the files are also checked every check_interval seconds without query
+    """
+    server = await asyncio.start_server(lambda reader, writer: handle(service, reader, writer), host, port)
+    print(f'Queries on http://{host}:{port}/query, status on http://{host}:{port}/status')
+    async with server:
+        while True:
+            await asyncio.sleep(service.check_interval)
+            await asyncio.get_running_loop().run_in_executor(None, service.reload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Queries on the binders, alleles, genes and expression levels')
+    parser.add_argument('command', choices = ['query', 'serve'])
+    parser.add_argument('--netmhc', nargs = '+', default = SOURCES['netmhc'],
+                        help = 'netMHC output files or directories (../results/res_netmhc for all the predictions)')
+    # Files of the sources, the filters of the query command are below
+    d_options = {'hits': '--hits', 'genes': '--gene-names', 'expression': '--expression-table', 'gtex': '--gtex', 'ref': '--ref'}
+    for key, option in d_options.items():
+        parser.add_argument(option, dest = key + '_file', default = SOURCES[key])
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8765)
+    parser.add_argument('--check-interval', type = float, default = 2.0, help = 'Seconds between two checks of the files')
+    # Filters of the query command (comma-separated lists)
+    parser.add_argument('--gene')
+    parser.add_argument('--allele')
+    parser.add_argument('--binder', help = 'Binder levels, e.g. SB or SB,WB')
+    parser.add_argument('--max-affinity')
+    parser.add_argument('--max-rank')
+    parser.add_argument('--min-expression')
+    parser.add_argument('--expression', help = ', '.join(EXPRESSION_STATS))
+    parser.add_argument('--max-gtex')
+    parser.add_argument('--exclude-tissues', help = 'GTEx tissues not used by --max-gtex (Testis by default)')
+    parser.add_argument('--min-refs')
+    parser.add_argument('--limit')
+    args = parser.parse_args()
+
+    d_sources = {'netmhc': args.netmhc, **{key: getattr(args, key + '_file') for key in d_options}}
+    service = QueryService(d_sources, check_interval = args.check_interval)
+    if args.command == 'serve':
+        asyncio.run(serve(service, args.host, args.port))
+    else:
+        start = time.perf_counter()
+        df = service.query(**parse_filters(vars(args)))
+        print(df.to_csv(sep = '\t', index = False), end = '')
+        print(f'{len(df)} lines in {(time.perf_counter() - start) * 1000:.1f} ms')
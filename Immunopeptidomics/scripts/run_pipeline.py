@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Incremental runner of the immunopeptidomics pipeline (00 -> 05)
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script runs the stages of the pipeline (IEDB extraction, peptide table of 01, peptide fasta,
+# peptide matching and selection of the hits of 02, gene names of the CTA, aligned peptides of 03, netMHC predictions
+# of 04 and analysis of 05) as a graph declared by their input and output files. A stage is run only if the content
+# hash of its inputs (data files and scripts) or its command changed since its last run, or if one of its outputs is
+# missing or was modified; the other stages are skipped. Stages whose inputs are ready run in parallel (e.g. the gene
+# names and the peptide table). A stage whose outputs are the same as before doesn't rerun the next stages. The hashes
+# are saved in results/pipeline_state.json (files are hashed again only when their size or date changed), the output
+# of each stage in results/pipeline_logs/ and the runtimes of each run in results/pipeline_runs.tsv. Each stage run
+# is measured as a process (with its child processes): wall time, CPU time, peak resident memory, bytes read from and
+# written to the disk, and size of its outputs, appended as one JSON line to results/pipeline_metrics.jsonl. If the
+# environment variable PIPELINE_PROFILE is a directory, the python scripts of the stages are run with cProfile
+# (<stage>.prof), or every stage with py-spy if PIPELINE_PROFILER=py-spy (<stage>.svg). Inside the prediction stage,
+# only the missing allele x shard jobs and the peptides missing in the affinity cache are predicted (see
+# netmhc_scheduler.py), so a new allele or a few new CTA sequences don't predict everything again.
+#
+# Usage :
+#   python run_pipeline.py --jobs 4
+#   python run_pipeline.py --dry-run
+#   python run_pipeline.py --predictor "python stub_netmhc.py" --alleles HLA-A0201,HLA-B0702
+#   python run_pipeline.py --iedb-db sqlite:///../data/iedb.sqlite --force peptides_table
+#   PIPELINE_PROFILE=../results/profiles python run_pipeline.py --force analysis
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from iedb_tables import file_hash
+from netmhc_scheduler import ALLELES
+
+# Paths of the stages are relative to the Immunopeptidomics directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_FILE = 'results/pipeline_state.json'
+LOG_DIR = 'results/pipeline_logs'
+RUNS_FILE = 'results/pipeline_runs.tsv'
+METRICS_FILE = 'results/pipeline_metrics.jsonl'
+PROFILE_ENV = 'PIPELINE_PROFILE'
+PROFILER_ENV = 'PIPELINE_PROFILER'
+
+
+def stage(name, command, inputs, outputs, cwd = 'scripts'):
+    """
+    Declare a stage
+
+    Input:
+        name (str): Stage name
+        command (str): Shell command, run from cwd
+        inputs (list of str): Files or directories read by the stage (scripts included)
+        outputs (list of str): Files or directories written by the stage
+        cwd (str): Directory of the command ('scripts' for the scripts using ../results, '.' for 02)
+
+    Output:
+        Dictionary of the stage
+    """
+    return {'name': name, 'command': command, 'inputs': inputs, 'outputs': outputs, 'cwd': cwd}
+
+
+def pipeline_stages(alleles = ALLELES, predictor = 'netMHC', workers = 8, iedb_db = None):
+    """
+    Stages of the pipeline, with the same commands as the scripts 01 to 05
+
+    Input:
+        alleles (list of str): Alleles predicted by netMHC
+        predictor (str): Predictor command ('netMHC' or 'python stub_netmhc.py')
+        workers (int): Number of netMHC jobs at the same time
+        iedb_db (str): Database of iedb_extract.py (the tables of results/db_tables are an input if None)
+
+    Output:
+        List of stages
+    """
+    l_stages = []
+    if iedb_db is not None:
+        l_stages.append(stage('extract', f'python iedb_extract.py --db {iedb_db} --out ../results/db_tables',
+                              ['scripts/iedb_extract.py'], ['results/db_tables']))
+    cta_fasta = 'data/proteine_seq_targeted_cta.fasta'
+    hits = 'results/selected_results_blastp_0_mismatch.tsv'
+    l_stages += [
+        stage('peptides_table', 'python 01_immunopeptido_create_peptides_table.py',
+              ['results/db_tables', 'scripts/01_immunopeptido_create_peptides_table.py', 'scripts/iedb_tables.py'],
+              ['results/table_peptides_cancer_human.tsv']),
+        stage('peptides_fasta',
+              "awk -F'\\t' 'NR > 1 {print \">\" $1 \"\\n\" $6}' results/table_peptides_cancer_human.tsv > results/seq_pep.fasta",
+              ['results/table_peptides_cancer_human.tsv'], ['results/seq_pep.fasta'], cwd = '.'),
+        stage('gene_names', f'python scripts/fasta_index.py gene-names {cta_fasta} > data/entry_name_gene_name.tsv',
+              [cta_fasta, 'scripts/fasta_index.py'], ['data/entry_name_gene_name.tsv'], cwd = '.'),
+        stage('match', f'python scripts/peptide_matcher.py --query results/seq_pep.fasta --db {cta_fasta} '
+                       '--out results/results_blastp.tsv --max-mismatch 1 --threads 6',
+              ['results/seq_pep.fasta', cta_fasta, 'scripts/peptide_matcher.py', 'scripts/fasta_index.py'],
+              ['results/results_blastp.tsv'], cwd = '.'),
+        stage('select_hits', f"awk -F'\\t' '($13 == 0)' results/results_blastp.tsv > {hits}",
+              ['results/results_blastp.tsv'], [hits], cwd = '.'),
+        stage('aligned_fasta', 'python 03_immunopeptido_fasta_aligned_pep.py',
+              [hits, 'results/seq_pep.fasta', 'data/entry_name_gene_name.tsv', 'scripts/03_immunopeptido_fasta_aligned_pep.py',
+               'scripts/fasta_index.py'],
+              ['results/seq_pep_aligned.fasta']),
+        stage('predict', f'python netmhc_scheduler.py --fasta ../results/seq_pep_aligned.fasta '
+                         f'--alleles {",".join(alleles)} --results-dir ../results --predictor "{predictor}" --lengths 8,9,10 '
+                         f'--workers {workers} --dedup --shard-size 50000 --cache ../results/cache/affinity_cache.sqlite '
+                         '--predictor-version 4.0 --max-cache-entries 50000000',
+              ['results/seq_pep_aligned.fasta', 'scripts/netmhc_scheduler.py', 'scripts/kmer_windows.py',
+               'scripts/affinity_cache.py', 'scripts/netmhc_io.py'],
+              [f'results/res_netmhc/res_netmhc_{allele}_selected_blastp.out' for allele in alleles] +
+              [f'results/netmhc_sb/res_netmhc_{allele}_selected_blastp_sb.out' for allele in alleles] +
+              [f'results/netmhc_wb/res_netmhc_{allele}_selected_blastp_wb.out' for allele in alleles]),
+        stage('analysis', 'python 05_immunopeptido_analysis.py',
+              [f'results/netmhc_{binder}/res_netmhc_{allele}_selected_blastp_{binder}.out' for binder in ['sb', 'wb']
+               for allele in alleles] +
+              [hits, 'data/entry_name_gene_name.tsv', '../Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv',
+               'scripts/05_immunopeptido_analysis.py', 'scripts/netmhc_io.py', 'scripts/peptide_integration.py'],
+              ['results/df_peptides_genes_aff_hla_a0201.tsv', 'results/df_peptides_alleles_genes_expr.tsv']),
+    ]
+    return l_stages
+
+
+def dependencies(l_stages):
+    """
+    Stages producing the inputs of each stage (an input inside an output directory depends on its stage)
+
+    Output:
+        Dictionary stage name -> set of stage names
+    """
+    d_producers = {path: s['name'] for s in l_stages for path in s['outputs']}
+    d_deps = {}
+    for s in l_stages:
+        d_deps[s['name']] = set()
+        for path in s['inputs']:
+            for output, producer in d_producers.items():
+                if producer != s['name'] and (path == output or path.startswith(output + '/')):
+                    d_deps[s['name']].add(producer)
+    return d_deps
+
+
+class Fingerprints:
+    """
+    Content hashes of the files, computed again only when the size or the modification date of a file changed
+
+    Input:
+        d_files (dict): Saved hashes, path -> [size, mtime_ns, hash]
+    """
+
+    def __init__(self, d_files = None):
+        self.d_files = d_files or {}
+
+    def file(self, path):
+        stat = os.stat(path)
+        saved = self.d_files.get(path)
+        if saved is not None and saved[0] == stat.st_size and saved[1] == stat.st_mtime_ns:
+            return saved[2]
+        digest = file_hash(path)
+        self.d_files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def path(self, path):
+        """
+        Hash of a file, of the files directly in a directory (names and contents), or None if the path doesn't exist
+        """
+        full_path = os.path.join(ROOT, path)
+        if os.path.isfile(full_path):
+            return self.file(full_path)
+        if not os.path.isdir(full_path):
+            return None
+        h = hashlib.blake2b(digest_size = 16)
+        for file in sorted(os.listdir(full_path)):
+            if os.path.isfile(os.path.join(full_path, file)) and not file.startswith('.'):
+                h.update(f'{file}:{self.file(os.path.join(full_path, file))}\n'.encode())
+        return h.hexdigest()
+
+    def stage(self, s):
+        """
+        Hash of the command and of the inputs of a stage, None if an input is missing
+        """
+        h = hashlib.blake2b(digest_size = 16)
+        h.update(f'{s["cwd"]}\n{s["command"]}\n'.encode())
+        for path in s['inputs']:
+            digest = self.path(path)
+            if digest is None:
+                return None
+            h.update(f'{path}:{digest}\n'.encode())
+        return h.hexdigest()
+
+
+def load_state(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {'files': {}, 'stages': {}}
+
+
+def save_state(state, path):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent = 1)
+    os.replace(path + '.tmp', path)
+
+
+def outdated(s, state, fingerprints, force = ()):
+    """
+    Reason to run a stage, None if it is up to date
+    """
+    if s['name'] in force:
+        return 'forced'
+    saved = state['stages'].get(s['name'])
+    fingerprint = fingerprints.stage(s)
+    if fingerprint is None:
+        return 'input missing'
+    if saved is None:
+        return 'never run'
+    if saved['fingerprint'] != fingerprint:
+        return 'inputs or command changed'
+    for path in s['outputs']:
+        digest = fingerprints.path(path)
+        if digest is None:
+            return f'{path} missing'
+        if digest != saved['outputs'].get(path):
+            return f'{path} modified'
+    return None
+
+
+def profiled(s):
+    """
+    Command of a stage run with a profiler if the environment variable PIPELINE_PROFILE is set (the command saved in the
+    state is not changed, so profiling doesn't make a stage outdated)
+    """
+    directory = os.environ.get(PROFILE_ENV)
+    if not directory:
+        return s['command']
+    directory = os.path.abspath(directory)
+    os.makedirs(directory, exist_ok = True)
+    if os.environ.get(PROFILER_ENV, 'cprofile') == 'py-spy':
+        return (f'py-spy record --subprocesses --output {shlex.quote(os.path.join(directory, s["name"] + ".svg"))} -- '
+                f'bash -c {shlex.quote(s["command"])}')
+    if s['command'].startswith('python '):
+        return (f'python -m cProfile -o {shlex.quote(os.path.join(directory, s["name"] + ".prof"))} '
+                + s['command'].removeprefix('python '))
+    return s['command']
+
+
+def run_stage(s, log_dir):
+    """
+    Run the command of a stage, its output is saved in log_dir/name.log
+
+    Output:
+        Tuple (return code, dictionary with the runtime, the CPU time and the peak memory of the stage and of its child
+        processes, and the bytes read from and written to the disk, None where os.wait4 doesn't exist)
+    """
+    start = time.time()
+    for path in s['outputs']:
+        os.makedirs(os.path.dirname(os.path.join(ROOT, path)), exist_ok = True)
+    d_metrics = {'wall_s': None, 'cpu_s': None, 'peak_rss_mb': None, 'bytes_read': None, 'bytes_written': None}
+    with open(os.path.join(log_dir, s['name'] + '.log'), 'w') as f:
+        process = subprocess.Popen(profiled(s), shell = True, cwd = os.path.join(ROOT, s['cwd']), stdout = f,
+                                   stderr = subprocess.STDOUT, executable = '/bin/bash' if os.name != 'nt' else None)
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kB on Linux and in bytes on macOS, the blocks are 512 bytes
+            d_metrics = {'wall_s': None, 'cpu_s': round(rusage.ru_utime + rusage.ru_stime, 3),
+                         'peak_rss_mb': round(rusage.ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1),
+                         'bytes_read': rusage.ru_inblock * 512, 'bytes_written': rusage.ru_oublock * 512}
+        else:
+            process.wait()
+    d_metrics['wall_s'] = time.time() - start
+    return process.returncode, d_metrics
+
+
+def output_bytes(s):
+    """
+    Size of the outputs of a stage in bytes (files of the output directories included)
+    """
+    size = 0
+    for path in s['outputs']:
+        path = os.path.join(ROOT, path)
+        if os.path.isdir(path):
+            size += sum(os.path.getsize(os.path.join(root, file)) for root, _, l_files in os.walk(path) for file in l_files)
+        elif os.path.exists(path):
+            size += os.path.getsize(path)
+    return size
+
+
+def run(l_stages, jobs = 2, force = (), dry_run = False):
+    """
+    Run the outdated stages of the pipeline, at most `jobs` at the same time
+
+    Input:
+        l_stages (list of dict): Stages (see pipeline_stages)
+        jobs (int): Number of stages run at the same time
+        force (iterable of str): Stages run even if they are up to date
+        dry_run (bool): Only print the stages that would run (a stage is listed if one of its dependencies would run)
+
+    Output:
+        List of (stage, status: run, skipped, failed or blocked, seconds, reason)
+    """
+    path_state = os.path.join(ROOT, STATE_FILE)
+    log_dir = os.path.join(ROOT, LOG_DIR)
+    os.makedirs(log_dir, exist_ok = True)
+    state = load_state(path_state)
+    fingerprints = Fingerprints(state['files'])
+    d_stages = {s['name']: s for s in l_stages}
+    d_deps = dependencies(l_stages)
+    d_status = {}
+    l_report = []
+    l_metrics = []
+
+    with ThreadPoolExecutor(max_workers = jobs) as pool:
+        d_running = {}
+        while len(d_status) < len(l_stages):
+            # Stages whose dependencies are finished, in the declaration order
+            for name, s in d_stages.items():
+                if name in d_status or any(dep not in d_status or d_status[dep] == 'running' for dep in d_deps[name]):
+                    continue
+                if any(d_status[dep] in ('failed', 'blocked') for dep in d_deps[name]):
+                    d_status[name] = 'blocked'
+                    l_report.append((name, 'blocked', 0.0, 'a dependency failed'))
+                    continue
+                if dry_run and any(d_status[dep] == 'run' for dep in d_deps[name]):
+                    reason = 'a dependency runs'
+                else:
+                    reason = outdated(s, state, fingerprints, force)
+                if reason is None:
+                    d_status[name] = 'skipped'
+                    l_report.append((name, 'skipped', 0.0, 'up to date'))
+                elif dry_run:
+                    d_status[name] = 'run'
+                    l_report.append((name, 'run', 0.0, reason))
+                else:
+                    print(f'{name}: run ({reason})', flush = True)
+                    d_status[name] = 'running'
+                    d_running[pool.submit(run_stage, s, log_dir)] = (name, reason)
+            if not d_running:
+                if len(d_status) < len(l_stages) and not dry_run:
+                    raise ValueError('Cycle in the dependencies of the stages')
+                continue
+
+            # Wait for a stage, its hashes are saved as soon as it succeeded
+            done, _ = wait(d_running, return_when = FIRST_COMPLETED)
+            for future in done:
+                name, reason = d_running.pop(future)
+                s = d_stages[name]
+                try:
+                    returncode, d_metrics = future.result()
+                except OSError as e:
+                    returncode, d_metrics = repr(e), {'wall_s': 0.0}
+                seconds = d_metrics['wall_s']
+                d_outputs = {path: fingerprints.path(path) for path in s['outputs']}
+                l_missing = [path for path, digest in d_outputs.items() if digest is None]
+                if returncode != 0 or l_missing:
+                    d_status[name] = 'failed'
+                    error = f'exit code {returncode}' if returncode != 0 else f'outputs not written: {", ".join(l_missing)}'
+                    l_report.append((name, 'failed', seconds, f'{error}, see {LOG_DIR}/{name}.log'))
+                    print(f'{name}: failed in {seconds:.1f} s ({error})', flush = True)
+                    state['stages'].pop(name, None)
+                    l_metrics.append({'stage': name, 'status': 'failed', **d_metrics})
+                else:
+                    d_status[name] = 'run'
+                    l_report.append((name, 'run', seconds, reason))
+                    print(f'{name}: done in {seconds:.1f} s', flush = True)
+                    state['stages'][name] = {'fingerprint': fingerprints.stage(s), 'outputs': d_outputs,
+                                             'seconds': round(seconds, 2), 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+                    l_metrics.append({'stage': name, 'status': 'done', **d_metrics, 'output_bytes': output_bytes(s)})
+                save_state(state, path_state)
+
+    if not dry_run:
+        save_state(state, path_state)
+        path_runs = os.path.join(ROOT, RUNS_FILE)
+        new_file = not os.path.exists(path_runs)
+        date = time.strftime('%Y-%m-%d %H:%M:%S')
+        with open(path_runs, 'a') as f:
+            if new_file:
+                f.write('date\tstage\tstatus\tseconds\treason\n')
+            for name, status, seconds, reason in l_report:
+                f.write(f'{date}\t{name}\t{status}\t{seconds:.2f}\t{reason}\n')
+        with open(os.path.join(ROOT, METRICS_FILE), 'a') as f:
+            for d_metrics in l_metrics:
+                f.write(json.dumps({'date': date, **d_metrics, 'wall_s': round(d_metrics['wall_s'], 3)}) + '\n')
+    return l_report
+
+
+def print_report(l_report):
+    """
+    Print the status and the runtime of each stage
+    """
+    print(f'\n{"stage":<16}{"status":<9}{"seconds":>9}  reason')
+    for name, status, seconds, reason in l_report:
+        print(f'{name:<16}{status:<9}{seconds:>9.1f}  {reason}')
+    total = sum(seconds for _, _, seconds, _ in l_report)
+    n_run = sum(status == 'run' for _, status, _, _ in l_report)
+    print(f'{n_run} stages run, {len(l_report) - n_run} not run, {total:.1f} s of stage runtime')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Run the outdated stages of the immunopeptidomics pipeline')
+    parser.add_argument('--jobs', type = int, default = 2, help = 'Number of stages run at the same time')
+    parser.add_argument('--force', default = '', help = 'Comma-separated stages run even if they are up to date')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'Only print the stages that would run')
+    parser.add_argument('--alleles', default = ','.join(ALLELES), help = 'Comma-separated alleles predicted by netMHC')
+    parser.add_argument('--predictor', default = 'netMHC', help = 'Predictor command, e.g. "python stub_netmhc.py"')
+    parser.add_argument('--workers', type = int, default = 8, help = 'Number of netMHC jobs at the same time')
+    parser.add_argument('--iedb-db', help = 'Database of iedb_extract.py (the tables of results/db_tables are used by default)')
+    args = parser.parse_args()
+
+    l_stages = pipeline_stages(args.alleles.split(','), args.predictor, args.workers, args.iedb_db)
+    force = {name for name in args.force.split(',') if name}
+    unknown = force - {s['name'] for s in l_stages}
+    if unknown:
+        sys.exit(f'Unknown stages: {", ".join(sorted(unknown))}')
+    l_report = run(l_stages, args.jobs, force, args.dry_run)
+    print_report(l_report)
+    sys.exit(1 if any(status in ('failed', 'blocked') for _, status, _, _ in l_report) else 0)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Stand-in for the netMHC 4.0 binary
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script accepts the netMHC options used in the pipeline (-a allele, -l lengths, -p for a peptide
+# list, input file) and writes predictions in the netMHC 4.0 format with deterministic pseudo-affinities computed from
+# a hash of the allele and the peptide. It is used to test the prediction scheduler without the licensed tool. If the
+# environment variable STUB_NETMHC_FAIL_RATE is set, the script fails after the first line with this probability.
+#
+# Usage :
+#   python stub_netmhc.py -a HLA-A0201 -l 8,9,10 ../results/seq_pep_aligned.fasta
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import hashlib
+import os
+import random
+import sys
+from netmhc_io import format_line
+
+# %Rank thresholds of netMHC 4.0 for strong and weak binders
+RANK_SB = 0.5
+RANK_WB = 2.0
+
+
+def predict(allele, peptide):
+    """
+    Pseudo-prediction of a peptide
+
+    Output:
+        Tuple (1-log50k(aff), affinity in nM, %rank, binder level)
+    """
+    h = int(hashlib.md5(f'{allele}:{peptide}'.encode()).hexdigest()[:8], 16) / 2 ** 32
+    log_aff = h ** 3
+    affinity = 50000 ** (1 - log_aff)
+    rank = 100 * (1 - h) ** 2
+    binder = 'SB' if rank <= RANK_SB else 'WB' if rank <= RANK_WB else ''
+    return log_aff, affinity, rank, binder
+
+
+def read_input(path, peptide_list):
+    """
+    Read the fasta file or the peptide list
+
+    Output:
+        List of (identity, sequence)
+    """
+    l_records = []
+    with open(path, 'r') as f:
+        if peptide_list:
+            return [('PEPLIST', lig.strip()) for lig in f if lig.strip()]
+        for lig in f:
+            lig = lig.strip()
+            if lig.startswith('>'):
+                l_records.append([lig[1:].split()[0], ''])
+            elif lig and l_records:
+                l_records[-1][1] += lig
+    return [tuple(record) for record in l_records]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'netMHC 4.0 stand-in')
+    parser.add_argument('-a', dest = 'allele', default = 'HLA-A0201')
+    parser.add_argument('-l', dest = 'lengths', default = '9')
+    parser.add_argument('-p', dest = 'peptide_list', action = 'store_true')
+    parser.add_argument('input')
+    args = parser.parse_args()
+
+    fail = random.random() < float(os.environ.get('STUB_NETMHC_FAIL_RATE', 0))
+    lengths = [int(length) for length in args.lengths.split(',')]
+
+    print('# NetMHC version 4.0 (stub)\n')
+    print('-' * 100)
+    print('  pos          HLA      peptide         Core Offset  I_pos  I_len  D_pos  D_len        iCore        Identity '
+          '1-log50k(aff) Affinity(nM)    %Rank  BindLevel')
+    print('-' * 100)
+    for identity, seq in read_input(args.input, args.peptide_list):
+        if args.peptide_list:
+            l_windows = [(0, seq)]
+        else:
+            l_windows = [(pos, seq[pos:pos + length]) for length in lengths for pos in range(len(seq) - length + 1)]
+        for pos, peptide in l_windows:
+            log_aff, affinity, rank, binder = predict(args.allele, peptide)
+            print(format_line(pos, args.allele, peptide, peptide[:9].ljust(9, '-'), peptide, identity, log_aff, affinity,
+                              rank, binder))
+            # Simulated crash after a truncated output
+            if fail:
+                sys.exit('stub_netmhc: simulated failure')
+    print('-' * 100)
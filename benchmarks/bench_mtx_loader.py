@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Benchmark of the 10X loader against sc.read_10x_mtx
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script reads the same 10X directory with sc.read_10x_mtx, with mtx_loader.read_10x without cache
+# (parsing of matrix.mtx in several threads) and with its cache, reports the runtimes and checks that the objects are
+# the same. Without input directory, a synthetic 10X directory (Cell Ranger v3, gzipped) is generated, 100000 cells by
+# default.
+#
+# Usage :
+#   python bench_mtx_loader.py --path ../Chondrosarcoma/data/scrnaseq_data/1_Low_L07_10X --threads 8
+#   python bench_mtx_loader.py --n-cells 100000 --n-genes 20000 --genes-per-cell 300
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import scanpy as sc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Chondrosarcoma', 'scripts',
+                                '10_scr_scRNAseq_human'))
+from mtx_loader import read_10x
+from synthetic import write_10x
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark of mtx_loader.read_10x against sc.read_10x_mtx')
+    parser.add_argument('--path', help = '10X directory (synthetic directory if not given)')
+    parser.add_argument('--n-cells', type = int, default = 100000)
+    parser.add_argument('--n-genes', type = int, default = 20000)
+    parser.add_argument('--genes-per-cell', type = int, default = 300)
+    parser.add_argument('--threads', type = int, help = 'Number of threads of read_10x (all the cores by default)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        if args.path:
+            path = args.path
+        else:
+            path, duration = timed(write_10x, os.path.join(directory, 'synthetic_10X'), args.n_cells, args.n_genes,
+                                   args.genes_per_cell)
+            print(f'Synthetic 10X directory written in {duration:.1f} s')
+        cache_dir = os.path.join(directory, 'cache')
+
+        adata_ref, time_scanpy = timed(sc.read_10x_mtx, path)
+        adata, time_parse = timed(read_10x, path, cache_dir, args.threads)
+        adata_cached, time_cache = timed(read_10x, path, cache_dir, args.threads)
+
+        same = all((a.obs_names.equals(adata_ref.obs_names) and a.var.equals(adata_ref.var) and
+                    abs(a.X - adata_ref.X).sum() == 0) for a in [adata, adata_cached])
+        print(f'{adata.n_obs} cells, {adata.n_vars} genes, {adata.X.nnz} values')
+        print(f'sc.read_10x_mtx          : {time_scanpy:8.2f} s')
+        print(f'read_10x (parsing)       : {time_parse:8.2f} s  (x{time_scanpy / time_parse:.1f})')
+        print(f'read_10x (cache)         : {time_cache:8.2f} s  (x{time_scanpy / time_cache:.1f})')
+        print(f'Same objects             : {same}')
+    finally:
+        shutil.rmtree(directory)
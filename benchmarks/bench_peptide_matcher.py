@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Benchmark of the peptide matcher against blastp
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script runs peptide_matcher.py and makeblastdb + blastp (same command as
+# 02_immunopeptido_processing.sh) on the same peptides and proteins, reports the runtimes and compares the hits with
+# 0 mismatch. Without input files, a synthetic proteome and peptides sampled from it (with some mutated ones) are
+# generated. blastp is skipped if it is not installed.
+#
+# Usage :
+#   python bench_peptide_matcher.py --query ../Immunopeptidomics/results/seq_pep.fasta
+#                                   --db ../Immunopeptidomics/data/proteine_seq_targeted_cta.fasta --threads 6
+#   python bench_peptide_matcher.py --n-proteins 200 --n-peptides 50000
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Immunopeptidomics', 'scripts'))
+from peptide_matcher import read_fasta, match_peptides
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def synthetic_inputs(directory, n_proteins, n_peptides, seed = 0):
+    """
+    Write a random proteome and peptides, 80 % taken from the proteome (a quarter of them with one mutation)
+
+    Output:
+        Tuple (peptide fasta, protein fasta)
+    """
+    rng = random.Random(seed)
+    l_proteins = [''.join(rng.choices(AMINO_ACIDS, k = rng.randint(100, 1500))) for _ in range(n_proteins)]
+    path_db = os.path.join(directory, 'proteins.fasta')
+    with open(path_db, 'w') as f:
+        for i, seq in enumerate(l_proteins):
+            f.write(f'>sp|P{i:05d}|PROT{i}_HUMAN Protein {i} OS=Homo sapiens GN=GENE{i}\n')
+            f.writelines(seq[j:j + 60] + '\n' for j in range(0, len(seq), 60))
+
+    path_query = os.path.join(directory, 'peptides.fasta')
+    with open(path_query, 'w') as f:
+        for i in range(n_peptides):
+            length = rng.randint(8, 20)
+            if rng.random() < 0.8:
+                protein = rng.choice(l_proteins)
+                start = rng.randint(0, len(protein) - length)
+                peptide = list(protein[start:start + length])
+                if rng.random() < 0.25:
+                    peptide[rng.randrange(length)] = rng.choice(AMINO_ACIDS)
+                peptide = ''.join(peptide)
+            else:
+                peptide = ''.join(rng.choices(AMINO_ACIDS, k = length))
+            f.write(f'>{i}\n{peptide}\n')
+    return path_query, path_db
+
+
+def exact_hits(path):
+    """
+    Set of (peptide, protein, start) of the full-length hits with 0 mismatch of a 13-column blastp file
+    """
+    s_hits = set()
+    with open(path, 'r') as f:
+        for lig in f:
+            lig = lig.split('\t')
+            if lig[12].strip() == '0' and lig[1] == lig[8]:
+                s_hits.add((lig[0], lig[4], lig[6]))
+    return s_hits
+
+
+def run_blastp(path_query, path_db, out, directory, threads):
+    """
+    Run makeblastdb and blastp with the options of 02_immunopeptido_processing.sh
+
+    Output:
+        Runtime in seconds
+    """
+    start = time.perf_counter()
+    db = os.path.join(directory, 'db', 'targeted_cta_db')
+    subprocess.run(['makeblastdb', '-in', path_db, '-dbtype', 'prot', '-out', db], check = True, stdout = subprocess.DEVNULL)
+    subprocess.run(['blastp', '-query', path_query, '-db', db, '-outfmt',
+                    '6 qseqid qlen qstart qend sseqid slen sstart send length bitscore evalue pident mismatch',
+                    '-num_threads', str(threads), '-out', out], check = True)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compare peptide_matcher.py and blastp')
+    parser.add_argument('--query', help = 'Fasta file of the peptides (synthetic data if not given)')
+    parser.add_argument('--db', help = 'Fasta file of the proteins (synthetic data if not given)')
+    parser.add_argument('--n-proteins', type = int, default = 100, help = 'Number of synthetic proteins')
+    parser.add_argument('--n-peptides', type = int, default = 20000, help = 'Number of synthetic peptides')
+    parser.add_argument('--threads', type = int, default = 6, help = 'Number of processes/threads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path_query, path_db = args.query, args.db
+        if path_query is None or path_db is None:
+            path_query, path_db = synthetic_inputs(directory, args.n_proteins, args.n_peptides)
+
+        # Matcher
+        out_matcher = os.path.join(directory, 'results_matcher.tsv')
+        start = time.perf_counter()
+        match_peptides(read_fasta(path_query), read_fasta(path_db), out_matcher, max_mismatch = 1, threads = args.threads)
+        time_matcher = time.perf_counter() - start
+        s_matcher = exact_hits(out_matcher)
+        print(f'peptide_matcher: {time_matcher:.2f} s, {len(s_matcher)} full-length hits with 0 mismatch')
+
+        # blastp
+        if shutil.which('blastp') is None:
+            print('blastp: not installed, skipped')
+        else:
+            out_blastp = os.path.join(directory, 'results_blastp.tsv')
+            time_blastp = run_blastp(path_query, path_db, out_blastp, directory, args.threads)
+            s_blastp = exact_hits(out_blastp)
+            print(f'blastp: {time_blastp:.2f} s, {len(s_blastp)} full-length hits with 0 mismatch')
+            print(f'speedup: {time_blastp / time_matcher:.1f}x')
+            print(f'hits found by both: {len(s_matcher & s_blastp)}, matcher only: {len(s_matcher - s_blastp)}, '
+                  f'blastp only: {len(s_blastp - s_matcher)}')
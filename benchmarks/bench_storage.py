@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Benchmark of the storages of the scRNAseq objects (storage.py)
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script writes the same object with several storages (h5ad written by adata.write, h5ad with gzip
+# or lzf chunks, csr or csc layout, zarr) and reports the write time, the size on disk, and the read times of obs/var,
+# of a subset of genes (e.g. a list of CTA), of a subset of cells and of the whole object. The subsets read from each
+# storage are checked against the object. Without input file, a synthetic object is generated, 100000 cells by
+# default.
+#
+# Usage :
+#   python bench_storage.py --path ../Chondrosarcoma/results/sc_results/chondro/Objects/Objects_ori/object_1_Low_L07_ori.h5ad
+#   python bench_storage.py --n-cells 100000 --n-genes 20000 --genes-per-cell 300 --n-subset 50
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import anndata as ad
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Chondrosarcoma', 'scripts',
+                                '10_scr_scRNAseq_human'))
+from storage import read_object, read_obs_var, read_subset, write_object
+
+# Storages compared, None is the h5ad file written by adata.write
+D_STORAGES = {
+    'h5ad (adata.write)': None,
+    'h5ad csr gzip': {'compression': 'gzip', 'compression_opts': 4, 'chunk_size': 65536},
+    'h5ad csr lzf': {'compression': 'lzf', 'chunk_size': 65536},
+    'h5ad csc gzip': {'compression': 'gzip', 'compression_opts': 4, 'chunk_size': 65536, 'layout': 'csc'},
+    'zarr csr': {'format': 'zarr', 'chunk_size': 65536},
+    'zarr csc': {'format': 'zarr', 'chunk_size': 65536, 'layout': 'csc'},
+}
+
+
+def synthetic_object(n_cells, n_genes, genes_per_cell, seed = 0):
+    """
+    Random object with integer counts, the obs columns of create_anndata_object and gene symbols as var names
+    """
+    rng = np.random.default_rng(seed)
+    n_per_cell = np.clip(rng.poisson(genes_per_cell, n_cells), 1, n_genes)
+    indptr = np.concatenate([[0], np.cumsum(n_per_cell)])
+    indices = np.concatenate([np.sort(rng.choice(n_genes, n, replace = False)) for n in n_per_cell]).astype(np.int32)
+    data = rng.geometric(0.5, len(indices)).astype(np.float32)
+    X = sp.csr_matrix((data, indices, indptr), shape = (n_cells, n_genes))
+    obs = pd.DataFrame({'n_genes_by_counts': n_per_cell, 'total_counts': np.asarray(X.sum(axis = 1)).ravel(),
+                        'dataset': pd.Categorical(['synthetic'] * n_cells)},
+                       index = [f'CELL{i:08d}-1' for i in range(n_cells)])
+    var = pd.DataFrame({'gene_ids': [f'ENSG{i:011d}' for i in range(n_genes)]},
+                       index = [f'{"MT-" if i < 13 else "GENE"}{i}' for i in range(n_genes)])
+    return ad.AnnData(X = X, obs = obs, var = var)
+
+
+def size_on_disk(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, l_files in os.walk(path) for file in l_files)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark of the storages of storage.py')
+    parser.add_argument('--path', help = 'h5ad/zarr object (synthetic object if not given)')
+    parser.add_argument('--n-cells', type = int, default = 100000)
+    parser.add_argument('--n-genes', type = int, default = 20000)
+    parser.add_argument('--genes-per-cell', type = int, default = 300)
+    parser.add_argument('--n-subset', type = int, default = 50, help = 'Number of genes and of cells (x 100) read as subsets')
+    args = parser.parse_args()
+
+    if args.path:
+        adata = read_object(args.path)
+    else:
+        adata, duration = timed(synthetic_object, args.n_cells, args.n_genes, args.genes_per_cell)
+        print(f'Synthetic object generated in {duration:.1f} s')
+    adata.X = sp.csr_matrix(adata.X)
+    print(f'{adata.n_obs} cells, {adata.n_vars} genes, {adata.X.nnz} values')
+
+    # Random subsets of genes and cells (sorted positions)
+    rng = np.random.default_rng(1)
+    genes = np.sort(rng.choice(adata.n_vars, min(args.n_subset, adata.n_vars), replace = False))
+    cells = np.sort(rng.choice(adata.n_obs, min(args.n_subset * 100, adata.n_obs), replace = False))
+    X_genes = adata.X[:, genes].toarray()
+    X_cells = adata.X[cells].toarray()
+
+    directory = tempfile.mkdtemp()
+    try:
+        print(f'{"storage":<20}{"write (s)":>10}{"size (MB)":>11}{"obs/var (s)":>13}{f"{len(genes)} genes (s)":>15}'
+              f'{f"{len(cells)} cells (s)":>17}{"full (s)":>10}  same')
+        for label, storage in D_STORAGES.items():
+            path = os.path.join(directory, 'object' + ('.zarr' if (storage or {}).get('format') == 'zarr' else '.h5ad'))
+            _, time_write = timed(write_object, adata, path, storage)
+            size = size_on_disk(path) / 1024 ** 2
+            _, time_annotations = timed(read_obs_var, path)
+            subset_genes, time_genes = timed(read_subset, path, genes = genes)
+            subset_cells, time_cells = timed(read_subset, path, cells = cells)
+            full, time_full = timed(read_object, path)
+            same = (np.array_equal(subset_genes.X.toarray(), X_genes) and np.array_equal(subset_cells.X.toarray(), X_cells)
+                    and abs(full.X - adata.X).sum() == 0 and full.obs.equals(adata.obs))
+            print(f'{label:<20}{time_write:>10.2f}{size:>11.1f}{time_annotations:>13.3f}{time_genes:>15.3f}{time_cells:>17.3f}'
+                  f'{time_full:>10.2f}  {same}')
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python script : Benchmark suite of the Python stages on synthetic data
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This script generates synthetic inputs at a given scale (see synthetic.py and SCALES) in a temporary
+# copy of the repository tree, then runs and times each Python stage in its own process: 01, 03 and 05 of
+# Immunopeptidomics, create_anndata_object, apply_filters and merge of 10_scr_scRNAseq_human, and the pseudo-bulk TPM
+# script of appendix_scripts. The runtime and the peak memory (maximum resident set size of the process) of each stage
+# are saved in a JSON file with the scale, the versions of the packages and the git commit, and can be compared with a
+# previous run (--compare). The stages run without graphical interface: the filters are given to apply_filters and
+# tkinter can't be imported in the processes, so a prompt fails instead of waiting. The caches of the stages (Parquet
+# tables, mtx cache, GTF index) are removed before each repeat, the times are those of a first run.
+#
+# Usage :
+#   python run_suite.py --scale small
+#   python run_suite.py --scale medium --repeat 3 --out results/medium_baseline.json
+#   python run_suite.py --scale medium --compare results/medium_baseline.json --threshold 0.1
+#   python run_suite.py --scale small --stages create,filter,merge
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SCR_DIR = 'Chondrosarcoma/scripts/10_scr_scRNAseq_human'
+
+# Size of the synthetic data, large is of the order of the production data (IEDB export, GSE184118 datasets)
+SCALES = {
+    'small': {'n_proteins': 50, 'n_epitopes': 5_000, 'n_datasets': 2, 'n_cells': 2_000, 'n_genes': 5_000,
+              'genes_per_cell': 300, 'n_patients': 20},
+    'medium': {'n_proteins': 300, 'n_epitopes': 100_000, 'n_datasets': 3, 'n_cells': 10_000, 'n_genes': 20_000,
+               'genes_per_cell': 1_000, 'n_patients': 100},
+    'large': {'n_proteins': 1_000, 'n_epitopes': 1_500_000, 'n_datasets': 8, 'n_cells': 15_000, 'n_genes': 33_000,
+              'genes_per_cell': 2_000, 'n_patients': 100},
+}
+
+# Stages: name -> (directory of the command in the tree, command, caches removed before each repeat (glob patterns))
+STAGES = {
+    'peptides_table': ('Immunopeptidomics/scripts', ['01_immunopeptido_create_peptides_table.py'],
+                       ['Immunopeptidomics/results/db_tables/cache']),
+    'aligned_fasta': ('Immunopeptidomics/scripts', ['03_immunopeptido_fasta_aligned_pep.py'], []),
+    'analysis': ('Immunopeptidomics/scripts', ['05_immunopeptido_analysis.py'], ['Immunopeptidomics/results/cache']),
+    'create': (SCR_DIR, [os.path.join(BENCH_DIR, 'run_suite.py'), '--child', 'create'],
+               ['Chondrosarcoma/data/scrnaseq_data/.mtx_cache', 'Chondrosarcoma/results/sc_results/bench']),
+    'filter': (SCR_DIR, [os.path.join(BENCH_DIR, 'run_suite.py'), '--child', 'filter'],
+               ['Chondrosarcoma/results/sc_results/bench/Objects/Objects_filtered']),
+    'merge': (SCR_DIR, [os.path.join(BENCH_DIR, 'run_suite.py'), '--child', 'merge'],
+              ['Chondrosarcoma/results/sc_results/bench/Objects/Objects_merged']),
+    'pseudo_bulk': ('Chondrosarcoma/scripts/appendix_scripts', ['00_appendix_pseudo_bulk_compute_tpm.py'],
+                    ['Chondrosarcoma/data/Homo_sapiens.GRCh38.113.gtf.*']),
+}
+
+PACKAGES = ['numpy', 'pandas', 'scipy', 'pyarrow', 'anndata', 'scanpy', 'h5py']
+
+
+def build_tree(tree, scale, seed = 0):
+    """
+    Copy the scripts in a new tree with the layout of the repository and write the synthetic inputs of the stages
+
+    Output:
+        Dictionary with the sizes of the generated data
+    """
+    import synthetic
+
+    for directory in ['Immunopeptidomics/scripts', 'Chondrosarcoma/scripts/10_scr_scRNAseq_human',
+                      'Chondrosarcoma/scripts/appendix_scripts']:
+        shutil.copytree(os.path.join(REPO_DIR, directory), os.path.join(tree, directory),
+                        ignore = shutil.ignore_patterns('__pycache__', 'notebooks', '*.pdf', '*.Rmd'))
+    for directory in ['Immunopeptidomics/data', 'Chondrosarcoma/scripts/results', 'Chondrosarcoma/results/sc_results']:
+        os.makedirs(os.path.join(tree, directory), exist_ok = True)
+
+    # Immunopeptidomics: IEDB tables (01), peptides and hits of 02 (03), netMHC outputs and expression table (05)
+    ip_results = os.path.join(tree, 'Immunopeptidomics/results')
+    df_proteome = synthetic.proteome(os.path.join(tree, 'Immunopeptidomics/data/proteine_seq_targeted_cta.fasta'),
+                                     scale['n_proteins'], seed = seed)
+    df_epitopes = synthetic.epitope_sequences(df_proteome, scale['n_epitopes'], seed = seed)
+    synthetic.iedb_tables(os.path.join(ip_results, 'db_tables'), df_epitopes, seed = seed)
+    synthetic.peptide_files(ip_results, os.path.join(tree, 'Immunopeptidomics/data'), df_proteome, df_epitopes)
+    n_predictions = synthetic.netmhc_outputs(ip_results, df_epitopes, seed = seed)
+    synthetic.expression_table(os.path.join(tree, 'Chondrosarcoma/results/whole_gene_int_CTA_sign_imm_clean.tsv'),
+                               df_proteome['gene'], scale['n_patients'], seed = seed)
+
+    # scRNAseq: 10X directories of the datasets (Cell Ranger v2) and GTF file of their genes
+    for i in range(scale['n_datasets']):
+        synthetic.write_10x(os.path.join(tree, f'Chondrosarcoma/data/scrnaseq_data/{i + 1}_Bench_{i + 1}_10X'),
+                            scale['n_cells'], scale['n_genes'], scale['genes_per_cell'], legacy = True, seed = seed + i)
+    n_gtf_genes = synthetic.gtf(os.path.join(tree, 'Chondrosarcoma/data/Homo_sapiens.GRCh38.113.gtf'),
+                                synthetic.gene_symbols(scale['n_genes']), seed = seed)
+    return {'n_epitopes': len(df_epitopes), 'n_hits': int((df_epitopes['entry'] != '').sum()),
+            'n_predictions': n_predictions, 'n_values_10x': scale['n_datasets'] * scale['n_cells'] * scale['genes_per_cell'],
+            'n_gtf_genes': n_gtf_genes}
+
+
+def run_child(stage_name):
+    """
+    Run a stage of 10_scr_scRNAseq_human in this process (called with --child from the 10_scr_scRNAseq_human directory
+    of the tree), with the same calls as batch.py (the data are generated with --child build)
+    """
+    # No graphical interface: a prompt raises an ImportError instead of opening a window
+    sys.modules['tkinter'] = None
+    sys.path.insert(0, os.getcwd())
+    import matplotlib
+    matplotlib.use('Agg')
+    output_dir = '../../results/sc_results/bench'
+    input_dir = '../../data/scrnaseq_data'
+    if stage_name == 'create':
+        from create_anndata_object import create_anndata_object
+        from batch import prepare_processing_dir
+        prepare_processing_dir(output_dir)
+        for source in sorted(os.listdir(input_dir)):
+            if source.endswith('_10X'):
+                create_anndata_object(source, '10X', output_dir, input_dir)
+    elif stage_name == 'filter':
+        from apply_filters import apply_filters
+        for file in sorted(os.listdir(output_dir + '/Objects/Objects_ori')):
+            if file.endswith('.h5ad'):
+                apply_filters(file, output_dir, min_genes = 200, min_cells = 3, pct_mt = 10, save = True)
+    elif stage_name == 'merge':
+        from merge import merge
+        l_files = sorted(file for file in os.listdir(output_dir + '/Objects/Objects_filtered') if file.endswith('.h5ad'))
+        obj_name = merge(l_files, output_dir)
+        # Input of the pseudo-bulk script
+        pseudo_bulk_dir = '../../results/sc_results/chondro_pseudo_bulk/Objects/Objects_merged'
+        os.makedirs(pseudo_bulk_dir, exist_ok = True)
+        shutil.copy(f'{output_dir}/Objects/Objects_merged/{obj_name}', pseudo_bulk_dir + '/object_merged_1.h5ad')
+    else:
+        raise ValueError(f'Unknown stage {stage_name}')
+
+
+def measure(command, cwd):
+    """
+    Run a command and measure it
+
+    Output:
+        Tuple (return code, runtime in seconds, peak resident memory in MB or None where os.wait4 doesn't exist)
+    """
+    start = time.perf_counter()
+    with open(os.path.join(cwd, 'bench_stage.log'), 'w') as f:
+        process = subprocess.Popen(command, cwd = cwd, stdout = f, stderr = subprocess.STDOUT,
+                                   env = {**os.environ, 'MPLBACKEND': 'Agg'})
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kB on Linux and in bytes on macOS
+            peak = rusage.ru_maxrss / 1024 ** 2 if platform.system() == 'Darwin' else rusage.ru_maxrss / 1024
+        else:
+            process.wait()
+            peak = None
+    return process.returncode, time.perf_counter() - start, peak
+
+
+def environment():
+    """
+    Versions of Python and of the packages, machine and git commit of the run
+    """
+    d_versions = {}
+    for package in PACKAGES:
+        try:
+            d_versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            d_versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = REPO_DIR, capture_output = True, text = True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'packages': d_versions, 'commit': commit}
+
+
+def run_suite(scale_name, l_stages, repeat = 1, seed = 0, keep = None):
+    """
+    Generate the data of a scale and run the stages
+
+    Input:
+        scale_name (str): Key of SCALES
+        l_stages (list of str): Stages run, in the order of STAGES (a stage needs the outputs of the previous ones)
+        repeat (int): Number of runs of each stage
+        seed (int): Seed of the synthetic data
+        keep (str): Directory of the tree, kept after the run (temporary directory removed at the end if None)
+
+    Output:
+        Dictionary of the results (saved as JSON)
+    """
+    tree = keep or tempfile.mkdtemp(prefix = 'bench_suite_')
+    os.makedirs(tree, exist_ok = True)
+    d_results = {'scale': scale_name, 'parameters': SCALES[scale_name], 'seed': seed, 'repeat': repeat,
+                 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'environment': environment(), 'stages': {}}
+    try:
+        # The data are generated in another process, the memory of this process is the starting memory of the stages
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'run_suite.py'), '--child', 'build', '--keep', tree,
+                        '--scale', scale_name, '--seed', str(seed)], check = True)
+        with open(os.path.join(tree, 'bench_data.json'), 'r') as f:
+            d_results['data'] = json.load(f)
+        d_results['data']['seconds'] = round(time.perf_counter() - start, 2)
+        print(f'Synthetic data ({scale_name}) generated in {d_results["data"]["seconds"]:.1f} s in {tree}', flush = True)
+
+        for name in l_stages:
+            cwd, command, l_caches = STAGES[name]
+            l_seconds, l_peaks = [], []
+            for _ in range(repeat):
+                for cache in l_caches:
+                    for path in glob.glob(os.path.join(tree, cache)):
+                        shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+                returncode, seconds, peak = measure([sys.executable] + command, os.path.join(tree, cwd))
+                if returncode != 0:
+                    with open(os.path.join(tree, cwd, 'bench_stage.log'), 'r') as f:
+                        error = f.read()[-2000:]
+                    d_results['stages'][name] = {'status': 'failed', 'error': error}
+                    print(f'{name:<16}failed\n{error}', flush = True)
+                    break
+                l_seconds.append(round(seconds, 3))
+                l_peaks.append(round(peak, 1) if peak is not None else None)
+            else:
+                d_results['stages'][name] = {'status': 'done', 'seconds': l_seconds, 'min': min(l_seconds),
+                                             'median': round(statistics.median(l_seconds), 3),
+                                             'peak_rss_mb': max(l_peaks) if None not in l_peaks else None}
+                peak_text = f'{max(l_peaks):10.0f} MB' if None not in l_peaks else ''
+                print(f'{name:<16}{statistics.median(l_seconds):8.2f} s{peak_text}', flush = True)
+    finally:
+        if keep is None:
+            shutil.rmtree(tree, ignore_errors = True)
+    return d_results
+
+
+def compare(d_results, d_previous, threshold = 0.1):
+    """
+    Print the median runtime and the peak memory of each stage against a previous run
+
+    Output:
+        List of the stages slower than the previous run by more than threshold (fraction of the previous runtime)
+    """
+    if d_previous['scale'] != d_results['scale']:
+        print(f'Warning: scale {d_previous["scale"]} in the previous run, {d_results["scale"]} in this run')
+    print(f'\n{"stage":<16}{"before (s)":>11}{"after (s)":>11}{"ratio":>8}{"before (MB)":>13}{"after (MB)":>12}')
+    l_slower = []
+    for name, d_stage in d_results['stages'].items():
+        d_before = d_previous['stages'].get(name, {})
+        if d_stage['status'] != 'done' or d_before.get('status') != 'done':
+            print(f'{name:<16}{"not compared":>11}')
+            continue
+        ratio = d_stage['median'] / d_before['median']
+        flag = '  slower' if ratio > 1 + threshold else ''
+        if flag:
+            l_slower.append(name)
+        print(f'{name:<16}{d_before["median"]:>11.2f}{d_stage["median"]:>11.2f}{ratio:>8.2f}'
+              f'{d_before["peak_rss_mb"] or 0:>13.0f}{d_stage["peak_rss_mb"] or 0:>12.0f}{flag}')
+    return l_slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark suite of the Python stages on synthetic data')
+    parser.add_argument('--scale', default = 'small', choices = list(SCALES), help = 'Size of the synthetic data')
+    parser.add_argument('--stages', default = ','.join(STAGES), help = 'Comma-separated stages (in the order of the pipeline)')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'Number of runs of each stage')
+    parser.add_argument('--seed', type = int, default = 0, help = 'Seed of the synthetic data')
+    parser.add_argument('--out', help = 'JSON file of the results (results/suite_SCALE_DATE.json by default)')
+    parser.add_argument('--compare', help = 'JSON file of a previous run')
+    parser.add_argument('--threshold', type = float, default = 0.1, help = 'Slowdown reported as a regression (0.1 = 10 %%)')
+    parser.add_argument('--keep', help = 'Directory of the generated tree, kept after the run')
+    parser.add_argument('--child', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'build':
+        with open(os.path.join(args.keep, 'bench_data.json'), 'w') as f:
+            json.dump(build_tree(args.keep, SCALES[args.scale], args.seed), f)
+        sys.exit(0)
+    if args.child:
+        run_child(args.child)
+        sys.exit(0)
+
+    l_stages = [name for name in args.stages.split(',') if name]
+    unknown = set(l_stages) - set(STAGES)
+    if unknown:
+        sys.exit(f'Unknown stages: {", ".join(sorted(unknown))}, use {", ".join(STAGES)}')
+    l_stages = [name for name in STAGES if name in l_stages]
+
+    d_results = run_suite(args.scale, l_stages, args.repeat, args.seed, args.keep)
+    out = args.out or os.path.join(BENCH_DIR, 'results', f'suite_{args.scale}_{time.strftime("%Y%m%d_%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok = True)
+    with open(out, 'w') as f:
+        json.dump(d_results, f, indent = 1)
+    print(f'Results saved in {out}')
+
+    failed = any(d_stage['status'] != 'done' for d_stage in d_results['stages'].values())
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            l_slower = compare(d_results, json.load(f), args.threshold)
+        if l_slower:
+            print(f'Slower than the previous run: {", ".join(l_slower)}')
+            failed = True
+    sys.exit(1 if failed else 0)
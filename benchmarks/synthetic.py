@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# ----------------------------------------------------------------------------------------------------------------------
+# Python module : Synthetic data of the benchmarks
+# Author  : Léa ROGUE
+# Date    : 18-10-2026
+# Description : This module writes random inputs with the formats of the pipeline: IEDB tables extracted by
+# 00_immunopeptido_extract_data_iedb.sql, CTA proteome fasta (UniProt headers), peptide fasta with their hits of 02,
+# netMHC outputs, expression table of the chondrosarcoma patients, 10X directories (Cell Ranger v2 or v3) and a small
+# GTF file. A part of the peptides are taken from the proteome so the matching and the analysis have hits. All the
+# generators take a seed, the same arguments give the same files.
+# ----------------------------------------------------------------------------------------------------------------------
+
+# Import packages
+import gzip
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Immunopeptidomics', 'scripts'))
+from netmhc_io import format_line
+
+AMINO_ACIDS = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype = np.uint8)
+ALLELES = ['HLA-A0201', 'HLA-B0702', 'HLA-C0702']
+CANCER_NAMES = ['chondrosarcoma', 'melanoma', 'breast carcinoma', 'lymphoma', 'glioma']
+
+
+def random_sequences(rng, n, min_length, max_length):
+    """
+    Random amino acid sequences
+
+    Output:
+        List of str
+    """
+    lengths = rng.integers(min_length, max_length + 1, n)
+    residues = AMINO_ACIDS[rng.integers(0, len(AMINO_ACIDS), lengths.sum())].tobytes().decode()
+    ends = np.cumsum(lengths)
+    return [residues[end - length:end] for end, length in zip(ends, lengths)]
+
+
+def write_fasta(path, names, sequences, descriptions = None):
+    with open(path, 'w') as f:
+        for i, (name, sequence) in enumerate(zip(names, sequences)):
+            f.write(f'>{name}{" " + descriptions[i] if descriptions is not None else ""}\n{sequence}\n')
+
+
+def proteome(path, n_proteins, length = 400, seed = 0):
+    """
+    CTA proteome fasta with UniProt headers (sp|ACCESSION|ENTRY_HUMAN ... GN=GENE)
+
+    Output:
+        DataFrame with the columns entry (fasta record name), gene and sequence
+    """
+    rng = np.random.default_rng(seed)
+    genes = [f'CTAG{i}' for i in range(n_proteins)]
+    entries = [f'sp|Q{i:05d}|{gene}_HUMAN' for i, gene in enumerate(genes)]
+    sequences = random_sequences(rng, n_proteins, length // 2, length * 3 // 2)
+    write_fasta(path, entries, sequences, [f'Cancer/testis antigen OS=Homo sapiens OX=9606 GN={gene} PE=1 SV=1'
+                                           for gene in genes])
+    return pd.DataFrame({'entry': entries, 'gene': genes, 'sequence': sequences})
+
+
+def epitope_sequences(df_proteome, n_epitopes, fraction_proteome = 0.3, seed = 0):
+    """
+    Epitope sequences (8 to 15 residues), a fraction of them taken from the proteome
+
+    Output:
+        DataFrame with the columns id, sequence, entry (protein of the epitope, '' for random epitopes) and start
+    """
+    rng = np.random.default_rng(seed)
+    sequences = random_sequences(rng, n_epitopes, 8, 15)
+    entries = np.full(n_epitopes, '', dtype = object)
+    starts = np.zeros(n_epitopes, dtype = np.int64)
+    for i in np.flatnonzero(rng.random(n_epitopes) < fraction_proteome):
+        protein = rng.integers(len(df_proteome))
+        sequence = df_proteome['sequence'].iat[protein]
+        start = rng.integers(len(sequence) - len(sequences[i]))
+        sequences[i] = sequence[start:start + len(sequences[i])]
+        entries[i], starts[i] = df_proteome['entry'].iat[protein], start
+    return pd.DataFrame({'id': np.arange(1, n_epitopes + 1), 'sequence': sequences, 'entry': entries, 'start': starts})
+
+
+def iedb_tables(db_dir, df_epitopes, n_diseases = 500, seed = 0):
+    """
+    IEDB tables as written by 00_immunopeptido_extract_data_iedb.sql (TSV without header, NULL as \\N): disease (cancer
+    diseases only), epitope_object, object_seq, mhc_epitope (2 lines per epitope), t_cell (1/3 of the epitopes) and b_cell (1/10)
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(db_dir, exist_ok = True)
+    n = len(df_epitopes)
+    ids = df_epitopes['id'].to_numpy()
+
+    def write(table, d_columns):
+        pd.DataFrame(d_columns).to_csv(os.path.join(db_dir, f'{table}.tsv'), sep = '\t', header = False, index = False)
+
+    def diseases(size):
+        # 70 % of the disease ids are given, the others are NULL
+        values = rng.integers(1, n_diseases + 1, size).astype(str).astype(object)
+        values[rng.random(size) > 0.7] = '\\N'
+        return values
+
+    # Only the cancer diseases are extracted (1 disease id out of 3)
+    cancer_ids = np.arange(1, n_diseases + 1, 3)
+    write('disease', {'id': cancer_ids, 'name': [f'{CANCER_NAMES[i % len(CANCER_NAMES)]} {i}' for i in range(len(cancer_ids))]})
+    write('epitope_object', {'id': ids, 'object_id': ids + 10_000_000})
+    write('object_seq', {'object_id': ids + 10_000_000, 'sequence': df_epitopes['sequence']})
+    mhc_ids = np.repeat(ids, 2)
+    write('mhc_epitope', {'id': mhc_ids, 'disease': diseases(2 * n), 'mhc_type': 'I',
+                          'mhc_allele': rng.choice(['HLA-A*02:01', 'HLA-B*07:02', 'HLA-C*07:02'], 2 * n)})
+    t_ids = ids[rng.random(n) < 1 / 3]
+    write('t_cell', {'id': t_ids, 'mhc_type': 'I', 'mhc_allele': 'HLA-A*02:01', 'iv1': diseases(len(t_ids)),
+                     'iv2': diseases(len(t_ids)), 'adt': '\\N'})
+    b_ids = ids[rng.random(n) < 0.1]
+    write('b_cell', {'id': b_ids, 'mhc_type': '\\N', 'iv1': diseases(len(b_ids)), 'iv2': '\\N', 'adt': '\\N'})
+
+
+def peptide_files(results_dir, data_dir, df_proteome, df_epitopes):
+    """
+    Inputs of 03 and 05 written by 02: seq_pep.fasta, hits with 0 mismatch (blastp outfmt 6 columns of 02) and
+    entry_name_gene_name.tsv
+    """
+    os.makedirs(results_dir, exist_ok = True)
+    os.makedirs(data_dir, exist_ok = True)
+    write_fasta(os.path.join(results_dir, 'seq_pep.fasta'), df_epitopes['id'], df_epitopes['sequence'])
+    df = df_epitopes[df_epitopes['entry'] != '']
+    lengths = df['sequence'].str.len()
+    slen = df['entry'].map(df_proteome.set_index('entry')['sequence'].str.len())
+    pd.DataFrame({'qseqid': df['id'], 'qlen': lengths, 'qstart': 1, 'qend': lengths, 'sseqid': df['entry'], 'slen': slen,
+                  'sstart': df['start'] + 1, 'send': df['start'] + lengths, 'length': lengths, 'bitscore': 2.0 * lengths,
+                  'evalue': 0.001, 'pident': 100.0, 'mismatch': 0}).to_csv(
+        os.path.join(results_dir, 'selected_results_blastp_0_mismatch.tsv'), sep = '\t', header = False, index = False)
+    df_proteome[['entry', 'gene']].to_csv(os.path.join(data_dir, 'entry_name_gene_name.tsv'), sep = '\t', header = False,
+                                          index = False)
+
+
+def netmhc_outputs(results_dir, df_epitopes, alleles = ALLELES, seed = 0):
+    """
+    Strong and weak binders of netMHC 4.0 for the 9-mers of the epitopes with a hit
+    (netmhc_sb/res_netmhc_ALLELE_selected_blastp_sb.out and netmhc_wb/)
+
+    Output:
+        Number of prediction lines written
+    """
+    rng = np.random.default_rng(seed)
+    df = df_epitopes[df_epitopes['entry'] != '']
+    l_windows = [(pep_id, sequence[i:i + 9]) for pep_id, sequence in zip(df['id'], df['sequence'])
+                 for i in range(len(sequence) - 8)]
+    n_lines = 0
+    for binder, low, high in [('SB', 0.01, 0.5), ('WB', 0.5, 2.0)]:
+        os.makedirs(os.path.join(results_dir, f'netmhc_{binder.lower()}'), exist_ok = True)
+        for allele in alleles:
+            kept = rng.random(len(l_windows)) < 0.1
+            ranks = rng.uniform(low, high, len(l_windows))
+            with open(os.path.join(results_dir, f'netmhc_{binder.lower()}',
+                                   f'res_netmhc_{allele}_selected_blastp_{binder.lower()}.out'), 'w') as f:
+                for (pep_id, window), rank in zip([w for w, k in zip(l_windows, kept) if k], ranks[kept]):
+                    affinity = 50 * rank ** 2 + 5
+                    f.write(format_line(0, allele, window, window, window, str(pep_id), 1 - np.log(affinity) / np.log(50000),
+                                        affinity, rank, binder) + '\n')
+                    n_lines += 1
+    return n_lines
+
+
+def expression_table(path, genes, n_patients = 100, seed = 0):
+    """
+    Expression table of the patients (SYMBOL, 2 annotation columns and one column per patient), read by 05
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    df = pd.DataFrame(rng.lognormal(2, 1, (len(genes), n_patients)), columns = [f'P{i}' for i in range(n_patients)])
+    df.insert(0, 'SYMBOL', genes)
+    df.insert(1, 'ENTREZID', np.arange(len(genes)))
+    df.insert(2, 'GENENAME', 'cancer/testis antigen')
+    df.to_csv(path, sep = '\t', index = False)
+
+
+def gene_symbols(n_genes):
+    # 13 mitochondrial genes as in the human annotation
+    return [f'MT-{i}' if i < 13 else f'GENE{i}' for i in range(n_genes)]
+
+
+def write_10x(path, n_cells, n_genes, genes_per_cell, legacy = False, seed = 0):
+    """
+    Write a random 10X directory, integer counts with a few mitochondrial genes: matrix.mtx, genes.tsv and barcodes.tsv
+    (Cell Ranger v2, legacy) or matrix.mtx.gz, features.tsv.gz and barcodes.tsv.gz (v3)
+
+    Output:
+        Path of the 10X directory
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok = True)
+    opener = (lambda name: open(os.path.join(path, name), 'w')) if legacy else \
+        (lambda name: gzip.open(os.path.join(path, name + '.gz'), 'wt', compresslevel = 1))
+
+    # Number of genes of each cell, then genes (1-based, sorted per cell) and counts
+    n_per_cell = np.clip(rng.poisson(genes_per_cell, n_cells), 1, n_genes)
+    cells = np.repeat(np.arange(1, n_cells + 1), n_per_cell)
+    genes = np.concatenate([np.sort(rng.choice(n_genes, n, replace = False)) for n in n_per_cell]) + 1
+    counts = rng.geometric(0.5, len(genes))
+    with opener('matrix.mtx') as f:
+        f.write('%%MatrixMarket matrix coordinate integer general\n%metadata_json: {}\n')
+        f.write(f'{n_genes} {n_cells} {len(genes)}\n')
+        pd.DataFrame({'gene': genes, 'cell': cells, 'count': counts}).to_csv(f, sep = ' ', header = False, index = False)
+    with opener('genes.tsv' if legacy else 'features.tsv') as f:
+        for i, symbol in enumerate(gene_symbols(n_genes)):
+            f.write(f'ENSG{i:011d}\t{symbol}' + ('\n' if legacy else '\tGene Expression\n'))
+    with opener('barcodes.tsv') as f:
+        for i in range(n_cells):
+            f.write(f'CELL{i:08d}-1\n')
+    return path
+
+
+def gtf(path, genes, fraction = 0.9, seed = 0):
+    """
+    GTF file with a gene, a transcript and 2 to 6 exons for a fraction of the genes
+
+    Output:
+        Number of genes written
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    kept = [gene for gene in genes if rng.random() < fraction]
+    position = 1000
+    with open(path, 'w') as f:
+        f.write('#!genome-build GRCh38.p14\n')
+        for i, gene in enumerate(kept):
+            attributes = f'gene_id "ENSG{i:011d}"; gene_name "{gene}";'
+            n_exons = rng.integers(2, 7)
+            starts = position + np.sort(rng.choice(20000, n_exons, replace = False))
+            ends = starts + rng.integers(50, 400, n_exons)
+            chrom = str(i % 22 + 1)
+            f.write(f'{chrom}\tensembl\tgene\t{starts[0]}\t{ends.max()}\t.\t+\t.\t{attributes}\n')
+            f.write(f'{chrom}\tensembl\ttranscript\t{starts[0]}\t{ends.max()}\t.\t+\t.\t{attributes} transcript_id "T{i}";\n')
+            for start, end in zip(starts, ends):
+                f.write(f'{chrom}\tensembl\texon\t{start}\t{end}\t.\t+\t.\t{attributes} transcript_id "T{i}";\n')
+            position = ends.max() + 1000
+    return len(kept)